@@ -0,0 +1,220 @@
+# buynlarge/metrics.py
+"""
+Métricas en memoria en formato de texto de Prometheus.
+
+Los histogramas, contadores y gauges se registran en un `MetricsRegistry`
+del proceso y `metrics_view` los publica en /metrics. Cada proceso del servidor (por
+ejemplo, cada worker de gunicorn) tiene su propio registro; Prometheus debe
+consultar cada proceso o agregarlos por instancia.
+
+`RequestTimings` mide las etapas de una petición con `stage(nombre)`: cada
+etapa se observa en el histograma que se le indique y se resume en la
+cabecera Server-Timing de la respuesta.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotFound
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites en segundos: desde una consulta al snapshot hasta una respuesta lenta de OpenAI
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas, seguro entre hilos"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._lock = threading.Lock()
+        # etiquetas -> [conteos por límite (no acumulados), suma, cantidad]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels):
+        """(suma, cantidad) de una serie; (0, 0) si no tiene observaciones"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = [f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = ','.join(labels + [f'le="{format_value(bound)}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            suffix = f"{{{','.join(labels)}}}" if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {format_value(total)}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Contador (o, con `set`, gauge) con etiquetas, seguro entre hilos"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self.key(labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            labels = ','.join(f'{name}="{escape_label(label)}"' for name, label in zip(self.labelnames, key))
+            lines.append(f"{self.name}{{{labels}}} {format_value(value)}" if labels else f'{self.name} {format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Gauge(Counter):
+    """Valor que sube y baja (estado de un circuito, conexiones abiertas)"""
+
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self.key(labels)] = value
+
+
+class MetricsRegistry:
+    """Métricas publicadas por /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric_class, name, *args, **kwargs):
+        """Devuelve la métrica `name`, creándola la primera vez"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram, name, documentation, labelnames, buckets)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge, name, documentation, labelnames)
+
+    def reset(self):
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in list(self._metrics.values())) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestTimings:
+    """
+    Etapas de una petición. `stage` mide el bloque y lo observa en `histogram`
+    con la etiqueta `stage` más `labels`; `server_timing` arma la cabecera
+    Server-Timing en el orden en que se ejecutaron las etapas.
+    """
+
+    def __init__(self, histogram=None, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.durations = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, duration):
+        # Una etapa repetida (por ejemplo, dos guardados) acumula su duración
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+        if self.histogram is not None:
+            self.histogram.observe(duration, stage=name, **self.labels)
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total=None):
+        entries = [f'{name};dur={duration * 1000:.1f}' for name, duration in self.durations.items()]
+        if total is not None:
+            entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def metrics_view(request):
+    """
+    Publica las métricas del proceso en formato de texto de Prometheus. Si
+    METRICS_ALLOWED_IPS no está vacía, sólo responde a esas direcciones.
+    """
+    if not settings.METRICS_ENABLED:
+        return HttpResponseNotFound()
+    if settings.METRICS_ALLOWED_IPS and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseNotFound()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,154 @@
+# buynlarge/queries.py
+"""
+Instrumentación de las consultas SQL de cada petición.
+
+Un wrapper de ejecución instalado en todas las conexiones registra las
+consultas en los `QueryStats` activos del contexto (contextvars), de modo que
+también se cuentan las consultas que la vista asíncrona del chatbot ejecuta en
+el pool de hilos de la base de datos si éste copia el contexto.
+`QueryCountMiddleware` publica el resultado en cabeceras y en el log; las
+pruebas usan `track_queries` para verificar presupuestos de consultas.
+"""
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# QueryStats activos: los bloques anidados (una prueba y el middleware) registran todas las consultas
+_active_stats = contextvars.ContextVar('query_stats', default=())
+
+# Normalización de SQL para agrupar consultas con la misma forma
+_IN_LIST_RE = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+def query_shape(sql):
+    """Forma de una consulta sin valores literales ni listas de parámetros"""
+    shape = _IN_LIST_RE.sub('IN (...)', sql)
+    shape = _STRING_RE.sub('?', shape)
+    return _NUMBER_RE.sub('?', shape)
+
+
+class QueryStats:
+    """Consultas ejecutadas en un contexto: cantidad, tiempo total y formas repetidas"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[query_shape(sql)] += 1
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    def duplicates(self):
+        """[(forma, veces)] de las consultas que se repitieron, de la más a la menos frecuente"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > 1]
+
+    def summary(self):
+        return f"{self.count} consultas, {self.duration_ms:.1f} ms en la base de datos, {len(self.duplicates())} repetidas"
+
+
+def query_wrapper(execute, sql, params, many, context):
+    active = _active_stats.get()
+    if not active:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for stats in active:
+            stats.record(sql, duration)
+
+
+def install_query_wrapper(connection):
+    if query_wrapper not in connection.execute_wrappers:
+        # Primero en la lista, para medir también el tiempo de los demás wrappers
+        connection.execute_wrappers.insert(0, query_wrapper)
+
+
+@receiver(connection_created)
+def install_on_new_connection(sender, connection, **kwargs):
+    install_query_wrapper(connection)
+
+
+@contextmanager
+def track_queries():
+    """Registra en un QueryStats nuevo las consultas ejecutadas dentro del bloque"""
+    for connection in connections.all():
+        install_query_wrapper(connection)
+    stats = QueryStats()
+    token = _active_stats.set(_active_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+class QueryCountMiddleware:
+    """
+    Registra las consultas de cada petición hasta que la vista devuelve la
+    respuesta (en los streams no se cuentan las del cuerpo) y las publica en
+    el log y, si QUERY_INSTRUMENTATION_HEADERS está activo, en las cabeceras
+    X-DB-Query-Count, X-DB-Query-Time y X-DB-Duplicate-Queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.QUERY_INSTRUMENTATION_ENABLED
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        with track_queries() as stats:
+            response = self.get_response(request)
+        self.report(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        with track_queries() as stats:
+            response = await self.get_response(request)
+        self.report(request, response, stats)
+        return response
+
+    def report(self, request, response, stats):
+        duplicates = stats.duplicates()
+        if settings.QUERY_INSTRUMENTATION_HEADERS:
+            response['X-DB-Query-Count'] = str(stats.count)
+            response['X-DB-Query-Time'] = f'{stats.duration_ms:.1f}ms'
+            response['X-DB-Duplicate-Queries'] = str(sum(count - 1 for _, count in duplicates))
+
+        message = f"{request.method} {request.path}: {stats.summary()}"
+        threshold = settings.QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD
+        if duplicates and duplicates[0][1] >= threshold:
+            # Una misma consulta repetida muchas veces suele indicar un problema N+1
+            shape, count = duplicates[0]
+            logger.warning(f"{message}; repetida {count} veces: {shape}")
+        else:
+            logger.info(message)
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "buynlarge.queries.QueryCountMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # Add this line
@@ -120,6 +121,103 @@ USE_I18N = True
 USE_TZ = True
 
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+# Permite apuntar a un servidor compatible con OpenAI (por ejemplo `python manage.py fake_openai`)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+
+# Transporte hacia OpenAI: pool de conexiones y plazos en segundos
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', '100'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20'))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', '5'))
+OPENAI_READ_TIMEOUT = float(os.environ.get('OPENAI_READ_TIMEOUT', '30'))
+OPENAI_WRITE_TIMEOUT = float(os.environ.get('OPENAI_WRITE_TIMEOUT', '10'))
+OPENAI_POOL_TIMEOUT = float(os.environ.get('OPENAI_POOL_TIMEOUT', '5'))
+# Plazo total de una llamada, incluidos los reintentos
+OPENAI_DEADLINE = float(os.environ.get('OPENAI_DEADLINE', '45'))
+# Reintentos con backoff exponencial y jitter, limitados por un presupuesto global por ventana
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '2'))
+OPENAI_RETRY_BACKOFF = float(os.environ.get('OPENAI_RETRY_BACKOFF', '0.5'))
+OPENAI_RETRY_BACKOFF_MAX = float(os.environ.get('OPENAI_RETRY_BACKOFF_MAX', '8'))
+OPENAI_RETRY_BUDGET_RATIO = float(os.environ.get('OPENAI_RETRY_BUDGET_RATIO', '0.1'))
+OPENAI_RETRY_BUDGET_MIN_RETRIES = int(os.environ.get('OPENAI_RETRY_BUDGET_MIN_RETRIES', '3'))
+OPENAI_RETRY_BUDGET_WINDOW = float(os.environ.get('OPENAI_RETRY_BUDGET_WINDOW', '10'))
+# Circuit breaker: fallos seguidos para abrirlo y segundos hasta la llamada de prueba
+OPENAI_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('OPENAI_BREAKER_FAILURE_THRESHOLD', '5'))
+OPENAI_BREAKER_RESET_TIMEOUT = float(os.environ.get('OPENAI_BREAKER_RESET_TIMEOUT', '30'))
+
+# Cache de respuestas del chatbot: 'locmem' (memoria del proceso), 'django' (framework de cache) o 'none'
+CHATBOT_RESPONSE_CACHE_BACKEND = os.environ.get('CHATBOT_RESPONSE_CACHE_BACKEND', 'locmem')
+CHATBOT_RESPONSE_CACHE_ALIAS = os.environ.get('CHATBOT_RESPONSE_CACHE_ALIAS', 'default')
+CHATBOT_RESPONSE_CACHE_TTL = int(os.environ.get('CHATBOT_RESPONSE_CACHE_TTL', '600'))
+CHATBOT_RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('CHATBOT_RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+
+# Cache semántico: reutiliza respuestas de preguntas parecidas (similitud coseno sobre n-gramas de caracteres)
+CHATBOT_SEMANTIC_CACHE_ENABLED = os.environ.get('CHATBOT_SEMANTIC_CACHE_ENABLED', 'False') == 'True'
+CHATBOT_SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('CHATBOT_SEMANTIC_CACHE_THRESHOLD', '0.85'))
+CHATBOT_SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('CHATBOT_SEMANTIC_CACHE_MAX_ENTRIES', '10000'))
+CHATBOT_SEMANTIC_CACHE_DIMENSIONS = int(os.environ.get('CHATBOT_SEMANTIC_CACHE_DIMENSIONS', '512'))
+
+# Memoria de las conversaciones: mensajes recientes enviados completos y mensajes antiguos que disparan un resumen
+CHATBOT_MEMORY_RECENT_MESSAGES = int(os.environ.get('CHATBOT_MEMORY_RECENT_MESSAGES', '8'))
+CHATBOT_MEMORY_SUMMARY_BATCH = int(os.environ.get('CHATBOT_MEMORY_SUMMARY_BATCH', '8'))
+CHATBOT_MEMORY_SUMMARY_MAX_TOKENS = int(os.environ.get('CHATBOT_MEMORY_SUMMARY_MAX_TOKENS', '200'))
+
+# Hilos (y por lo tanto conexiones) para el acceso a la base de datos desde la vista asíncrona del chatbot
+CHATBOT_DB_POOL_SIZE = int(os.environ.get('CHATBOT_DB_POOL_SIZE', '10'))
+
+# Agrupación de primeros mensajes idénticos en curso: una sola llamada a OpenAI para todos
+CHATBOT_COALESCING_ENABLED = os.environ.get('CHATBOT_COALESCING_ENABLED', 'True') == 'True'
+# Segundos máximos que una petición espera la respuesta de otra idéntica
+CHATBOT_COALESCING_TIMEOUT = float(os.environ.get('CHATBOT_COALESCING_TIMEOUT', '60'))
+
+# Escritura diferida de los mensajes: se encolan y un hilo los guarda con bulk_create en lotes
+CHATBOT_MESSAGE_WRITE_BEHIND = os.environ.get('CHATBOT_MESSAGE_WRITE_BEHIND', 'False') == 'True'
+CHATBOT_MESSAGE_WRITE_BATCH_SIZE = int(os.environ.get('CHATBOT_MESSAGE_WRITE_BATCH_SIZE', '200'))
+# Segundos máximos que un mensaje espera en la cola
+CHATBOT_MESSAGE_WRITE_INTERVAL = float(os.environ.get('CHATBOT_MESSAGE_WRITE_INTERVAL', '0.5'))
+# Con más mensajes pendientes se vuelve a guardar de forma síncrona
+CHATBOT_MESSAGE_WRITE_MAX_PENDING = int(os.environ.get('CHATBOT_MESSAGE_WRITE_MAX_PENDING', '10000'))
+
+# Presupuesto de tokens para el contexto del inventario que se envía a OpenAI
+CHATBOT_CONTEXT_TOKEN_BUDGET = int(os.environ.get('CHATBOT_CONTEXT_TOKEN_BUDGET', '2000'))
+
+# Instrumentación de las consultas SQL de cada petición (log y, opcionalmente, cabeceras X-DB-*)
+QUERY_INSTRUMENTATION_ENABLED = os.environ.get('QUERY_INSTRUMENTATION_ENABLED', 'True') == 'True'
+QUERY_INSTRUMENTATION_HEADERS = os.environ.get('QUERY_INSTRUMENTATION_HEADERS', str(DEBUG)) == 'True'
+# Repeticiones de una misma consulta a partir de las cuales se registra una advertencia
+QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD = int(os.environ.get('QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD', '5'))
+
+# Métricas en formato de Prometheus en /metrics y cabecera Server-Timing con las etapas del chatbot.
+# /metrics sólo se publica en desarrollo salvo que se active, y puede limitarse a las IPs de Prometheus
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', str(DEBUG)) == 'True'
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+CHATBOT_SERVER_TIMING = os.environ.get('CHATBOT_SERVER_TIMING', 'True') == 'True'
+
+# Segundos durante los que un proceso reutiliza la versión del catálogo leída de la base de datos
+# (demora máxima con la que el chatbot ve un cambio hecho en otro proceso)
+CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', '1'))
+
+# Paginación por cursor de los endpoints del catálogo (products, categories, brands)
+CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', '20'))
+CATALOG_MAX_PAGE_SIZE = int(os.environ.get('CATALOG_MAX_PAGE_SIZE', '100'))
+
+# Facetas del catálogo: límites de los rangos de precio, umbral de stock bajo y vida del cache de los conteos
+CATALOG_PRICE_BUCKETS = [int(bound) for bound in os.environ.get('CATALOG_PRICE_BUCKETS', '0,100,500,1000,2000').split(',')]
+CATALOG_LOW_STOCK_THRESHOLD = int(os.environ.get('CATALOG_LOW_STOCK_THRESHOLD', '5'))
+CATALOG_FACETS_CACHE_TTL = int(os.environ.get('CATALOG_FACETS_CACHE_TTL', '300'))
+
+# Versiones redimensionadas (miniatura, tarjeta, completa; JPEG y WebP) de las imágenes al guardar un producto
+PRODUCT_IMAGE_RENDITIONS_ON_SAVE = os.environ.get('PRODUCT_IMAGE_RENDITIONS_ON_SAVE', 'True') == 'True'
+
+# Cache
+# Con varios procesos conviene un backend compartido (por ejemplo
+# django.core.cache.backends.redis.RedisCache) para no repetir el trabajo
+# cacheado en cada uno; la versión del catálogo no depende de él.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -0,0 +1,77 @@
+# buynlarge/testing.py
+"""
+Utilidades compartidas por las pruebas de las aplicaciones.
+"""
+import re
+import unittest
+from contextlib import contextmanager
+
+from django.db import connections
+
+from .queries import track_queries
+
+# Patrones de los planes de ejecución que indican un recorrido completo de la tabla
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (\w+)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+def full_table_scans(queryset, tables):
+    """
+    Ejecuta EXPLAIN sobre la consulta y devuelve las tablas de `tables` que el
+    plan recorre por completo. Lanza SkipTest en motores sin soporte.
+    """
+    vendor = connections[queryset.db].vendor
+    pattern = FULL_SCAN_PATTERNS.get(vendor)
+    if pattern is None:
+        raise unittest.SkipTest(f"Verificación de planes no soportada en {vendor}")
+    plan = queryset.explain()
+    return sorted({table for table in pattern.findall(plan) if table in tables}), plan
+
+
+class QueryPlanMixin:
+    """
+    Aserciones sobre planes de ejecución para TestCase.
+
+    Las tablas vigiladas son las que crecen con el uso; recorrer por completo
+    tablas pequeñas como categorías o marcas es aceptable.
+    """
+
+    watched_tables = ()
+
+    @classmethod
+    def analyze_database(cls, using='default'):
+        """Actualiza las estadísticas del planificador tras sembrar los datos"""
+        with connections[using].cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoFullTableScan(self, queryset, label=None):
+        scanned, plan = full_table_scans(queryset, self.watched_tables)
+        if scanned:
+            self.fail(
+                f"{label or 'La consulta'} recorre por completo {', '.join(scanned)}:\n"
+                f"{queryset.query}\n\nPlan:\n{plan}"
+            )
+
+
+class QueryBudgetMixin:
+    """
+    Presupuesto de consultas para TestCase: falla si el bloque ejecuta más
+    consultas de las declaradas y muestra las que se repitieron.
+
+        with self.assertQueryBudget(2, 'listado de productos'):
+            self.client.get('/api/products/products/')
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, label=None):
+        with track_queries() as stats:
+            yield stats
+        if stats.count > budget:
+            repeated = '\n'.join(f"  {count}x {shape}" for shape, count in stats.duplicates()) or '  (ninguna)'
+            self.fail(
+                f"{label or 'El bloque'} ejecutó {stats.count} consultas; el presupuesto es {budget}.\n"
+                f"Consultas repetidas:\n{repeated}\n\nTodas:\n"
+                + '\n'.join(f"  {count}x {shape}" for shape, count in stats.shapes.most_common())
+            )
@@ -0,0 +1,12 @@
+# buynlarge/text.py
+"""
+Normalización de texto compartida por la búsqueda del catálogo y el chatbot,
+para que ambos comparen "Teléfono" y "telefono" de la misma forma.
+"""
+import unicodedata
+
+
+def fold_text(text):
+    """Convierte a minúsculas y elimina los acentos ("Teléfono" -> "telefono")"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
@@ -20,10 +20,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from buynlarge.metrics import metrics_view
+
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include([
         path('products/', include('products.urls')),
         path('chatbot/', include('chatbot.urls')),
@@ -0,0 +1,174 @@
+# chatbot/benchmarks.py
+"""
+Conversaciones sintéticas y benchmark del contexto del chatbot.
+
+Las conversaciones son deterministas para una semilla dada: el número de
+turnos por conversación sigue una distribución exponencial (la mayoría son
+cortas y unas pocas muy largas, que son las que ejercitan la memoria de las
+conversaciones).
+
+`benchmark_context` mide `get_relevant_context` con un conjunto fijo de
+consultas que cubre cada rama de intención (categorías, categoría, marca,
+producto, precio, stock) y `compare_results` compara una ejecución con otra
+guardada como línea base.
+"""
+import json
+import statistics
+import time
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from buynlarge.queries import track_queries
+from products.catalog import get_catalog_snapshot
+from .context import ContextCompactor
+from .intents import get_intent_matcher
+from .models import Conversation, Message
+
+SESSION_PREFIX = 'synthetic-'
+
+QUESTIONS = [
+    '¿Cuál es el precio del {product}?',
+    'cuanto cuesta el {product}',
+    '¿Tienen {product} disponible?',
+    'Quiero comparar el {product} con otros modelos',
+    '¿Qué especificaciones tiene el {product}?',
+    'recomiéndame algo parecido al {product}',
+    '¿Qué {category} me recomiendas para trabajar?',
+    'Busco {category} de menos de {price} dólares',
+]
+ANSWERS = [
+    'El {product} cuesta ${price} y tenemos unidades disponibles.',
+    'El {product} tiene buenas especificaciones para su precio. ¿Quieres que lo compare con otro modelo?',
+    'Te recomiendo el {product}; es de lo más vendido en {category}.',
+    'En este momento el {product} está agotado, pero hay alternativas similares.',
+]
+CATEGORIES = ['laptops', 'teléfonos', 'tablets', 'auriculares', 'monitores', 'consolas']
+
+# Turnos (pregunta y respuesta) máximos por conversación
+MAX_TURNS = 100
+
+
+def generate_conversations(count, rng, product_names, turns=4, batch_size=5000, using='default', progress=None):
+    """
+    Crea `count` conversaciones anónimas con un promedio de `turns` turnos
+    sobre los productos de `product_names`, en lotes de `batch_size`
+    conversaciones por transacción. Devuelve (conversaciones, mensajes).
+    """
+    product_names = list(product_names) or ['producto']
+    created = messages_created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        with transaction.atomic(using=using):
+            conversations = Conversation.objects.using(using).bulk_create(
+                Conversation(session_id=f'{SESSION_PREFIX}{uuid.UUID(int=rng.getrandbits(128))}')
+                for _ in range(size)
+            )
+            messages = []
+            for conversation in conversations:
+                for _ in range(min(MAX_TURNS, 1 + int(rng.expovariate(1 / max(turns - 1, 1e-9))))):
+                    values = {
+                        'product': rng.choice(product_names),
+                        'category': rng.choice(CATEGORIES),
+                        'price': rng.choice([100, 300, 500, 1000, 2000]),
+                    }
+                    messages.append(Message(conversation=conversation, sender='user',
+                                            content=rng.choice(QUESTIONS).format(**values)))
+                    messages.append(Message(conversation=conversation, sender='bot',
+                                            content=rng.choice(ANSWERS).format(**values)))
+            Message.objects.using(using).bulk_create(messages, batch_size=batch_size)
+        created += size
+        messages_created += len(messages)
+        if progress:
+            progress(created)
+    return created, messages_created
+
+
+# (caso, mensaje, intenciones que debe detectar); {product} se reemplaza por un producto del catálogo
+CONTEXT_CASES = [
+    ('categorias', '¿Qué categorías de productos tienen?', {'category_query'}),
+    ('categoria', 'Muéstrame laptops para la oficina', {'categories'}),
+    ('marca', 'Quiero ver todo lo de Samsung', {'brand_ids'}),
+    ('producto', '¿Qué especificaciones tiene el {product}?', {'product_ids'}),
+    ('precio', '¿Qué rango de precios manejan?', {'price'}),
+    ('stock', '¿Cuál es la disponibilidad del inventario?', {'stock'}),
+    ('combinada', '¿Hay teléfonos Samsung en stock y a qué precio?', {'categories', 'brand_ids', 'price', 'stock'}),
+    ('sin_intencion', 'Hola, buenas tardes', set()),
+]
+
+INTENT_FIELDS = ('category_query', 'categories', 'brand_ids', 'product_ids', 'price', 'stock')
+
+
+def detected_intents(intents):
+    return sorted(field for field in INTENT_FIELDS if getattr(intents, field))
+
+
+def json_size(value):
+    return len(json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8'))
+
+
+def benchmark_context(view, product_name, repeat=20):
+    """
+    Mide cada caso de CONTEXT_CASES con el snapshot del catálogo ya construido
+    y, aparte, la construcción del snapshot (caso `snapshot`, la única que
+    consulta la base de datos). Devuelve una fila por caso con latencias en
+    ms, consultas, tamaño del contexto en bytes (JSON completo y compactado
+    para el prompt) y las intenciones detectadas.
+    """
+    start = time.perf_counter()
+    with track_queries() as stats:
+        catalog = get_catalog_snapshot()
+        get_intent_matcher(catalog)
+    elapsed = (time.perf_counter() - start) * 1000
+    results = [{
+        'case': 'snapshot', 'p50_ms': round(elapsed, 3), 'min_ms': round(elapsed, 3), 'max_ms': round(elapsed, 3),
+        'queries': stats.count, 'products': len(catalog.products),
+    }]
+
+    for case, template, expected in CONTEXT_CASES:
+        message = template.format(product=product_name)
+        latencies = []
+        queries = 0
+        for _ in range(repeat):
+            with track_queries() as stats:
+                start = time.perf_counter()
+                context = view.get_relevant_context(message)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, stats.count)
+        intents = get_intent_matcher(catalog).match(message)
+        results.append({
+            'case': case,
+            'message': message,
+            'intents': detected_intents(intents),
+            'expected_intents': sorted(expected),
+            'p50_ms': round(statistics.median(latencies), 3),
+            'min_ms': round(min(latencies), 3),
+            'max_ms': round(max(latencies), 3),
+            'queries': queries,
+            'context_bytes': json_size(context),
+            'prompt_bytes': len(ContextCompactor().compact(context, intents, catalog).encode('utf-8')),
+        })
+    return results
+
+
+def compare_results(results, baseline, tolerance=1.25):
+    """
+    Regresiones de `results` frente a `baseline` (mismo formato, filas con
+    `size` y `case`): latencia p50 mayor que tolerance veces la base, más
+    consultas o un contexto compactado más grande. Devuelve [mensaje].
+    """
+    previous = {(row['size'], row['case']): row for row in baseline}
+    regressions = []
+    for row in results:
+        base = previous.get((row['size'], row['case']))
+        if base is None:
+            continue
+        label = f"{row['size']} productos / {row['case']}"
+        if row['p50_ms'] > base['p50_ms'] * tolerance:
+            regressions.append(f"{label}: p50 {row['p50_ms']:.2f} ms (base {base['p50_ms']:.2f} ms)")
+        if row['queries'] > base['queries']:
+            regressions.append(f"{label}: {row['queries']} consultas (base {base['queries']})")
+        if row.get('prompt_bytes', 0) > base.get('prompt_bytes', 0) * tolerance:
+            regressions.append(f"{label}: contexto de {row['prompt_bytes']} bytes (base {base['prompt_bytes']})")
+    return regressions
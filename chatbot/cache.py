@@ -0,0 +1,146 @@
+# chatbot/cache.py
+"""
+Cache de respuestas del chatbot por coincidencia exacta.
+
+La clave combina el mensaje normalizado, las intenciones detectadas y la
+versión del catálogo, de modo que cualquier cambio de precio o stock invalida
+las respuestas guardadas. Sólo se usa cuando el historial de la conversación
+no influye en la respuesta (primer turno o mensaje autocontenido).
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from buynlarge.metrics import registry
+from buynlarge.text import fold_text
+
+LOOKUPS = registry.counter(
+    'chatbot_response_cache_lookups_total', 'Consultas al cache exacto de respuestas por resultado (hit, miss)',
+    ('result',)
+)
+
+# Palabras que hacen referencia a turnos anteriores ("¿y ese cuánto cuesta?").
+# Se comparan sin quitar acentos para no confundir "esta" con "está".
+CONTEXT_DEPENDENT_WORDS = {
+    'ese', 'esa', 'eso', 'esos', 'esas', 'este', 'esta', 'esto', 'estos', 'estas',
+    'aquel', 'aquella', 'aquello', 'anterior', 'anteriores', 'mismo', 'misma',
+    'también', 'tambien', 'otro', 'otra', 'otros', 'otras',
+}
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize_message(message):
+    """Minúsculas, sin acentos, sin signos de puntuación y con espacios simples"""
+    return ' '.join(_WORD_RE.findall(fold_text(message)))
+
+
+def is_self_contained(message, intents):
+    """
+    Un mensaje es autocontenido si menciona algo concreto del catálogo y no hace
+    referencia a turnos anteriores, por lo que el historial no cambia la respuesta
+    """
+    if not intents:
+        return False
+    return not CONTEXT_DEPENDENT_WORDS.intersection(_WORD_RE.findall(message.lower()))
+
+
+class LocalMemoryBackend:
+    """Backend en memoria del proceso con expiración por TTL y desalojo LRU"""
+
+    def __init__(self, max_entries=1000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, self.clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """
+    Backend sobre el framework de cache de Django, compartido entre workers.
+    El desalojo depende del backend configurado (MAX_ENTRIES en locmem,
+    política maxmemory en Redis, etc.).
+    """
+
+    def __init__(self, alias='default', prefix='chatbot:response:'):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.cache.set(self.prefix + key, value, timeout=ttl)
+
+    def clear(self):
+        # Las entradas de versiones anteriores del catálogo expiran solas por TTL
+        pass
+
+
+class ResponseCache:
+    """Cache de respuestas; los aciertos y fallos se publican en /metrics"""
+
+    def __init__(self, backend, ttl=600):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(message, intents, catalog_version):
+        raw = f"{normalize_message(message)}|{intents.signature()}|{catalog_version}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        LOOKUPS.inc(result='miss' if value is None else 'hit')
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+
+def build_response_cache():
+    """Crea el cache según CHATBOT_RESPONSE_CACHE_BACKEND ('locmem', 'django' o 'none')"""
+    backend_name = settings.CHATBOT_RESPONSE_CACHE_BACKEND
+    if backend_name == 'none':
+        return None
+    if backend_name == 'django':
+        backend = DjangoCacheBackend(settings.CHATBOT_RESPONSE_CACHE_ALIAS)
+    elif backend_name == 'locmem':
+        backend = LocalMemoryBackend(settings.CHATBOT_RESPONSE_CACHE_MAX_ENTRIES)
+    else:
+        raise ValueError(f"Backend de cache de respuestas desconocido: {backend_name}")
+    return ResponseCache(backend, ttl=settings.CHATBOT_RESPONSE_CACHE_TTL)
+
+
+response_cache = build_response_cache()
@@ -0,0 +1,118 @@
+# chatbot/coalescing.py
+"""
+Agrupación (single-flight) de peticiones idénticas en curso.
+
+Cuando varias conversaciones nuevas envían el mismo mensaje a la vez (por
+ejemplo, la pregunta de una campaña), sólo la primera construye el contexto
+y llama a OpenAI; las demás esperan y reciben la misma respuesta, que cada
+vista guarda como su propio mensaje. La clave es la misma del cache de
+respuestas (mensaje normalizado, intenciones y versión del catálogo), así que
+una respuesta compartida es la que el cache habría devuelto un instante
+después.
+
+`SingleFlight` sirve a la vista síncrona (hilos de WSGI) y
+`AsyncSingleFlight` a la asíncrona (un event loop de ASGI). La agrupación es
+por proceso: entre workers distintos las peticiones no se agrupan.
+"""
+import asyncio
+import threading
+
+from buynlarge.metrics import registry
+
+COALESCED = registry.counter(
+    'chatbot_coalesced_requests_total', 'Peticiones agrupadas por papel (leader llama a OpenAI, follower espera)',
+    ('role',)
+)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave entre hilos"""
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def run(self, key, func):
+        """
+        Ejecuta `func` si no hay otra llamada en curso con `key`; si la hay,
+        espera su resultado (o su excepción). Devuelve (resultado, compartido).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+
+        if not leader:
+            COALESCED.inc(role='follower')
+            if not flight.done.wait(self.timeout):
+                raise TimeoutError("Tiempo de espera agotado aguardando una petición idéntica en curso")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        COALESCED.inc(role='leader')
+        try:
+            flight.result = func()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+class AsyncSingleFlight:
+    """
+    Agrupa corrutinas concurrentes con la misma clave dentro de un event loop.
+    La llamada se ejecuta en una tarea propia: si el cliente que la inició se
+    desconecta, las peticiones que esperan siguen recibiendo la respuesta.
+    """
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._flights = {}
+
+    async def run(self, key, coroutine_function):
+        """Como SingleFlight.run; `coroutine_function` se llama sólo si esta petición inicia la llamada"""
+        loop = asyncio.get_running_loop()
+        # Cada event loop tiene sus propias tareas (por ejemplo, async_to_sync en las pruebas)
+        flight_key = (id(loop), key)
+        task = self._flights.get(flight_key)
+        leader = task is None
+        if leader:
+            COALESCED.inc(role='leader')
+            task = loop.create_task(coroutine_function())
+            self._flights[flight_key] = task
+            task.add_done_callback(lambda done: self._finish(flight_key, done))
+        else:
+            COALESCED.inc(role='follower')
+
+        result = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        return result, not leader
+
+    def _finish(self, flight_key, task):
+        self._flights.pop(flight_key, None)
+        # Marca la excepción como consultada aunque todas las peticiones se hayan desconectado
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self):
+        return len(self._flights)
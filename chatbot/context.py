@@ -0,0 +1,177 @@
+# chatbot/context.py
+"""
+Compactación del contexto del inventario antes de enviarlo a OpenAI.
+
+El contexto que arma get_relevant_context puede crecer con el tamaño del
+catálogo. Aquí se ordenan sus secciones y productos según las intenciones
+detectadas, se eliminan o resumen los campos de poco valor para el modelo y se
+serializa en JSON compacto hasta ajustarse a un presupuesto de tokens.
+"""
+import json
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Campos que no aportan a la respuesta del modelo
+DROPPED_FIELDS = {'image_url', 'created_at', 'updated_at', 'total_price'}
+
+# Claves abreviadas para reducir tokens; la leyenda se incluye en el prompt.
+# Ninguna abreviatura puede coincidir con otra clave del contexto (total, count,
+# brands, categories...), o la leyenda sería ambigua para el modelo.
+KEY_ALIASES = {
+    'description': 'desc',
+    'product_count': 'n_products',
+    'total_products': 'n_total',
+    'min_price': 'min',
+    'max_price': 'max',
+    'avg_price': 'avg',
+    'similar_products': 'similar',
+}
+
+DESCRIPTION_MAX_CHARS = 160
+
+# Secciones base ordenadas de mayor a menor relevancia cuando no hay intención que las destaque
+BASE_SECTION_PRIORITY = ['general_stats', 'query_type', 'categories_detailed', 'categories', 'brands']
+
+
+def estimate_tokens(text):
+    """
+    Aproxima 4 caracteres por token. Los tokens reales del prompt se publican
+    en /metrics (chatbot_prompt_tokens) para contrastar la estimación.
+    """
+    return (len(text) + 3) // 4
+
+
+def serialize_context(context):
+    """JSON sin indentación ni espacios y sin escapar acentos"""
+    return json.dumps(context, ensure_ascii=False, separators=(',', ':'))
+
+
+def key_legend():
+    """Leyenda de las claves abreviadas para incluir en el prompt"""
+    return ', '.join(f'{short}={key}' for key, short in KEY_ALIASES.items())
+
+
+class ContextCompactor:
+    """Ajusta el contexto del chatbot a un presupuesto de tokens"""
+
+    def __init__(self, token_budget=None):
+        self.token_budget = token_budget or settings.CHATBOT_CONTEXT_TOKEN_BUDGET
+
+    def compact(self, context, intents, catalog):
+        """Devuelve el contexto serializado y compactado dentro del presupuesto"""
+        # Serializar el contexto completo cuesta tanto como el resto de la compactación: sólo para depurar
+        debug = logger.isEnabledFor(logging.DEBUG)
+        tokens_before = estimate_tokens(serialize_context(context)) if debug else None
+
+        mentioned_brands = {catalog.brands[brand_id]['name'] for brand_id in intents.brand_ids}
+        mentioned_products = set(intents.product_ids)
+
+        result = {}
+        remaining = self.token_budget - 2  # llaves del objeto raíz
+        ranked = self.rank_sections(context, intents)
+        for position, key in enumerate(ranked):
+            section = self.compact_value(context[key], mentioned_brands, mentioned_products)
+            cost = self.section_tokens(key, section)
+            # Cada sección se recorta hasta su parte proporcional del presupuesto restante,
+            # así una sección grande no deja sin espacio a las demás intenciones
+            share = remaining // (len(ranked) - position)
+            while cost > share and self.shrink(section):
+                cost = self.section_tokens(key, section)
+            if cost <= remaining:
+                result[key] = section
+                remaining -= cost
+
+        context_str = serialize_context(result)
+        if debug:
+            logger.debug(
+                f"Contexto compactado de {tokens_before} a {estimate_tokens(context_str)} tokens "
+                f"(presupuesto {self.token_budget}, secciones: {', '.join(result) or 'ninguna'})"
+            )
+        return context_str
+
+    def rank_sections(self, context, intents):
+        """Ordena las secciones dando prioridad a las que responden a las intenciones detectadas"""
+        ranked = []
+        if intents.product_ids:
+            ranked.append('specific_product')
+        if intents.brand_ids:
+            ranked.append('brand_info')
+        ranked.extend(f'{category_name}_products' for category_name in intents.categories)
+        if intents.price:
+            ranked.append('price_info')
+        if intents.stock:
+            ranked.append('stock_info')
+        if intents.category_query:
+            ranked.append('categories_detailed')
+        ranked.extend(BASE_SECTION_PRIORITY)
+        # Cualquier otra sección queda al final en su orden original
+        ranked.extend(context)
+        return [key for key in dict.fromkeys(ranked) if key in context]
+
+    def compact_value(self, value, mentioned_brands, mentioned_products):
+        """Copia el valor eliminando campos poco útiles, abreviando claves y ordenando productos"""
+        if isinstance(value, dict):
+            compacted = {}
+            for key, item in value.items():
+                if key in DROPPED_FIELDS:
+                    continue
+                item = self.compact_value(item, mentioned_brands, mentioned_products)
+                if key == 'description' and isinstance(item, str) and len(item) > DESCRIPTION_MAX_CHARS:
+                    item = item[:DESCRIPTION_MAX_CHARS].rsplit(' ', 1)[0] + '…'
+                compacted[KEY_ALIASES.get(key, key)] = item
+            return compacted
+        if isinstance(value, list):
+            items = value
+            if items and all(isinstance(item, dict) and 'price' in item for item in items):
+                items = sorted(items, key=lambda item: self.product_rank(item, mentioned_brands, mentioned_products))
+            return [self.compact_value(item, mentioned_brands, mentioned_products) for item in items]
+        if isinstance(value, float):
+            return round(value, 2)
+        return value
+
+    @staticmethod
+    def product_rank(item, mentioned_brands, mentioned_products):
+        """Primero los productos y marcas mencionados, luego los que tienen stock"""
+        brand = item.get('brand')
+        brand_name = brand.get('name') if isinstance(brand, dict) else brand
+        return (
+            item.get('id') not in mentioned_products,
+            brand_name not in mentioned_brands,
+            item.get('stock', 1) <= 0,
+        )
+
+    @staticmethod
+    def section_tokens(key, section):
+        return estimate_tokens(serialize_context({key: section})) - 1
+
+    @classmethod
+    def shrink(cls, value):
+        """
+        Reduce a la mitad la lista más larga dentro de la sección (conservando los
+        primeros elementos, que son los más relevantes). Devuelve False si ya no
+        queda nada que recortar.
+        """
+        longest = cls.longest_list(value)
+        if longest is None or len(longest) <= 1:
+            return False
+        del longest[(len(longest) + 1) // 2:]
+        return True
+
+    @classmethod
+    def longest_list(cls, value):
+        candidates = []
+        if isinstance(value, list):
+            candidates.append(value)
+            children = value
+        elif isinstance(value, dict):
+            children = value.values()
+        else:
+            return None
+        for child in children:
+            found = cls.longest_list(child)
+            if found is not None:
+                candidates.append(found)
+        return max(candidates, key=len, default=None)
@@ -0,0 +1,213 @@
+# chatbot/intents.py
+"""
+Detección de intenciones del chatbot.
+
+Todas las palabras clave, los nombres de marcas y los nombres de productos se
+compilan en un único autómata Aho-Corasick, de modo que detectar todas las
+intenciones de un mensaje requiere una sola pasada sobre el texto y su costo
+depende de la longitud del mensaje y no del tamaño del catálogo.
+El autómata se reconstruye sólo cuando cambia la versión del catálogo.
+"""
+import re
+import threading
+from collections import deque
+
+from buynlarge.text import fold_text
+
+# Consultas sobre las categorías disponibles
+CATEGORY_QUERY_KEYWORDS = ['categorías', 'categorias', 'tipos de productos', 'qué venden', 'que venden',
+                           'qué productos', 'que productos', 'secciones', 'departamentos']
+
+# Búsqueda por categoría: cada clave se compara con el nombre de las categorías del catálogo
+CATEGORY_KEYWORDS = {
+    'computadora': ['computadora', 'laptop', 'pc', 'ordenador', 'notebook', 'desktop', 'computadoras',
+                    'laptops', 'pcs', 'ordenadores'],
+    'teléfono': ['teléfono', 'celular', 'smartphone', 'móvil', 'telefono', 'movil', 'telefonos', 'celulares',
+                 'smartphones'],
+    'tablet': ['tablet', 'tableta', 'ipad', 'tablets', 'tabletas'],
+    'accesorio': ['accesorio', 'periférico', 'periferico', 'accesorios', 'periféricos', 'perifericos', 'gadget',
+                  'gadgets'],
+    'audio': ['audio', 'auricular', 'altavoz', 'audifono', 'parlante', 'auriculares', 'altavoces', 'audifonos',
+              'parlantes', 'bocina', 'bocinas'],
+    'gaming': ['gaming', 'juego', 'consola', 'gamer', 'videojuego', 'juegos', 'consolas', 'videojuegos']
+}
+
+PRICE_KEYWORDS = ['precio', 'costo', 'valor', 'cuánto cuesta', 'cuanto cuesta', 'cuánto vale', 'cuanto vale', 'precios',
+                  'costos']
+
+STOCK_KEYWORDS = ['disponible', 'stock', 'hay', 'disponibilidad', 'existencia', 'existencias', 'inventario']
+
+_WORD_RE = re.compile(r'\w+')
+_MODEL_CODE_RE = re.compile(r'[a-z]+\d\w*')
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+class AhoCorasick:
+    """Autómata Aho-Corasick que devuelve los valores asociados a cada patrón encontrado"""
+
+    def __init__(self, patterns):
+        """
+        patterns: iterable de tuplas (patrón, valor). Un mismo patrón puede
+        tener varios valores.
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (value,)
+
+        # Construir los enlaces de fallo recorriendo el trie por niveles
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # Heredar las salidas del estado de fallo para no tener que recorrerlo al buscar
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """Devuelve el conjunto de valores de todos los patrones contenidos en el texto"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class DetectedIntents:
+    """Intenciones detectadas en un mensaje"""
+
+    def __init__(self, category_query=False, categories=(), brand_ids=(), product_ids=(),
+                 price=False, stock=False, related_brand_ids=(), mentions=()):
+        self.category_query = category_query
+        # Claves de CATEGORY_KEYWORDS en el orden en que están declaradas
+        self.categories = list(categories)
+        # Ids ordenados de las marcas y productos mencionados
+        self.brand_ids = list(brand_ids)
+        self.product_ids = list(product_ids)
+        self.price = price
+        self.stock = stock
+        # Marcas mencionadas más las de los productos mencionados ("galaxy s22" es de Samsung)
+        self.related_brand_ids = list(related_brand_ids)
+        # Textos (sin acentos) del mensaje que originaron cada intención
+        self.mentions = tuple(mentions)
+
+    def __bool__(self):
+        return bool(self.category_query or self.categories or self.brand_ids or self.product_ids
+                    or self.price or self.stock)
+
+    def signature(self):
+        """Representación estable de las intenciones, útil como parte de claves de cache"""
+        return (
+            f"q={int(self.category_query)};c={','.join(self.categories)};"
+            f"b={','.join(map(str, self.brand_ids))};p={','.join(map(str, self.product_ids))};"
+            f"price={int(self.price)};stock={int(self.stock)}"
+        )
+
+
+class IntentMatcher:
+    """Detector de intenciones compilado para una versión concreta del catálogo"""
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+
+        patterns = []
+        for keyword in CATEGORY_QUERY_KEYWORDS:
+            patterns.append((fold_text(keyword), ('category_query', None)))
+        for category_name, keywords in CATEGORY_KEYWORDS.items():
+            for keyword in keywords:
+                patterns.append((fold_text(keyword), ('category', category_name)))
+        for keyword in PRICE_KEYWORDS:
+            patterns.append((fold_text(keyword), ('price', None)))
+        for keyword in STOCK_KEYWORDS:
+            patterns.append((fold_text(keyword), ('stock', None)))
+        for brand in catalog.brands.values():
+            patterns.append((fold_text(brand['name']), ('brand', brand['id'])))
+        for product in catalog.products.values():
+            patterns.append((fold_text(product['name']), ('product', product['id'])))
+        self._automaton = AhoCorasick(patterns)
+        self._patterns = {}
+        for pattern, value in patterns:
+            self._patterns.setdefault(value, []).append(pattern)
+
+        # Códigos de modelo ("s22", "x1") que identifican a un único producto: "samsung s22" es el Galaxy S22.
+        # Empiezan con letra para excluir capacidades como "5g" o "128gb" y se comparan por palabra
+        # completa para que "x1" no coincida con "x10"
+        products_by_code = {}
+        for product in catalog.products.values():
+            for word in set(_WORD_RE.findall(fold_text(product['name']))):
+                if _MODEL_CODE_RE.fullmatch(word):
+                    products_by_code.setdefault(word, set()).add(product['id'])
+        self.model_codes = {code: ids.pop() for code, ids in products_by_code.items() if len(ids) == 1}
+        self.product_brands = {product['id']: product['brand_id'] for product in catalog.products.values()}
+
+        # Categorías del catálogo que corresponden a cada grupo de palabras clave
+        self.category_ids = {
+            category_name: [
+                category['id'] for category in catalog.categories.values()
+                if fold_text(category_name) in fold_text(category['name'])
+            ]
+            for category_name in CATEGORY_KEYWORDS
+        }
+
+    def match(self, message):
+        """Detecta todas las intenciones del mensaje en una sola pasada"""
+        text = fold_text(message)
+        hits = self._automaton.find_all(text)
+        mentions = {pattern for hit in hits for pattern in self._patterns[hit] if pattern in text}
+        for word in _WORD_RE.findall(text):
+            if word in self.model_codes:
+                hits.add(('product', self.model_codes[word]))
+                mentions.add(word)
+
+        kinds = {kind for kind, _ in hits}
+        brand_ids = {value for kind, value in hits if kind == 'brand'}
+        product_ids = sorted(value for kind, value in hits if kind == 'product')
+        return DetectedIntents(
+            category_query='category_query' in kinds,
+            categories=[name for name in CATEGORY_KEYWORDS if ('category', name) in hits],
+            brand_ids=sorted(brand_ids),
+            product_ids=product_ids,
+            price='price' in kinds,
+            stock='stock' in kinds,
+            related_brand_ids=sorted(brand_ids.union(self.product_brands[product_id] for product_id in product_ids)),
+            mentions=sorted(mentions),
+        )
+
+
+def get_intent_matcher(catalog):
+    """Devuelve el detector compilado para el snapshot dado, reconstruyéndolo si cambió el catálogo"""
+    global _matcher
+
+    matcher = _matcher
+    if matcher is not None and matcher.version == catalog.version:
+        return matcher
+
+    with _matcher_lock:
+        if _matcher is None or _matcher.version != catalog.version:
+            _matcher = IntentMatcher(catalog)
+        return _matcher
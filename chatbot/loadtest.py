@@ -0,0 +1,479 @@
+# chatbot/loadtest.py
+"""
+Pruebas de carga del chatbot sin red y sin costo.
+
+`FakeOpenAIServer` simula POST /v1/chat/completions con una distribución de
+latencia, una velocidad de generación de tokens y una tasa de errores
+configurables. `run_load` reproduce un corpus JSONL de mensajes de usuario
+con muchas sesiones concurrentes (cada sesión envía sus mensajes en orden,
+como un usuario real) y `LoadReport` resume latencias, throughput, errores y
+consultas a la base de datos por petición. `WriteCounter` mide la
+amplificación de escritura (sentencias y commits por fila guardada) en todos
+los hilos, incluido el de la escritura diferida de mensajes.
+"""
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), 'loadtest_corpus.jsonl')
+
+LATENCY_DISTRIBUTIONS = ('uniform', 'normal', 'lognormal', 'fixed')
+
+# Errores que puede devolver la API de OpenAI: código de estado -> (tipo, código)
+OPENAI_ERRORS = {
+    429: ('rate_limit_error', 'rate_limit_exceeded'),
+    500: ('server_error', 'internal_error'),
+    503: ('server_error', 'overloaded'),
+}
+
+
+class FakeOpenAIServer:
+    """
+    Servidor HTTP mínimo compatible con POST /v1/chat/completions de OpenAI.
+    Responde con un texto fijo tras una latencia configurable, lo que permite
+    medir el throughput del chatbot sin red y sin costo.
+
+    La latencia hasta el primer token sigue `latency_distribution` alrededor
+    de `latency_ms` (con `jitter_ms` como amplitud o desviación); después el
+    texto se genera a `tokens_per_second` (por palabra en modo stream). Una
+    fracción `error_rate` de las peticiones responde con uno de
+    `error_statuses` y el cuerpo de error de OpenAI.
+    """
+
+    RESPONSE_TEXT = "Respuesta simulada de Buy n Large para pruebas de carga."
+
+    def __init__(self, latency_ms=800, jitter_ms=200, token_delay_ms=20, seed=None,
+                 latency_distribution='uniform', tokens_per_second=None, response_words=None,
+                 error_rate=0.0, error_statuses=(429, 500, 503)):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Distribución de latencia desconocida: {latency_distribution}")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_delay_ms = token_delay_ms
+        self.random = random.Random(seed)
+        self.latency_distribution = latency_distribution
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.response_text = self.RESPONSE_TEXT
+        if response_words:
+            words = itertools.cycle(self.RESPONSE_TEXT.split(' '))
+            self.response_text = ' '.join(next(words) for _ in range(response_words))
+        self.requests_served = 0
+        self.errors_served = 0
+        self._loop = None
+        self._server = None
+        self._writers = set()
+
+    def sample_latency(self):
+        """Segundos hasta el primer token según la distribución configurada"""
+        if self.latency_distribution == 'fixed':
+            latency = self.latency_ms
+        elif self.latency_distribution == 'normal':
+            latency = self.random.gauss(self.latency_ms, self.jitter_ms)
+        elif self.latency_distribution == 'lognormal':
+            # Mediana latency_ms y cola larga a la derecha, como las latencias reales de la API
+            sigma = self.jitter_ms / self.latency_ms if self.latency_ms else 0
+            latency = self.random.lognormvariate(math.log(max(self.latency_ms, 1)), sigma)
+        else:
+            latency = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(latency, 0) / 1000
+
+    def token_delay(self):
+        """Segundos entre fragmentos en modo stream"""
+        if self.tokens_per_second:
+            return 1 / self.tokens_per_second
+        return self.token_delay_ms / 1000
+
+    def sample_error(self):
+        """Código de estado del error a simular o None"""
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self.random.choice(self.error_statuses)
+        return None
+
+    @staticmethod
+    def error_body(status_code):
+        error_type, code = OPENAI_ERRORS.get(status_code, ('server_error', 'error'))
+        return {'error': {'message': f'Error simulado ({status_code})', 'type': error_type, 'param': None,
+                          'code': code}}
+
+    def completion_body(self, payload):
+        prompt_chars = sum(len(str(m.get('content', ''))) for m in payload.get('messages', []))
+        content = self.response_text
+        return {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_chars // 4,
+                'completion_tokens': len(content) // 4,
+                'total_tokens': prompt_chars // 4 + len(content) // 4
+            }
+        }
+
+    async def handle_connection(self, reader, writer):
+        # Conexiones keep-alive: se atienden peticiones hasta que el cliente cierre
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                payload = json.loads(body or b'{}') if method == 'POST' else {}
+                is_completion = method == 'POST' and path.rstrip('/').endswith('/chat/completions')
+                error_status = self.sample_error() if is_completion else None
+                if error_status:
+                    await asyncio.sleep(self.sample_latency())
+                    self.errors_served += 1
+                    status_line, response = f'{error_status} Error', self.error_body(error_status)
+                elif is_completion and payload.get('stream'):
+                    await self.stream_completion(writer, payload)
+                    continue
+                elif is_completion:
+                    status_line, response = await self.chat_completion(payload)
+                else:
+                    status_line, response = '404 Not Found', {'error': {'message': f'Ruta no soportada: {path}'}}
+
+                await self.send_json(writer, status_line, response)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def chat_completion(self, payload):
+        body = self.completion_body(payload)
+        delay = self.sample_latency()
+        if self.tokens_per_second:
+            delay += body['usage']['completion_tokens'] / self.tokens_per_second
+        await asyncio.sleep(delay)
+        self.requests_served += 1
+        return '200 OK', body
+
+    async def stream_completion(self, writer, payload):
+        """Responde en modo stream=True: un evento SSE por palabra con transferencia chunked"""
+        await asyncio.sleep(self.sample_latency())
+        writer.write(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: text/event-stream\r\n'
+            b'Transfer-Encoding: chunked\r\n'
+            b'\r\n'
+        )
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        words = self.response_text.split(' ')
+        delay = self.token_delay()
+        for index, word in enumerate(words):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': payload.get('model', 'gpt-3.5-turbo'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if index == 0 else f' {word}'},
+                    'finish_reason': 'stop' if index == len(words) - 1 else None
+                }]
+            }
+            self.write_chunk(writer, f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            await writer.drain()
+            if delay:
+                await asyncio.sleep(delay)
+        self.write_chunk(writer, b'data: [DONE]\n\n')
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        self.requests_served += 1
+
+    @staticmethod
+    def write_chunk(writer, data):
+        writer.write(f'{len(data):x}\r\n'.encode('latin-1') + data + b'\r\n')
+
+    @staticmethod
+    async def send_json(writer, status_line, payload):
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(
+            f'HTTP/1.1 {status_line}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(data)}\r\n'
+            f'\r\n'.encode('latin-1') + data
+        )
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    def start_in_background(self, host='127.0.0.1', port=0):
+        """
+        Inicia el servidor en un hilo con su propio event loop y devuelve la URL
+        base (`http://host:puerto/v1`). Con port=0 se usa un puerto libre.
+        """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+            )
+            started.set()
+            self._loop.run_forever()
+            # Cierra las conexiones keep-alive que siguen abiertas: sus handlers leen EOF y terminan
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            pending = asyncio.all_tasks(self._loop)
+            if pending:
+                self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+        threading.Thread(target=run, name='fake-openai', daemon=True).start()
+        started.wait()
+        bound_port = self._server.sockets[0].getsockname()[1]
+        return f'http://{host}:{bound_port}/v1'
+
+    def stop(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+@contextmanager
+def openai_base_url(url, *clients):
+    """Apunta temporalmente los clientes de OpenAI a otra URL base (por ejemplo el servidor simulado)"""
+    previous = [client.base_url for client in clients]
+    for client in clients:
+        client.base_url = url
+    try:
+        yield
+    finally:
+        for client, base_url in zip(clients, previous):
+            client.base_url = base_url
+
+
+class WriteCounter:
+    """
+    Cuenta las sentencias de escritura (INSERT, UPDATE, DELETE) y los commits
+    que ejecutan todas las conexiones, también las de otros hilos, mientras
+    está instalado. Fuera de una transacción cada escritura es su propio
+    commit (autocommit); dentro, se cuenta un commit por transacción.
+    """
+
+    WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(self.WRITE_PREFIXES):
+            connection = context['connection']
+            with self._lock:
+                self.statements += 1
+                if not connection.in_atomic_block:
+                    self.commits += 1
+            if connection.in_atomic_block and not any(func == self.count_commit
+                                                      for _, func, _ in connection.run_on_commit):
+                connection.on_commit(self.count_commit)
+        return execute(sql, params, many, context)
+
+    def count_commit(self):
+        with self._lock:
+            self.commits += 1
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    @contextmanager
+    def installed(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        for connection in connections.all():
+            self.install(connection)
+        connection_created.connect(self.install, weak=False)
+        try:
+            yield self
+        finally:
+            connection_created.disconnect(self.install)
+            for connection in connections.all():
+                if self in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(self)
+
+    def summary(self, rows):
+        return {
+            'rows': rows,
+            'statements': self.statements,
+            'commits': self.commits,
+            'statements_per_row': round(self.statements / rows, 3) if rows else None,
+            'commits_per_row': round(self.commits / rows, 3) if rows else None,
+        }
+
+
+def load_corpus(path=DEFAULT_CORPUS):
+    """
+    Lee un corpus JSONL. El mensaje se toma de `message`, `body` o `title`
+    (el formato de los archivos de solicitudes {request_id, title, body} sirve
+    tal cual); `session_id`, si existe, agrupa los mensajes en una conversación.
+    """
+    corpus = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            message = item.get('message') or item.get('body') or item.get('title')
+            if message:
+                corpus.append({'message': message, 'session_id': item.get('session_id')})
+    return corpus
+
+
+def plan_sessions(corpus, sessions, iterations=1, prefix='loadtest'):
+    """
+    Reparte los mensajes entre `sessions` conversaciones (en rueda, salvo los
+    que traen session_id) repitiendo el corpus `iterations` veces.
+    Devuelve [(session_id, [mensajes])].
+    """
+    run_id = uuid.uuid4().hex[:8]
+    plan = {}
+    for index, item in enumerate(corpus * iterations):
+        session = item['session_id'] or f'{index % sessions}'
+        plan.setdefault(f'{prefix}-{run_id}-{session}', []).append(item['message'])
+    return list(plan.items())
+
+
+class LoadReport:
+    """Resultados de una prueba de carga: una fila (latencia en ms, estado, consultas) por petición"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.queries = []
+        self.cache = Counter()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms, status_code, queries=None, cache_status=None):
+        with self._lock:
+            self.latencies.append(latency_ms)
+            self.statuses[status_code] += 1
+            if queries is not None:
+                self.queries.append(queries)
+            if cache_status:
+                self.cache[cache_status] += 1
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def errors(self):
+        return sum(count for status_code, count in self.statuses.items() if not 200 <= status_code < 300)
+
+    def percentile(self, values, percent):
+        if not values:
+            return 0.0
+        if len(values) == 1:
+            return values[0]
+        return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'elapsed_s': round(self.elapsed, 3),
+            'throughput_rps': round(self.requests / self.elapsed, 2) if self.elapsed else 0.0,
+            'error_rate': round(self.errors / self.requests, 4) if self.requests else 0.0,
+            'latency_ms': {
+                f'p{percent}': round(self.percentile(self.latencies, percent), 1) for percent in (50, 95, 99)
+            },
+            'statuses': dict(sorted(self.statuses.items())),
+            'queries_per_request': {
+                'mean': round(statistics.mean(self.queries), 1) if self.queries else None,
+                'p95': self.percentile(self.queries, 95) if self.queries else None,
+                'max': max(self.queries) if self.queries else None,
+            },
+            'cache': dict(self.cache),
+        }
+
+
+def run_load(send, plan, concurrency, close=None):
+    """
+    Ejecuta el plan con `concurrency` sesiones simultáneas en hilos.
+    `send(session_id, message)` devuelve (código de estado, consultas o None,
+    estado del cache o None); `close()`, si se indica, se llama en el hilo de
+    cada sesión al terminarla.
+    """
+    report = LoadReport()
+
+    def run_session(session_id, messages):
+        for message in messages:
+            start = time.perf_counter()
+            try:
+                result = send(session_id, message)
+            except Exception:
+                # Errores de conexión o del servidor: se cuentan como 599
+                result = (599, None, None)
+            report.record((time.perf_counter() - start) * 1000, *result)
+        if close:
+            close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix='loadtest') as pool:
+        for future in [pool.submit(run_session, session_id, messages) for session_id, messages in plan]:
+            future.result()
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+async def run_load_async(send, plan, concurrency):
+    """
+    Como run_load, pero en un solo event loop con una corrutina `send`, como
+    atiende las peticiones un servidor ASGI (las vistas asíncronas comparten el
+    cliente de OpenAI, que queda ligado al loop).
+    """
+    report = LoadReport()
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run_session(session_id, messages):
+        async with semaphore:
+            for message in messages:
+                start = time.perf_counter()
+                try:
+                    result = await send(session_id, message)
+                except Exception:
+                    result = (599, None, None)
+                report.record((time.perf_counter() - start) * 1000, *result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(session_id, messages) for session_id, messages in plan))
+    report.elapsed = time.perf_counter() - start
+    return report
@@ -0,0 +1,82 @@
+# chatbot/management/commands/bench_chatbot_context.py
+import json
+import platform
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from chatbot.benchmarks import benchmark_context, compare_results
+from chatbot.views import ChatbotAPIView
+from products.benchmarks import seed_benchmark_catalog
+from products.catalog import bump_catalog_version
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Mide get_relevant_context (tiempo, consultas y tamaño del contexto) con consultas que cubren cada '
+            'intención sobre catálogos de varios tamaños. Los productos se crean en una transacción que se revierte. '
+            'Con --output guarda los resultados en JSON y con --baseline los compara con una ejecución anterior.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument('--baseline', help='Archivo JSON de una ejecución anterior para comparar')
+        parser.add_argument('--tolerance', type=float, default=1.25,
+                            help='Factor de latencia o tamaño sobre la base que se considera regresión')
+
+    def handle(self, *args, **options):
+        view = ChatbotAPIView()
+        results = []
+        for size in options['sizes']:
+            with transaction.atomic():
+                seed_benchmark_catalog(size, random.Random(options['seed']))
+                product_name = Product.objects.order_by('-id').values_list('name', flat=True).first()
+                bump_catalog_version()
+                rows = benchmark_context(view, product_name, options['repeat'])
+                transaction.set_rollback(True)
+            # El snapshot en memoria contiene los productos revertidos
+            bump_catalog_version()
+
+            self.stdout.write(f"\n{size} productos sembrados ({rows[0]['products']} en el catálogo)")
+            for row in rows:
+                row['size'] = size
+                self.write_row(row)
+            results.extend(rows)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'meta': self.meta(options), 'results': results}, file, indent=2, ensure_ascii=False)
+            self.stdout.write(f"\nResultados guardados en {options['output']}")
+
+        missed = [row['case'] for row in results if set(row.get('expected_intents', [])) - set(row.get('intents', []))]
+        if missed:
+            self.stdout.write(self.style.WARNING(f"Casos sin la intención esperada: {', '.join(sorted(set(missed)))}"))
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)['results']
+            regressions = compare_results(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regresiones frente a la línea base:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Sin regresiones frente a la línea base'))
+
+    def write_row(self, row):
+        line = f"  {row['case']:<14} p50 {row['p50_ms']:8.2f} ms  max {row['max_ms']:8.2f} ms  {row['queries']} consultas"
+        if 'context_bytes' in row:
+            line += f"  contexto {row['context_bytes']:>9} B  prompt {row['prompt_bytes']:>7} B"
+        self.stdout.write(line)
+
+    @staticmethod
+    def meta(options):
+        return {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'sizes': options['sizes'],
+            'repeat': options['repeat'],
+            'seed': options['seed'],
+        }
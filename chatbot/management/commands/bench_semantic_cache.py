@@ -0,0 +1,68 @@
+# chatbot/management/commands/bench_semantic_cache.py
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.intents import DetectedIntents
+from chatbot.semantic_cache import SemanticCache
+
+TEMPLATES = [
+    '¿Cuál es el precio del {product}?',
+    'cuanto cuesta el {product}',
+    '¿Tienen {product} disponible?',
+    'Quiero comparar el {product} con otros modelos',
+    '¿Qué especificaciones tiene el {product}?',
+    'recomiéndame algo parecido al {product}',
+]
+
+PRODUCTS = ['Galaxy S{n}', 'iPhone {n}', 'MacBook Pro {n}', 'ThinkPad X{n}', 'Pixel {n}', 'Xbox Series {n}']
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de búsqueda del cache semántico con un número dado de entradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--dimensions', type=int, default=512)
+        parser.add_argument('--threshold', type=float, default=0.85)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        entries = options['entries']
+        cache = SemanticCache(
+            max_entries=entries,
+            threshold=options['threshold'],
+            ttl=3600,
+            dimensions=options['dimensions']
+        )
+        intents = DetectedIntents()
+
+        def question():
+            product = rng.choice(PRODUCTS).format(n=rng.randint(1, 5000))
+            return rng.choice(TEMPLATES).format(product=product)
+
+        start = time.perf_counter()
+        for index in range(entries):
+            cache.add(question(), intents, 1, f'respuesta {index}')
+        insert_seconds = time.perf_counter() - start
+
+        latencies = []
+        for _ in range(options['queries']):
+            message = question()
+            start = time.perf_counter()
+            cache.lookup(message, intents, 1)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        stats = cache.stats()
+        self.stdout.write(f"Entradas: {stats['entries']} ({stats['memory_bytes'] / 1024 / 1024:.1f} MB en vectores)")
+        self.stdout.write(f"Inserción: {entries / insert_seconds:.0f} entradas/s")
+        self.stdout.write(
+            f"Búsqueda: p50 {quantiles[49]:.2f} ms, p95 {quantiles[94]:.2f} ms, p99 {quantiles[98]:.2f} ms "
+            f"({options['queries']} consultas)"
+        )
+        self.stdout.write(f"Aciertos: {stats['hits']} de {stats['hits'] + stats['misses']}")
@@ -0,0 +1,51 @@
+# chatbot/management/commands/fake_openai.py
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from chatbot.loadtest import LATENCY_DISTRIBUTIONS, FakeOpenAIServer
+
+
+class Command(BaseCommand):
+    help = 'Inicia un servidor local que simula la API de chat completions de OpenAI para pruebas de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency-ms', type=int, default=800, help='Latencia media de cada respuesta')
+        parser.add_argument('--jitter-ms', type=int, default=200,
+                            help='Variación alrededor de la latencia media (amplitud o desviación según la distribución)')
+        parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='uniform')
+        parser.add_argument('--token-delay-ms', type=int, default=20,
+                            help='Pausa entre fragmentos cuando se pide stream=True')
+        parser.add_argument('--tokens-per-second', type=float, default=None,
+                            help='Velocidad de generación; reemplaza --token-delay-ms y alarga las respuestas sin stream')
+        parser.add_argument('--response-words', type=int, default=None, help='Largo de la respuesta simulada')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de peticiones que fallan')
+        parser.add_argument('--error-statuses', type=int, nargs='+', default=[429, 500, 503])
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = FakeOpenAIServer(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            token_delay_ms=options['token_delay_ms'],
+            seed=options['seed'],
+            latency_distribution=options['latency_distribution'],
+            tokens_per_second=options['tokens_per_second'],
+            response_words=options['response_words'],
+            error_rate=options['error_rate'],
+            error_statuses=options['error_statuses'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Servidor OpenAI simulado en http://{options['host']}:{options['port']}/v1 "
+            f"(latencia {options['latency_distribution']} {options['latency_ms']}±{options['jitter_ms']} ms, "
+            f"errores {options['error_rate']:.0%})"
+        ))
+        self.stdout.write(f"Usa OPENAI_BASE_URL=http://{options['host']}:{options['port']}/v1 para apuntar el chatbot aquí")
+        try:
+            asyncio.run(server.serve(options['host'], options['port']))
+        except KeyboardInterrupt:
+            self.stdout.write(
+                f'Servidor detenido tras {server.requests_served} respuestas y {server.errors_served} errores'
+            )
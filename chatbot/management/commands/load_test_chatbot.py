@@ -0,0 +1,175 @@
+# chatbot/management/commands/load_test_chatbot.py
+import asyncio
+import json
+import threading
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from chatbot import views
+from chatbot.loadtest import (
+    DEFAULT_CORPUS, LATENCY_DISTRIBUTIONS, FakeOpenAIServer, WriteCounter, load_corpus, openai_base_url,
+    plan_sessions, run_load, run_load_async,
+)
+from chatbot.models import Conversation, Message
+
+ENDPOINTS = {'sync': '/api/chatbot/', 'async': '/api/chatbot/async/'}
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga del chatbot: reproduce un corpus JSONL de mensajes con muchas sesiones concurrentes '
+            'contra un servidor OpenAI simulado y reporta latencias, throughput, errores y consultas por petición.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=DEFAULT_CORPUS,
+                            help='JSONL con message, body o title por línea (y session_id opcional)')
+        parser.add_argument('--sessions', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=20, help='Sesiones simultáneas')
+        parser.add_argument('--iterations', type=int, default=1, help='Veces que se repite el corpus')
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='sync')
+        parser.add_argument('--target', default=None,
+                            help='URL de un servidor en ejecución (por ejemplo http://127.0.0.1:8000); sin ella '
+                                 'las peticiones se hacen en el proceso contra el servidor simulado')
+        parser.add_argument('--latency-ms', type=int, default=800)
+        parser.add_argument('--jitter-ms', type=int, default=200)
+        parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='lognormal')
+        parser.add_argument('--tokens-per-second', type=float, default=None)
+        parser.add_argument('--response-words', type=int, default=None)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--write-behind', action='store_true',
+                            help='Guarda los mensajes con escritura diferida (sólo en el proceso)')
+        parser.add_argument('--keep-conversations', action='store_true',
+                            help='No borrar las conversaciones creadas en la prueba (sólo en el proceso)')
+        parser.add_argument('--json', action='store_true', help='Imprime el resumen como JSON')
+
+    def handle(self, *args, **options):
+        corpus = load_corpus(options['corpus'])
+        plan = plan_sessions(corpus, options['sessions'], options['iterations'])
+        self.stderr.write(
+            f"{sum(len(messages) for _, messages in plan)} mensajes en {len(plan)} sesiones, "
+            f"{options['concurrency']} simultáneas"
+        )
+
+        server = None
+        if options['target']:
+            report = run_load(self.http_sender(options['target'], options['endpoint']), plan, options['concurrency'])
+        else:
+            server = FakeOpenAIServer(
+                latency_ms=options['latency_ms'], jitter_ms=options['jitter_ms'], seed=options['seed'],
+                latency_distribution=options['latency_distribution'],
+                tokens_per_second=options['tokens_per_second'], response_words=options['response_words'],
+                error_rate=options['error_rate'],
+            )
+            try:
+                report, writes = self.run_in_process(server, plan, options)
+            finally:
+                server.stop()
+
+        summary = report.summary()
+        if server is not None:
+            summary['openai'] = {'responses': server.requests_served, 'simulated_errors': server.errors_served}
+            summary['writes'] = {'write_behind': options['write_behind'], **writes}
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+        else:
+            self.write_summary(summary)
+
+    def run_in_process(self, server, plan, options):
+        url = server.start_in_background()
+        writer = views.message_writer
+        # Se detiene el hilo de escritura diferida para que al volver a arrancar su conexión quede medida
+        writer.close()
+        enabled, writer.enabled = writer.enabled, options['write_behind']
+        counter = WriteCounter()
+        messages_before = Message.objects.count()
+        try:
+            # Los reintentos del cliente de OpenAI ante 429/5xx forman parte de la latencia medida
+            with counter.installed(), openai_base_url(url, views.client, views.async_client), \
+                    override_settings(ALLOWED_HOSTS=['testserver'], QUERY_INSTRUMENTATION_HEADERS=True):
+                path = ENDPOINTS[options['endpoint']]
+                if options['endpoint'] == 'async':
+                    report = asyncio.run(run_load_async(self.async_client_sender(path), plan, options['concurrency']))
+                else:
+                    report = run_load(self.client_sender(path), plan, options['concurrency'],
+                                      close=connections.close_all)
+                # Los mensajes que siguen en la cola cuentan como escrituras de la prueba
+                writer.close()
+        finally:
+            writer.enabled = enabled
+        writes = counter.summary(Message.objects.count() - messages_before)
+        if not options['keep_conversations']:
+            Conversation.objects.filter(session_id__in=[session_id for session_id, _ in plan]).delete()
+        return report, writes
+
+    @staticmethod
+    def client_sender(path):
+        local = threading.local()
+
+        def send(session_id, message):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            response = local.client.post(
+                path, {'message': message, 'session_id': session_id}, content_type='application/json'
+            )
+            return response.status_code, header_int(response, 'X-DB-Query-Count'), response.get('X-Chatbot-Cache')
+        return send
+
+    @staticmethod
+    def async_client_sender(path):
+        client = AsyncClient()
+
+        async def send(session_id, message):
+            response = await client.post(
+                path, {'message': message, 'session_id': session_id}, content_type='application/json'
+            )
+            return response.status_code, header_int(response, 'X-DB-Query-Count'), response.get('X-Chatbot-Cache')
+        return send
+
+    @staticmethod
+    def http_sender(target, endpoint):
+        local = threading.local()
+        url = target.rstrip('/') + ENDPOINTS[endpoint]
+
+        def send(session_id, message):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            response = local.session.post(url, json={'message': message, 'session_id': session_id}, timeout=120)
+            return (response.status_code, header_int(response.headers, 'X-DB-Query-Count'),
+                    response.headers.get('X-Chatbot-Cache'))
+        return send
+
+    def write_summary(self, summary):
+        latency = summary['latency_ms']
+        queries = summary['queries_per_request']
+        self.stdout.write(
+            f"{summary['requests']} peticiones en {summary['elapsed_s']:.1f} s: "
+            f"{summary['throughput_rps']:.1f} req/s, errores {summary['error_rate']:.1%} {summary['statuses']}"
+        )
+        self.stdout.write(f"Latencia p50 {latency['p50']:.0f} ms  p95 {latency['p95']:.0f} ms  p99 {latency['p99']:.0f} ms")
+        if queries['mean'] is not None:
+            self.stdout.write(f"Consultas por petición: media {queries['mean']}, p95 {queries['p95']}, máx {queries['max']}")
+        else:
+            self.stdout.write('Consultas por petición: sin datos (activa QUERY_INSTRUMENTATION_HEADERS en el servidor)')
+        if summary['cache']:
+            self.stdout.write(f"Cache de respuestas: {summary['cache']}")
+        if 'openai' in summary:
+            self.stdout.write(
+                f"OpenAI simulado: {summary['openai']['responses']} respuestas, "
+                f"{summary['openai']['simulated_errors']} errores"
+            )
+        if 'writes' in summary:
+            writes = summary['writes']
+            self.stdout.write(
+                f"Escrituras ({'diferidas' if writes['write_behind'] else 'síncronas'}): {writes['rows']} mensajes, "
+                f"{writes['statements']} sentencias ({writes['statements_per_row']} por mensaje), "
+                f"{writes['commits']} commits ({writes['commits_per_row']} por mensaje)"
+            )
+
+
+def header_int(headers, name):
+    value = headers.get(name)
+    return int(value) if value is not None else None
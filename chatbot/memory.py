@@ -0,0 +1,138 @@
+# chatbot/memory.py
+"""
+Memoria acotada de las conversaciones del chatbot.
+
+El prompt incluye el resumen guardado en la conversación y sólo los mensajes
+posteriores a él. Cuando se acumulan suficientes mensajes fuera de la ventana
+reciente, se resumen en segundo plano junto con el resumen anterior, de modo
+que el tamaño del prompt no depende de la longitud de la conversación.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Conversation, Message
+from .transport import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Resume la siguiente conversación entre un cliente y el asistente de la tienda Buy n Large.
+Conserva los productos, marcas, precios, presupuestos y preferencias que haya mencionado el cliente y
+lo que ya se le respondió. Escribe en español, en un párrafo breve."""
+
+
+class ConversationMemory:
+    """
+    Selecciona el historial que se envía a OpenAI y programa los resúmenes.
+
+    recent_messages: mensajes más recientes que siempre se envían completos.
+    summary_batch: mensajes antiguos sin resumir que disparan un nuevo resumen.
+    El prompt nunca lleva más que el resumen y recent_messages + summary_batch mensajes.
+    """
+
+    def __init__(self, llm, recent_messages=8, summary_batch=8, summary_max_tokens=200, model='gpt-3.5-turbo'):
+        # ResilientLLM: los resúmenes comparten el circuit breaker, los reintentos y las métricas del chatbot
+        self.llm = llm
+        self.recent_messages = recent_messages
+        self.summary_batch = summary_batch
+        self.summary_max_tokens = summary_max_tokens
+        self.model = model
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chatbot-summary')
+        # Conversaciones con un resumen en curso, para no generarlo dos veces
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def load(self, conversation, exclude_id=None):
+        """
+        Devuelve (resumen, mensajes previos en orden cronológico) para la conversación.
+        exclude_id permite omitir el mensaje actual del usuario, que ya va en el prompt.
+        """
+        limit = self.recent_messages + self.summary_batch
+        newest_first = list(self.unsummarized_messages(conversation, exclude_id)[:limit])
+
+        if len(newest_first) >= limit:
+            # Los mensajes fuera de la ventana reciente pasan al resumen
+            self.schedule_summary(conversation.id, newest_first[self.recent_messages].id)
+
+        return conversation.summary, newest_first[::-1]
+
+    @staticmethod
+    def unsummarized_messages(conversation, exclude_id=None):
+        """
+        Mensajes posteriores al resumen, los más recientes primero; al limitarse se
+        resuelve con el índice (conversation, timestamp) sin leer todo el historial
+        """
+        queryset = conversation.messages.filter(id__gt=conversation.summary_message_id)
+        if exclude_id is not None:
+            queryset = queryset.exclude(id=exclude_id)
+        return queryset.order_by('-timestamp', '-id')
+
+    def schedule_summary(self, conversation_id, up_to_message_id):
+        """Genera en segundo plano el resumen hasta up_to_message_id (inclusive)"""
+        with self._lock:
+            if conversation_id in self._pending:
+                return
+            self._pending.add(conversation_id)
+        self._executor.submit(self._summarize_task, conversation_id, up_to_message_id)
+
+    def _summarize_task(self, conversation_id, up_to_message_id):
+        close_old_connections()
+        try:
+            self.summarize(conversation_id, up_to_message_id)
+        except CircuitOpenError:
+            # OpenAI no está disponible: se vuelve a intentar cuando otro mensaje lo programe
+            logger.info(f"Resumen de la conversación {conversation_id} omitido: circuito de OpenAI abierto")
+        except Exception as e:
+            logger.error(f"Error al resumir la conversación {conversation_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(conversation_id)
+            close_old_connections()
+
+    def summarize(self, conversation_id, up_to_message_id):
+        """Combina el resumen actual con los mensajes siguientes hasta up_to_message_id"""
+        conversation = Conversation.objects.only('summary', 'summary_message_id').get(id=conversation_id)
+        if conversation.summary_message_id >= up_to_message_id:
+            return
+
+        messages = Message.objects.filter(
+            conversation_id=conversation_id,
+            id__gt=conversation.summary_message_id,
+            id__lte=up_to_message_id
+        ).order_by('timestamp', 'id').values_list('sender', 'content')
+
+        transcript = '\n'.join(
+            f"{'Asistente' if sender == 'bot' else 'Cliente'}: {content}" for sender, content in messages
+        )
+        if conversation.summary:
+            transcript = f"Resumen previo: {conversation.summary}\n\n{transcript}"
+
+        response = self.llm.create(
+            model=self.model,
+            max_tokens=self.summary_max_tokens,
+            temperature=0.3,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript}
+            ]
+        )
+        summary = response.choices[0].message.content
+
+        # Sólo se guarda si nadie avanzó el resumen mientras tanto
+        updated = Conversation.objects.filter(
+            id=conversation_id, summary_message_id=conversation.summary_message_id
+        ).update(summary=summary, summary_message_id=up_to_message_id)
+        if updated:
+            logger.info(f"Conversación {conversation_id} resumida hasta el mensaje {up_to_message_id}")
+
+
+def build_conversation_memory(llm):
+    return ConversationMemory(
+        llm,
+        recent_messages=settings.CHATBOT_MEMORY_RECENT_MESSAGES,
+        summary_batch=settings.CHATBOT_MEMORY_SUMMARY_BATCH,
+        summary_max_tokens=settings.CHATBOT_MEMORY_SUMMARY_MAX_TOKENS
+    )
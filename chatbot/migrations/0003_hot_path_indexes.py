@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-17 16:17
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_sessions(apps, schema_editor):
+    """
+    Sin restricción única, get_or_create concurrente pudo crear varias conversaciones
+    con el mismo session_id. Sus mensajes pasan a la más antigua y el resto se elimina.
+    """
+    Conversation = apps.get_model('chatbot', 'Conversation')
+    Message = apps.get_model('chatbot', 'Message')
+
+    duplicates = (
+        Conversation.objects.values('session_id')
+        .annotate(total=Count('id'), first_id=Min('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        others = Conversation.objects.filter(session_id=duplicate['session_id']).exclude(id=duplicate['first_id'])
+        Message.objects.filter(conversation__in=others).update(conversation_id=duplicate['first_id'])
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_sessions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='conversation',
+            name='session_id',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp'], name='chatbot_msg_conv_ts_idx'),
+        ),
+    ]
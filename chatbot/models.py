@@ -1,12 +1,16 @@
 # chatbot/models.py
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
 class Conversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
-    session_id = models.CharField(max_length=100)
+    session_id = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Resumen de los mensajes hasta summary_message_id (inclusive), que lo reemplazan en el prompt
+    summary = models.TextField(blank=True, default='')
+    summary_message_id = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Conversation {self.id} - {self.created_at}"
@@ -21,10 +25,15 @@ class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     content = models.TextField()
     sender = models.CharField(max_length=10, choices=SENDER_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Se fija al crear la instancia y no al insertarla: con escritura diferida el mensaje se guarda después
+    timestamp = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"{self.sender}: {self.content[:30]}..."
 
     class Meta:
-        ordering = ['timestamp']
\ No newline at end of file
+        ordering = ['timestamp']
+        indexes = [
+            # Historial de una conversación en orden cronológico (y los más recientes primero)
+            models.Index(fields=['conversation', 'timestamp'], name='chatbot_msg_conv_ts_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,257 @@
+# chatbot/persistence.py
+"""
+Escritura diferida (write-behind) de los mensajes del chatbot.
+
+Con CHATBOT_MESSAGE_WRITE_BEHIND activo, las vistas encolan los mensajes en
+memoria en lugar de insertarlos durante la petición. Un hilo en segundo plano
+los guarda con `bulk_create` en transacciones de hasta `batch_size` filas,
+cada `interval` segundos o en cuanto se llena un lote.
+
+- Lectura de lo propio: antes de leer el historial de una conversación con
+  mensajes pendientes, `flush_conversation` los guarda de forma síncrona.
+- Ids reservados: antes de encolarlos, los mensajes reciben sus ids de la
+  secuencia de la tabla (`nextval` en PostgreSQL, `sqlite_sequence` en
+  SQLite), con una consulta por lote y sin insertar filas, así que las
+  respuestas informan el id definitivo de cada mensaje.
+- Hora del mensaje: `Message.timestamp` toma su valor al crear la instancia
+  durante la petición (`default=timezone.now`), no al insertarla; con
+  `auto_now_add`, `bulk_create` la fijaría al vaciar la cola y alteraría el
+  orden y los tiempos del historial.
+- Respaldo síncrono: si el modo está desactivado, el motor no permite
+  reservar ids, la cola está llena o el hilo no puede arrancar, los mensajes
+  se insertan en la misma petición.
+- Cierre: `close` (registrado con atexit) guarda lo pendiente antes de salir
+  del proceso. Lo que siga en la cola si el proceso muere de golpe se pierde;
+  por eso el modo es opcional.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+
+from buynlarge.metrics import registry, SIZE_BUCKETS
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_WRITES = registry.counter(
+    'chatbot_message_writes_total', 'Mensajes guardados por modo (sync, write_behind, fallback)', ('mode',)
+)
+FLUSH_ROWS = registry.histogram(
+    'chatbot_message_flush_rows', 'Mensajes por transacción de la escritura diferida', buckets=SIZE_BUCKETS
+)
+FLUSH_SECONDS = registry.histogram('chatbot_message_flush_duration_seconds', 'Duración de cada vaciado de la cola')
+PENDING_MESSAGES = registry.gauge('chatbot_message_pending', 'Mensajes en la cola de escritura diferida')
+
+
+class MessageWriter:
+    """Cola de mensajes guardada por un hilo en segundo plano con bulk_create en lotes"""
+
+    def __init__(self, enabled=False, batch_size=200, interval=0.5, max_pending=10000, using='default'):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.using = using
+        self.flushes = 0
+        self._pending = []
+        self._pending_by_conversation = Counter()
+        self._lock = threading.Lock()
+        # Un solo vaciado a la vez, sea del hilo o síncrono, para conservar el orden de los mensajes
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    def save(self, messages):
+        """
+        Guarda los mensajes (sin guardar, en orden) de forma diferida si el modo
+        está activo o, si no, en la misma petición. Devuelve True si se encolaron.
+        """
+        messages = list(messages)
+        if not messages:
+            return False
+        if not self.enabled:
+            self.write_now(messages, 'sync')
+            return False
+
+        try:
+            ids = self.reserve_ids(len(messages))
+        except Exception as e:
+            logger.error(f"Error al reservar ids para {len(messages)} mensajes: {str(e)}")
+            ids = None
+        if ids is None:
+            self.write_now(messages, 'fallback')
+            return False
+        for message, message_id in zip(messages, ids):
+            message.id = message_id
+
+        with self._lock:
+            queued = len(self._pending) + len(messages) <= self.max_pending and self._ensure_worker()
+            if queued:
+                self._pending.extend(messages)
+                for message in messages:
+                    self._pending_by_conversation[message.conversation_id] += 1
+                pending = len(self._pending)
+        if not queued:
+            logger.warning("Cola de escritura diferida llena o sin hilo: se guarda de forma síncrona")
+            self.write_now(messages, 'fallback')
+            return False
+
+        PENDING_MESSAGES.set(pending)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def reserve_ids(self, count):
+        """
+        Reserva `count` ids consecutivos de la secuencia de Message, que ya no se
+        asignarán a otras filas. Devuelve None si el motor no lo permite.
+        """
+        connection = connections[self.using]
+        table = Message._meta.db_table
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", [table, count]
+                )
+                return [row[0] for row in cursor.fetchall()]
+        if connection.vendor == 'sqlite':
+            # Las claves AUTOINCREMENT de SQLite nunca reutilizan un valor menor o igual al de sqlite_sequence
+            with transaction.atomic(using=self.using), connection.cursor() as cursor:
+                cursor.execute("UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s", [count, table])
+                if not cursor.rowcount:
+                    # Tabla sin filas insertadas todavía
+                    cursor.execute(
+                        f"INSERT INTO sqlite_sequence (name, seq) "
+                        f"SELECT %s, COALESCE(MAX(id), 0) + %s FROM {connection.ops.quote_name(table)}",
+                        [table, count]
+                    )
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                last = cursor.fetchone()[0]
+            return list(range(last - count + 1, last + 1))
+        return None
+
+    def write_now(self, messages, mode):
+        with transaction.atomic(using=self.using):
+            Message.objects.using(self.using).bulk_create(messages)
+        MESSAGE_WRITES.inc(len(messages), mode=mode)
+
+    def has_pending(self, conversation_id):
+        with self._lock:
+            return conversation_id in self._pending_by_conversation
+
+    def flush_conversation(self, conversation_id):
+        """
+        Guarda sólo los mensajes pendientes de la conversación (antes de leer su
+        historial), sin hacer esperar a la petición por los de las demás
+        """
+        if self.has_pending(conversation_id):
+            self.flush(conversation_id)
+
+    def flush(self, conversation_id=None):
+        """Guarda los mensajes pendientes (todos o los de una conversación) en transacciones de hasta batch_size filas"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if conversation_id is None:
+                        batch = self._pending[:self.batch_size]
+                    else:
+                        batch = [message for message in self._pending
+                                 if message.conversation_id == conversation_id][:self.batch_size]
+                if not batch:
+                    return
+                start = time.perf_counter()
+                try:
+                    with transaction.atomic(using=self.using):
+                        Message.objects.using(self.using).bulk_create(batch)
+                except IntegrityError:
+                    # Por ejemplo, una conversación borrada mientras tanto: se guardan de a uno y se descartan los inválidos
+                    self.write_one_by_one(batch)
+                except Exception as e:
+                    # Error transitorio: los mensajes siguen en la cola y se reintentan en el próximo vaciado
+                    logger.error(f"Error al guardar {len(batch)} mensajes diferidos: {str(e)}")
+                    raise
+                with self._lock:
+                    if conversation_id is None:
+                        del self._pending[:len(batch)]
+                    else:
+                        saved = set(map(id, batch))
+                        self._pending = [message for message in self._pending if id(message) not in saved]
+                    for message in batch:
+                        self._pending_by_conversation[message.conversation_id] -= 1
+                        if not self._pending_by_conversation[message.conversation_id]:
+                            del self._pending_by_conversation[message.conversation_id]
+                    pending = len(self._pending)
+                self.flushes += 1
+                MESSAGE_WRITES.inc(len(batch), mode='write_behind')
+                FLUSH_ROWS.observe(len(batch))
+                FLUSH_SECONDS.observe(time.perf_counter() - start)
+                PENDING_MESSAGES.set(pending)
+
+    def write_one_by_one(self, batch):
+        for message in batch:
+            try:
+                with transaction.atomic(using=self.using):
+                    message.save(using=self.using, force_insert=True)
+            except IntegrityError as e:
+                logger.error(f"Mensaje diferido descartado (conversación {message.conversation_id}): {str(e)}")
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _ensure_worker(self):
+        """Arranca el hilo si no está corriendo (llamado con _lock tomado)"""
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='chatbot-message-writer', daemon=True)
+        try:
+            self._thread.start()
+        except RuntimeError:
+            # Por ejemplo, durante el cierre del intérprete
+            self._thread = None
+            return False
+        if not self._atexit_registered:
+            atexit.register(self.close)
+            self._atexit_registered = True
+        return True
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+                close_old_connections()
+                try:
+                    self.flush()
+                except Exception:
+                    # Ya se registró en flush; se reintenta en el siguiente intervalo
+                    pass
+        finally:
+            connections.close_all()
+
+    def close(self, timeout=10.0):
+        """Detiene el hilo y guarda lo pendiente de forma síncrona"""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+
+def build_message_writer():
+    return MessageWriter(
+        enabled=settings.CHATBOT_MESSAGE_WRITE_BEHIND,
+        batch_size=settings.CHATBOT_MESSAGE_WRITE_BATCH_SIZE,
+        interval=settings.CHATBOT_MESSAGE_WRITE_INTERVAL,
+        max_pending=settings.CHATBOT_MESSAGE_WRITE_MAX_PENDING,
+    )
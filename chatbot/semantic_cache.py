@@ -0,0 +1,233 @@
+# chatbot/semantic_cache.py
+"""
+Cache semántico de respuestas del chatbot.
+
+Complementa al cache exacto (chatbot/cache.py) para reconocer paráfrasis
+("precio del galaxy s22" / "cuanto vale el samsung s22"). Una respuesta sólo
+se reutiliza si ambas preguntas coinciden en las intenciones detectadas
+(productos, marcas, categorías, precio, stock), los números y las palabras
+que cambian su sentido ("no", "sin", "baratas", "más de"). El resto del
+texto, sin las menciones ya comparadas ni palabras vacías, se representa
+localmente, sin APIs externas, con vectores de n-gramas de caracteres
+proyectados por hashing a una dimensión fija y normalizados; la búsqueda es
+un producto matriz-vector con NumPy sobre las preguntas respondidas
+recientemente.
+"""
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from django.conf import settings
+
+from buynlarge.metrics import registry
+from .cache import normalize_message
+
+LOOKUPS = registry.counter(
+    'chatbot_semantic_cache_lookups_total', 'Consultas al cache semántico de respuestas por resultado (hit, miss)',
+    ('result',)
+)
+ENTRIES = registry.gauge('chatbot_semantic_cache_entries', 'Preguntas indexadas en el cache semántico')
+
+_NUMBER_RE = re.compile(r'\d+')
+
+# Palabras que invierten o acotan la pregunta: deben coincidir para reutilizar una respuesta
+NEGATION_WORDS = {'no', 'sin', 'ni', 'nada', 'nunca', 'tampoco', 'ningun', 'ninguna', 'ninguno', 'excepto', 'salvo'}
+
+QUALIFIER_WORDS = {
+    'barato': 'barato', 'barata': 'barato', 'baratos': 'barato', 'baratas': 'barato',
+    'economico': 'barato', 'economica': 'barato', 'economicos': 'barato', 'economicas': 'barato',
+    'caro': 'caro', 'cara': 'caro', 'caros': 'caro', 'caras': 'caro',
+    'mas': 'mas', 'mayor': 'mas', 'menos': 'menos', 'menor': 'menos',
+    'mejor': 'mejor', 'mejores': 'mejor', 'peor': 'peor', 'peores': 'peor',
+    'nuevo': 'nuevo', 'nueva': 'nuevo', 'nuevos': 'nuevo', 'nuevas': 'nuevo',
+    'usado': 'usado', 'usada': 'usado', 'usados': 'usado', 'usadas': 'usado',
+    'oferta': 'oferta', 'ofertas': 'oferta', 'descuento': 'oferta', 'descuentos': 'oferta',
+}
+
+# Palabras que no distinguen una pregunta de otra
+STOP_WORDS = {
+    'que', 'cual', 'cuales', 'cuanto', 'cuanta', 'cuantos', 'cuantas', 'como', 'es', 'son', 'esta', 'estan',
+    'el', 'la', 'los', 'las', 'lo', 'un', 'una', 'unos', 'unas', 'de', 'del', 'al', 'a', 'en', 'con', 'por',
+    'para', 'y', 'o', 'me', 'te', 'se', 'mi', 'tu', 'su', 'sus', 'tienen', 'tiene', 'tenes', 'ustedes',
+    'hola', 'favor', 'porfa', 'quiero', 'saber', 'dime', 'decime', 'podrias', 'puedes', 'hay',
+}
+
+# Texto que representa a las preguntas descritas por completo por su guard
+EMPTY_QUESTION = '_'
+
+
+def question_terms(message, intents):
+    """
+    Palabras de la pregunta que el guard no compara: sin las menciones que
+    originaron las intenciones, números, negaciones, calificativos ni palabras vacías
+    """
+    text = normalize_message(message)
+    for mention in sorted(intents.mentions, key=len, reverse=True):
+        text = re.sub(rf'(?<!\w){re.escape(normalize_message(mention))}(?!\w)', ' ', text)
+    return [
+        word for word in text.split()
+        if not (word.isdigit() or word in STOP_WORDS or word in NEGATION_WORDS or word in QUALIFIER_WORDS)
+    ]
+
+
+class HashingVectorizer:
+    """Vectoriza texto con n-gramas de caracteres por palabra proyectados por hashing"""
+
+    def __init__(self, dimensions=512, ngram_range=(2, 4)):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+
+    def features(self, text):
+        for word in normalize_message(text).split():
+            padded = f' {word} '
+            # La palabra completa también cuenta como rasgo
+            yield padded
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for start in range(len(padded) - n + 1):
+                    yield padded[start:start + n]
+
+    def transform(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self.features(text):
+            # crc32 es estable entre procesos, a diferencia de hash()
+            vector[zlib.crc32(feature.encode('utf-8')) % self.dimensions] += 1.0
+        np.log1p(vector, out=vector)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """
+    Índice acotado de preguntas respondidas. Las entradas viven en arreglos
+    preasignados (max_entries x dimensions, float32) que se reutilizan como
+    buffer circular: al llenarse se reemplaza la entrada más antigua.
+    Todas las entradas pertenecen a la misma versión del catálogo; cuando ésta
+    cambia el índice se vacía.
+    """
+
+    def __init__(self, max_entries=10000, threshold=0.85, ttl=600, dimensions=512):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.vectorizer = HashingVectorizer(dimensions)
+
+        self.vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self.expires_at = np.zeros(max_entries, dtype=np.float64)
+        # Datos que deben coincidir para reutilizar una respuesta: intenciones, números y calificativos
+        self.guards = [None] * max_entries
+        self.responses = [None] * max_entries
+
+        self.catalog_version = None
+        self.size = 0
+        self.next_slot = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def guard(message, intents):
+        """
+        Una paráfrasis sólo es válida si se refiere a los mismos productos, marcas,
+        categorías y números ("s22" frente a "s23" se parecen mucho como texto),
+        pregunta lo mismo (precio, stock, categorías) y con las mismas negaciones
+        y calificativos ("¿qué laptops no tienen?", "¿qué laptops baratas tienen?")
+        """
+        words = normalize_message(message).split()
+        return (
+            tuple(intents.product_ids),
+            tuple(intents.related_brand_ids),
+            tuple(intents.categories),
+            intents.category_query,
+            intents.price,
+            intents.stock,
+            frozenset(_NUMBER_RE.findall(' '.join(words))),
+            frozenset(word for word in words if word in NEGATION_WORDS),
+            frozenset(QUALIFIER_WORDS[word] for word in words if word in QUALIFIER_WORDS)
+        )
+
+    def vectorize(self, message, intents):
+        return self.vectorizer.transform(' '.join(question_terms(message, intents)) or EMPTY_QUESTION)
+
+    def _reset(self, catalog_version):
+        self.catalog_version = catalog_version
+        self.size = 0
+        self.next_slot = 0
+        self.guards = [None] * self.max_entries
+        self.responses = [None] * self.max_entries
+        ENTRIES.set(0)
+
+    def lookup(self, message, intents, catalog_version, top_k=5):
+        """Devuelve la respuesta de la pregunta más parecida sobre el umbral o None"""
+        query = self.vectorize(message, intents)
+        guard = self.guard(message, intents)
+
+        with self._lock:
+            if catalog_version != self.catalog_version:
+                self._reset(catalog_version)
+
+            response = None
+            if self.size:
+                similarities = self.vectors[:self.size] @ query
+                k = min(top_k, self.size)
+                candidates = np.argpartition(similarities, -k)[-k:]
+                now = time.monotonic()
+                for index in candidates[np.argsort(similarities[candidates])[::-1]]:
+                    if similarities[index] < self.threshold:
+                        break
+                    if self.expires_at[index] > now and self.guards[index] == guard:
+                        response = self.responses[index]
+                        break
+
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        LOOKUPS.inc(result='miss' if response is None else 'hit')
+        return response
+
+    def add(self, message, intents, catalog_version, response):
+        vector = self.vectorize(message, intents)
+        guard = self.guard(message, intents)
+
+        with self._lock:
+            if catalog_version != self.catalog_version:
+                self._reset(catalog_version)
+
+            slot = self.next_slot
+            self.vectors[slot] = vector
+            self.expires_at[slot] = time.monotonic() + self.ttl
+            self.guards[slot] = guard
+            self.responses[slot] = response
+            self.next_slot = (slot + 1) % self.max_entries
+            self.size = min(self.size + 1, self.max_entries)
+            size = self.size
+        ENTRIES.set(size)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'entries': self.size,
+            'memory_bytes': self.vectors.nbytes + self.expires_at.nbytes
+        }
+
+
+def build_semantic_cache():
+    if not settings.CHATBOT_SEMANTIC_CACHE_ENABLED:
+        return None
+    return SemanticCache(
+        max_entries=settings.CHATBOT_SEMANTIC_CACHE_MAX_ENTRIES,
+        threshold=settings.CHATBOT_SEMANTIC_CACHE_THRESHOLD,
+        ttl=settings.CHATBOT_RESPONSE_CACHE_TTL,
+        dimensions=settings.CHATBOT_SEMANTIC_CACHE_DIMENSIONS
+    )
+
+
+semantic_cache = build_semantic_cache()
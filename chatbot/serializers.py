@@ -6,6 +6,7 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id', 'content', 'sender', 'timestamp']
+        read_only_fields = ['timestamp']
 
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -1,3 +1,1152 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
 
-# Create your tests here.
+import requests
+from django.core.management import call_command, CommandError
+from django.db import DatabaseError
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from openai import APITimeoutError, InternalServerError, OpenAI, Timeout
+
+from buynlarge.metrics import registry
+from buynlarge.testing import QueryBudgetMixin, QueryPlanMixin
+from buynlarge.text import fold_text
+from products.catalog import bump_catalog_version, get_catalog_snapshot
+from products.models import Category, Brand, Product
+from .cache import LOOKUPS, LocalMemoryBackend, ResponseCache, is_self_contained
+from .coalescing import COALESCED, AsyncSingleFlight, SingleFlight
+from .context import KEY_ALIASES, ContextCompactor, estimate_tokens, key_legend, serialize_context
+from .intents import AhoCorasick, IntentMatcher, get_intent_matcher
+from .loadtest import FakeOpenAIServer, LoadReport, load_corpus, plan_sessions
+from .memory import ConversationMemory
+from .models import Conversation, Message
+from .persistence import MessageWriter
+from .semantic_cache import LOOKUPS as SEMANTIC_LOOKUPS, SemanticCache
+from .transport import (
+    CALLS, CIRCUIT_OPEN_RESPONSE, CIRCUIT_OPENED, CIRCUIT_STATE, RETRIES, RETRIES_DENIED, CircuitBreaker,
+    CircuitOpenError, ResilientLLM, RetryBudget,
+)
+from .views import (COMPLETION_TOKENS, CONTEXT_BYTES, PROMPT_TOKENS, REQUEST_SECONDS, STAGE_SECONDS, TTFT_SECONDS,
+                    ChatbotAPIView, conversation_memory, llm as chatbot_llm)
+
+
+class ChatbotQueryPlanTests(QueryPlanMixin, TestCase):
+    """Las consultas de cada mensaje del chatbot deben resolverse con índices"""
+
+    watched_tables = ('chatbot_conversation', 'chatbot_message')
+
+    @classmethod
+    def setUpTestData(cls):
+        conversations = Conversation.objects.bulk_create(
+            Conversation(session_id=f'sesion-{index}') for index in range(1000)
+        )
+        Message.objects.bulk_create(
+            Message(conversation=conversation, content=f'Mensaje {turn}', sender='user' if turn % 2 == 0 else 'bot')
+            for conversation in conversations
+            for turn in range(10)
+        )
+        cls.conversation = conversations[500]
+        cls.analyze_database()
+
+    def test_session_lookup_uses_index(self):
+        self.assertNoFullTableScan(Conversation.objects.filter(session_id='sesion-500'), 'get_or_create por session_id')
+
+    def test_recent_messages_use_index(self):
+        queryset = ConversationMemory.unsummarized_messages(self.conversation, exclude_id=0)[:16]
+        self.assertNoFullTableScan(queryset, 'mensajes recientes de la conversación')
+
+    def test_conversation_history_uses_index(self):
+        self.assertNoFullTableScan(self.conversation.messages.all(), 'historial de la conversación')
+
+
+class IntentMatcherTests(TestCase):
+    """Detección de intenciones: acentos, mayúsculas, coincidencias superpuestas y múltiples"""
+
+    catalog = SimpleNamespace(
+        version=1,
+        categories={1: {'id': 1, 'name': 'Teléfonos'}, 2: {'id': 2, 'name': 'Computadoras'}},
+        brands={1: {'id': 1, 'name': 'Samsung'}, 2: {'id': 2, 'name': 'Apple'}},
+        products={
+            1: {'id': 1, 'name': 'Samsung Galaxy S22', 'brand_id': 1},
+            2: {'id': 2, 'name': 'Galaxy S22 Ultra', 'brand_id': 1},
+            3: {'id': 3, 'name': 'MacBook Pro', 'brand_id': 2},
+            4: {'id': 4, 'name': 'Galaxy A54 5G', 'brand_id': 1},
+        },
+    )
+
+    def test_fold_text(self):
+        self.assertEqual(fold_text('Teléfono'), 'telefono')
+        self.assertEqual(fold_text('¿CUÁNTO cuesta el MÓVIL?'), '¿cuanto cuesta el movil?')
+        self.assertEqual(fold_text('Año pingüino'), 'ano pinguino')
+
+    def test_overlapping_patterns(self):
+        automaton = AhoCorasick([('he', 'he'), ('she', 'she'), ('his', 'his'), ('hers', 'hers'), ('he', 'pronombre')])
+        self.assertEqual(automaton.find_all('ushers'), {'he', 'she', 'hers', 'pronombre'})
+        self.assertEqual(automaton.find_all('ahishe'), {'his', 'she', 'he', 'pronombre'})
+        self.assertEqual(automaton.find_all('xyz'), set())
+
+    def test_accents_are_ignored(self):
+        matcher = IntentMatcher(self.catalog)
+        for message in ('¿Tienen teléfonos?', 'tienen telefonos', 'TELÉFONO', 'un movil', 'un móvil'):
+            with self.subTest(message):
+                self.assertEqual(matcher.match(message).categories, ['teléfono'])
+        self.assertTrue(matcher.match('¿Cuánto cuesta?').price)
+        self.assertTrue(matcher.match('cuanto cuesta').price)
+        self.assertEqual(matcher.category_ids['teléfono'], [1])
+
+    def test_multiple_and_nested_matches(self):
+        matcher = IntentMatcher(self.catalog)
+        intents = matcher.match('Precio del Samsung Galaxy S22 Ultra y laptops Apple, ¿hay stock?')
+        # "Samsung Galaxy S22" contiene la marca y se superpone con "Galaxy S22 Ultra"
+        self.assertEqual(intents.product_ids, [1, 2])
+        self.assertEqual(intents.brand_ids, [1, 2])
+        self.assertEqual(intents.categories, ['computadora'])
+        self.assertTrue(intents.price and intents.stock)
+        self.assertFalse(intents.category_query)
+
+        self.assertFalse(matcher.match('hola, buenos días'))
+
+    def test_model_codes(self):
+        matcher = IntentMatcher(self.catalog)
+        # "a54" sólo aparece en un producto; "s22" en dos, así que no identifica a ninguno
+        self.assertEqual(matcher.model_codes, {'a54': 4})
+        intents = matcher.match('¿Cuánto vale el Samsung A54?')
+        self.assertEqual(intents.product_ids, [4])
+        self.assertEqual(intents.related_brand_ids, [1])
+        self.assertIn('a54', intents.mentions)
+        self.assertTrue(intents.price)
+        self.assertEqual(matcher.match('samsung s22').product_ids, [])
+        # Sólo palabras completas
+        self.assertEqual(matcher.match('a540').product_ids, [])
+
+
+class SemanticCacheTests(TestCase):
+    """Cache semántico: paráfrasis que se reutilizan y preguntas parecidas que no"""
+
+    catalog = SimpleNamespace(
+        version=1,
+        categories={1: {'id': 1, 'name': 'Teléfonos'}, 2: {'id': 2, 'name': 'Computadoras'}},
+        brands={1: {'id': 1, 'name': 'Samsung'}, 2: {'id': 2, 'name': 'Apple'}},
+        products={
+            1: {'id': 1, 'name': 'Galaxy S22', 'brand_id': 1},
+            2: {'id': 2, 'name': 'MacBook Pro', 'brand_id': 2},
+        },
+    )
+
+    def setUp(self):
+        registry.reset()
+        self.matcher = IntentMatcher(self.catalog)
+        self.cache = SemanticCache(max_entries=100, dimensions=512)
+
+    def answer(self, message, response):
+        self.cache.add(message, self.matcher.match(message), 1, response)
+
+    def lookup(self, message):
+        return self.cache.lookup(message, self.matcher.match(message), 1)
+
+    def test_paraphrases_hit(self):
+        pairs = [
+            ('precio del galaxy s22', 'cuanto vale el samsung s22'),
+            ('precio del galaxy s22', '¿Cuál es el precio del Galaxy S22?'),
+            ('¿qué laptops tienen?', 'laptops que tienen'),
+            ('¿el macbook pro viene con cargador?', 'el MacBook Pro viene con cargador?'),
+        ]
+        for original, paraphrase in pairs:
+            with self.subTest(paraphrase):
+                self.cache = SemanticCache(max_entries=100, dimensions=512)
+                self.answer(original, 'respuesta')
+                self.assertEqual(self.lookup(paraphrase), 'respuesta')
+
+    def test_near_misses_are_rejected(self):
+        pairs = [
+            ('¿qué laptops tienen?', '¿qué laptops no tienen?'),
+            ('¿qué laptops tienen?', '¿qué laptops baratas tienen?'),
+            ('cual es el precio del macbook pro', 'cual es el stock del macbook pro'),
+            ('laptops de más de 1000', 'laptops de menos de 1000'),
+            ('precio del galaxy s22', 'precio del galaxy s23'),
+            ('precio del galaxy s22', 'precio de samsung'),
+            ('teléfonos sin cargador', 'teléfonos con cargador'),
+            ('¿el macbook pro viene con cargador?', '¿el macbook pro tiene garantía?'),
+        ]
+        for original, near_miss in pairs:
+            with self.subTest(near_miss):
+                self.cache = SemanticCache(max_entries=100, dimensions=512)
+                self.answer(original, 'respuesta')
+                self.assertIsNone(self.lookup(near_miss))
+
+    def test_guard_compares_intents_and_qualifiers(self):
+        def guard(message):
+            return SemanticCache.guard(message, self.matcher.match(message))
+
+        self.assertEqual(guard('precio del galaxy s22'), guard('cuanto vale el samsung s22'))
+        self.assertNotEqual(guard('precio del macbook pro'), guard('stock del macbook pro'))
+        self.assertNotEqual(guard('¿qué laptops tienen?'), guard('¿qué laptops no tienen?'))
+        self.assertEqual(guard('laptops baratas'), guard('laptops económicas'))
+
+    def test_lookups_are_exported(self):
+        self.answer('precio del galaxy s22', 'respuesta')
+        self.lookup('cuanto vale el samsung s22')
+        self.lookup('stock del galaxy s22')
+        self.assertEqual((SEMANTIC_LOOKUPS.value(result='hit'), SEMANTIC_LOOKUPS.value(result='miss')), (1, 1))
+        body = registry.render()
+        self.assertIn('chatbot_semantic_cache_lookups_total{result="hit"} 1', body)
+        self.assertIn('chatbot_semantic_cache_entries 1', body)
+
+    @patch('chatbot.views.response_cache', None)
+    def test_used_without_exact_cache(self):
+        category = Category.objects.create(name='Computadoras')
+        brand = Brand.objects.create(name='Lenovo')
+        Product.objects.create(name='ThinkPad X1', description='Laptop', price=1500, stock=3,
+                               category=category, brand=brand)
+        bump_catalog_version()
+
+        def ask(message, session_id):
+            response = self.client.post('/api/chatbot/', {'message': message, 'session_id': session_id})
+            return response['X-Chatbot-Cache']
+
+        with patch('chatbot.views.semantic_cache', self.cache), \
+                patch('chatbot.views.client.chat.completions.create',
+                      return_value=fake_completion('Tenemos laptops')) as create:
+            self.assertEqual([ask('¿Qué laptops tienen?', 'uno'), ask('laptops que tienen', 'dos')], ['MISS', 'HIT'])
+        self.assertEqual(create.call_count, 1)
+
+    def test_catalog_change_empties_the_index(self):
+        self.answer('precio del galaxy s22', 'respuesta')
+        message = 'cuanto vale el samsung s22'
+        self.assertIsNone(self.cache.lookup(message, self.matcher.match(message), 2))
+        self.assertEqual(self.cache.size, 0)
+
+
+class ContextCompactorTests(TestCase):
+    """Compactación del contexto: presupuesto de tokens, prioridad de lo mencionado y claves abreviadas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        computers = Category.objects.create(name='Computadoras', description='Equipos de escritorio y portátiles')
+        phones = Category.objects.create(name='Teléfonos')
+        brands = [Brand.objects.create(name=name) for name in ('Lenovo', 'Dell', 'Samsung')]
+        Product.objects.bulk_create(
+            Product(name=f'Equipo {index}', description='Laptop de prueba ' * 20, price=500 + index, stock=index % 4,
+                    category=computers if index % 3 else phones, brand=brands[index % 3])
+            for index in range(300)
+        )
+        cls.view = ChatbotAPIView()
+
+    def setUp(self):
+        bump_catalog_version()
+
+    def compact(self, message, budget):
+        catalog = get_catalog_snapshot()
+        intents = get_intent_matcher(catalog).match(message)
+        context = self.view.get_relevant_context(message)
+        return json.loads(ContextCompactor(budget).compact(context, intents, catalog)), context
+
+    def keys(self, value):
+        if isinstance(value, dict):
+            return set(value).union(*(self.keys(item) for item in value.values()))
+        if isinstance(value, list):
+            return set().union(*(self.keys(item) for item in value))
+        return set()
+
+    def test_respects_token_budget(self):
+        for budget in (300, 1000, 4000):
+            with self.subTest(budget=budget):
+                compacted, context = self.compact('¿Qué laptops Dell tienen y a qué precio? ¿Hay stock?', budget)
+                self.assertLessEqual(estimate_tokens(serialize_context(compacted)), budget)
+                self.assertGreater(estimate_tokens(serialize_context(context)), budget)
+        # Con poco presupuesto se conservan primero las secciones de las intenciones detectadas
+        compacted, _ = self.compact('¿Qué laptops Dell tienen?', 300)
+        self.assertEqual(list(compacted)[:2], ['brand_info', 'computadora_products'])
+        products = compacted['computadora_products']['products']
+        self.assertEqual(products[0]['brand'], 'Dell')
+        self.assertNotIn('image_url', products[0])
+
+    def test_aliases_do_not_collide_with_context_keys(self):
+        self.assertEqual(len(set(KEY_ALIASES.values())), len(KEY_ALIASES))
+        messages = ('¿Qué categorías tienen?', 'laptops Dell', 'precio del Equipo 7', '¿hay stock de teléfonos?')
+        original_keys = set().union(*(self.keys(self.view.get_relevant_context(message)) for message in messages))
+        self.assertTrue(set(KEY_ALIASES) & original_keys)
+        self.assertFalse(set(KEY_ALIASES.values()) & original_keys)
+
+        compacted, _ = self.compact('laptops Dell', 4000)
+        self.assertEqual(compacted['brand_info']['n_total'], 100)
+        self.assertIn('n_total=total_products', key_legend())
+
+
+def fake_completion(text='Respuesta de prueba'):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+@patch('chatbot.views.response_cache', None)
+@patch('chatbot.views.semantic_cache', None)
+class ChatbotQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Presupuesto de consultas de los endpoints del chatbot"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computadoras')
+        brand = Brand.objects.create(name='Lenovo')
+        Product.objects.bulk_create(
+            Product(name=f'ThinkPad {index}', description='Laptop', price=1000 + index, stock=index,
+                    category=category, brand=brand)
+            for index in range(50)
+        )
+        cls.conversation = Conversation.objects.create(session_id='presupuesto')
+        Message.objects.bulk_create(
+            Message(conversation=cls.conversation, content=f'Mensaje {turn}', sender='user' if turn % 2 == 0 else 'bot')
+            for turn in range(10)
+        )
+
+    @patch('chatbot.views.client.chat.completions.create', return_value=fake_completion())
+    def test_chatbot_message(self, create):
+        # El primer mensaje construye el snapshot del catálogo; se mide con el snapshot ya construido
+        self.client.post('/api/chatbot/', {'message': 'hola', 'session_id': 'precalentar'})
+        with self.assertQueryBudget(4, 'ChatbotAPIView'):
+            response = self.client.post('/api/chatbot/', {'message': '¿Qué laptops Lenovo tienen?',
+                                                         'session_id': 'presupuesto'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_conversation_history(self):
+        with self.assertQueryBudget(2, 'historial de la conversación'):
+            response = self.client.get('/api/chatbot/conversations/presupuesto/')
+        self.assertEqual(len(response.data['messages']), 10)
+
+
+@patch('chatbot.views.response_cache', None)
+@patch('chatbot.views.semantic_cache', None)
+@override_settings(METRICS_ENABLED=True)
+class ChatbotMetricsTests(TestCase):
+    """Etapas de cada mensaje en la cabecera Server-Timing y métricas en /metrics"""
+
+    def setUp(self):
+        registry.reset()
+        category = Category.objects.create(name='Computadoras')
+        brand = Brand.objects.create(name='Lenovo')
+        Product.objects.create(name='ThinkPad X1', description='Laptop', price=1500, stock=3,
+                               category=category, brand=brand)
+
+    def test_stage_timings_and_metrics(self):
+        completion = fake_completion()
+        completion.usage = SimpleNamespace(prompt_tokens=900, completion_tokens=120)
+        with patch('chatbot.views.client.chat.completions.create', return_value=completion):
+            response = self.client.post('/api/chatbot/', {'message': '¿Qué laptops tienen?', 'session_id': 'metricas'})
+        self.assertEqual(response.status_code, 200)
+
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['conversation', 'user_message', 'intents', 'cache_lookup', 'context', 'memory',
+                                  'prompt', 'openai', 'bot_message', 'total'])
+        self.assertEqual(STAGE_SECONDS.snapshot(view='sync', stage='openai')[1], 1)
+        self.assertEqual(PROMPT_TOKENS.snapshot(), (900, 1))
+        self.assertEqual(COMPLETION_TOKENS.snapshot(), (120, 1))
+        self.assertEqual(CONTEXT_BYTES.snapshot()[1], 1)
+
+        metrics = self.client.get('/metrics')
+        self.assertEqual(metrics['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = metrics.content.decode()
+        self.assertIn('# TYPE chatbot_stage_duration_seconds histogram', body)
+        self.assertIn('chatbot_stage_duration_seconds_bucket{view="sync",stage="context",le="+Inf"} 1', body)
+        self.assertIn('chatbot_request_duration_seconds_count{view="sync",cache="BYPASS",status="200"} 1', body)
+        self.assertIn('chatbot_prompt_tokens_bucket{le="1024"} 1', body)
+        self.assertIn('chatbot_completion_tokens_bucket{le="64"} 0', body)
+
+    def test_intents_are_matched_once_per_request(self):
+        with patch('chatbot.views.response_cache', ResponseCache(LocalMemoryBackend(), ttl=60)), \
+                patch('chatbot.views.client.chat.completions.create', return_value=fake_completion()), \
+                patch.object(IntentMatcher, 'match', autospec=True, side_effect=IntentMatcher.match) as match:
+            response = self.client.post('/api/chatbot/', {'message': '¿Qué laptops tienen?', 'session_id': 'una-vez'})
+        self.assertEqual(response['X-Chatbot-Cache'], 'MISS')
+        # Cache, agrupación, contexto y compactación usan las mismas intenciones
+        self.assertEqual(match.call_count, 1)
+
+    def test_openai_error_is_timed(self):
+        with patch('chatbot.views.client.chat.completions.create', side_effect=RuntimeError('caído')):
+            response = self.client.post('/api/chatbot/', {'message': 'hola', 'session_id': 'metricas-error'})
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('openai;dur=', response['Server-Timing'])
+        self.assertEqual(REQUEST_SECONDS.snapshot(view='sync', cache='BYPASS', status=500)[1], 1)
+
+    @override_settings(METRICS_ENABLED=False, CHATBOT_SERVER_TIMING=False)
+    def test_disabled(self):
+        with patch('chatbot.views.client.chat.completions.create', return_value=fake_completion()):
+            response = self.client.post('/api/chatbot/', {'message': 'hola', 'session_id': 'metricas-off'})
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_ips(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 404)
+
+
+@patch('chatbot.views.response_cache', None)
+@patch('chatbot.views.semantic_cache', None)
+class ConversationMemoryTests(TestCase):
+    """Resumen y ventana reciente de la memoria de las conversaciones"""
+
+    def setUp(self):
+        self.client_mock = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=None)))
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        llm = ResilientLLM(self.client_mock, self.breaker, RetryBudget())
+        self.memory = ConversationMemory(llm, recent_messages=4, summary_batch=4)
+        self.conversation = Conversation.objects.create(session_id='memoria')
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, content=f'Mensaje {turn}',
+                                   sender='user' if turn % 2 == 0 else 'bot')
+            for turn in range(12)
+        ]
+
+    def contents(self, messages):
+        return [message.content for message in messages]
+
+    def test_summary_replaces_summarized_messages(self):
+        Conversation.objects.filter(id=self.conversation.id).update(
+            summary='El cliente busca una laptop', summary_message_id=self.messages[7].id
+        )
+        self.conversation.refresh_from_db()
+        with patch.object(self.memory, 'schedule_summary') as schedule_summary:
+            summary, previous = self.memory.load(self.conversation)
+        self.assertEqual(summary, 'El cliente busca una laptop')
+        self.assertEqual(self.contents(previous), ['Mensaje 8', 'Mensaje 9', 'Mensaje 10', 'Mensaje 11'])
+        schedule_summary.assert_not_called()
+
+    def test_old_messages_are_scheduled_for_summary(self):
+        with patch.object(self.memory, 'schedule_summary') as schedule_summary:
+            summary, previous = self.memory.load(self.conversation, exclude_id=self.messages[11].id)
+        self.assertEqual(summary, '')
+        # Ventana de recent_messages + summary_batch mensajes sin el actual
+        self.assertEqual(self.contents(previous), [f'Mensaje {turn}' for turn in range(3, 11)])
+        # Todo lo anterior a los 4 mensajes más recientes pasa al resumen
+        schedule_summary.assert_called_once_with(self.conversation.id, self.messages[6].id)
+
+    def test_summarize_combines_previous_summary(self):
+        Conversation.objects.filter(id=self.conversation.id).update(
+            summary='Resumen previo', summary_message_id=self.messages[1].id
+        )
+        with patch.object(self.client_mock.chat.completions, 'create',
+                          return_value=fake_completion('Resumen nuevo')) as create:
+            self.memory.summarize(self.conversation.id, self.messages[5].id)
+        transcript = create.call_args.kwargs['messages'][1]['content']
+        self.assertTrue(transcript.startswith('Resumen previo: Resumen previo'))
+        self.assertIn('Cliente: Mensaje 2', transcript)
+        self.assertIn('Asistente: Mensaje 5', transcript)
+        self.assertNotIn('Mensaje 1\n', transcript)
+        self.assertNotIn('Mensaje 6', transcript)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'Resumen nuevo')
+        self.assertEqual(self.conversation.summary_message_id, self.messages[5].id)
+        _, previous = self.memory.load(self.conversation)
+        self.assertEqual(self.contents(previous), [f'Mensaje {turn}' for turn in range(6, 12)])
+
+        # Un resumen que ya quedó atrás no llama a OpenAI
+        with patch.object(self.client_mock.chat.completions, 'create') as create:
+            self.memory.summarize(self.conversation.id, self.messages[3].id)
+        create.assert_not_called()
+
+    def test_concurrent_summary_is_not_overwritten(self):
+        def concurrent_summary(**kwargs):
+            # Otro proceso guarda un resumen más avanzado mientras éste espera a OpenAI
+            Conversation.objects.filter(id=self.conversation.id).update(
+                summary='Resumen concurrente', summary_message_id=self.messages[9].id
+            )
+            return fake_completion('Resumen atrasado')
+
+        with patch.object(self.client_mock.chat.completions, 'create', side_effect=concurrent_summary):
+            self.memory.summarize(self.conversation.id, self.messages[5].id)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'Resumen concurrente')
+        self.assertEqual(self.conversation.summary_message_id, self.messages[9].id)
+
+    def test_open_circuit_skips_summary(self):
+        self.breaker.record_failure()
+        with patch.object(self.client_mock.chat.completions, 'create') as create, \
+                self.assertLogs('chatbot.memory', 'INFO') as logs:
+            self.memory._summarize_task(self.conversation.id, self.messages[5].id)
+        create.assert_not_called()
+        self.assertIn('circuito de OpenAI abierto', logs.output[0])
+        self.conversation.refresh_from_db()
+        self.assertEqual((self.conversation.summary, self.conversation.summary_message_id), ('', 0))
+
+    def test_views_summarize_through_the_resilient_client(self):
+        self.assertIs(conversation_memory.llm, chatbot_llm)
+
+    def test_summary_is_scheduled_once_per_conversation(self):
+        with patch.object(self.memory, '_executor') as executor:
+            self.memory.schedule_summary(self.conversation.id, self.messages[5].id)
+            self.memory.schedule_summary(self.conversation.id, self.messages[7].id)
+        executor.submit.assert_called_once_with(self.memory._summarize_task, self.conversation.id,
+                                                self.messages[5].id)
+
+    def test_prompt_has_summary_and_recent_window(self):
+        Conversation.objects.filter(id=self.conversation.id).update(
+            summary='El cliente busca una laptop', summary_message_id=self.messages[5].id
+        )
+        with patch('chatbot.views.conversation_memory', self.memory), \
+                patch.object(self.memory, 'schedule_summary'), \
+                patch('chatbot.views.client.chat.completions.create', return_value=fake_completion()) as create:
+            response = self.client.post('/api/chatbot/', {'message': 'Mensaje actual', 'session_id': 'memoria'})
+        self.assertEqual(response.status_code, 200)
+
+        prompt = create.call_args.kwargs['messages']
+        self.assertEqual(prompt[1], {'role': 'system', 'content':
+                                     'Resumen de la conversación anterior con el cliente: El cliente busca una laptop'})
+        history = [message['content'] for message in prompt[2:-1]]
+        self.assertEqual(history, [f'Mensaje {turn}' for turn in range(6, 12)])
+        self.assertEqual([message['role'] for message in prompt[2:4]], ['user', 'assistant'])
+        self.assertIn('Mensaje actual', prompt[-1]['content'])
+
+
+class FakeOpenAIServerTests(TestCase):
+    """Servidor OpenAI simulado: distribuciones de latencia, errores y ejecución en segundo plano"""
+
+    def test_latency_distributions(self):
+        fixed = FakeOpenAIServer(latency_ms=300, latency_distribution='fixed')
+        self.assertEqual({fixed.sample_latency() for _ in range(10)}, {0.3})
+
+        lognormal = FakeOpenAIServer(latency_ms=300, jitter_ms=150, latency_distribution='lognormal', seed=1)
+        samples = sorted(lognormal.sample_latency() for _ in range(2000))
+        self.assertAlmostEqual(samples[1000], 0.3, delta=0.03)
+        # Cola larga: el p99 está mucho más lejos de la mediana que el p1
+        self.assertGreater(samples[1980] - samples[1000], samples[1000] - samples[20])
+
+        with self.assertRaises(ValueError):
+            FakeOpenAIServer(latency_distribution='exponencial')
+
+    def test_errors_and_completions_over_http(self):
+        server = FakeOpenAIServer(latency_ms=0, jitter_ms=0, error_rate=1.0, error_statuses=[429])
+        url = server.start_in_background()
+        self.addCleanup(server.stop)
+        payload = {'model': 'gpt-3.5-turbo', 'messages': [{'role': 'user', 'content': 'hola'}]}
+
+        response = requests.post(f'{url}/chat/completions', json=payload, timeout=5)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['error']['type'], 'rate_limit_error')
+
+        server.error_rate = 0.0
+        server.response_text = 'uno dos tres'
+        response = requests.post(f'{url}/chat/completions', json=payload, timeout=5)
+        self.assertEqual(response.json()['choices'][0]['message']['content'], 'uno dos tres')
+        self.assertEqual((server.requests_served, server.errors_served), (1, 1))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class OpenAITransportTests(TestCase):
+    """Reintentos con presupuesto, plazos y circuit breaker contra el servidor OpenAI simulado"""
+
+    def setUp(self):
+        registry.reset()
+        self.server = FakeOpenAIServer(latency_ms=0, jitter_ms=0, latency_distribution='fixed',
+                                       error_rate=1.0, error_statuses=[503])
+        url = self.server.start_in_background()
+        self.addCleanup(self.server.stop)
+        self.openai = OpenAI(api_key='test', base_url=url, max_retries=0)
+        self.addCleanup(self.openai.close)
+
+    def llm(self, breaker=None, budget=None, **options):
+        options.setdefault('backoff', 0.001)
+        return ResilientLLM(self.openai, breaker or CircuitBreaker(), budget or RetryBudget(), **options)
+
+    def create(self, llm):
+        return llm.create(model='gpt-3.5-turbo', messages=[{'role': 'user', 'content': 'hola'}])
+
+    def test_retries_transient_errors(self):
+        llm = self.llm(max_retries=2)
+        with self.assertRaises(InternalServerError):
+            self.create(llm)
+        self.assertEqual(self.server.errors_served, 3)
+        self.assertEqual(RETRIES.value(reason='503'), 2)
+
+        self.server.error_rate = 0.0
+        self.assertTrue(self.create(llm).choices[0].message.content)
+        self.assertEqual((CALLS.value(outcome='error'), CALLS.value(outcome='success')), (1, 1))
+
+    def test_retry_budget_limits_retries(self):
+        llm = self.llm(budget=RetryBudget(ratio=0.0, min_retries=1), max_retries=3)
+        for _ in range(2):
+            with self.assertRaises(InternalServerError):
+                self.create(llm)
+        # Un único reintento disponible en la ventana: 2 llamadas + 1 reintento
+        self.assertEqual(self.server.errors_served, 3)
+        self.assertEqual(RETRIES_DENIED.value(reason='budget'), 2)
+
+    def test_read_deadline(self):
+        self.server.error_rate = 0.0
+        self.server.latency_ms = 1000
+        llm = self.llm(timeout=Timeout(5.0, read=0.2), deadline=0.3, max_retries=3)
+        with self.assertRaises(APITimeoutError):
+            self.create(llm)
+        self.assertEqual(RETRIES.value(reason='timeout'), 1)
+        self.assertEqual(RETRIES_DENIED.value(reason='deadline'), 1)
+
+    def test_circuit_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        llm = self.llm(breaker=breaker, max_retries=0)
+        for _ in range(2):
+            with self.assertRaises(InternalServerError):
+                self.create(llm)
+        self.assertEqual(breaker.status()['state'], 'open')
+        self.assertEqual(CIRCUIT_STATE.value(), 2)
+
+        with self.assertRaises(CircuitOpenError):
+            self.create(llm)
+        self.assertEqual(self.server.errors_served, 2)
+        self.assertEqual(CALLS.value(outcome='rejected'), 1)
+
+        # Pasado reset_timeout, una llamada de prueba fallida vuelve a abrir el circuito
+        clock.now += 31
+        with self.assertRaises(InternalServerError):
+            self.create(llm)
+        self.assertEqual(breaker.status()['state'], 'open')
+
+        clock.now += 31
+        self.server.error_rate = 0.0
+        self.create(llm)
+        self.assertEqual(breaker.status(), {'state': 'closed', 'consecutive_failures': 0, 'retry_after': None})
+        self.assertEqual(CIRCUIT_OPENED.value(), 2)
+
+    @patch('chatbot.views.response_cache', None)
+    @patch('chatbot.views.semantic_cache', None)
+    def test_open_circuit_returns_canned_response(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        with patch('chatbot.views.llm', self.llm(breaker=breaker)):
+            response = self.client.post('/api/chatbot/', {'message': 'hola', 'session_id': 'circuito'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data['response'], CIRCUIT_OPEN_RESPONSE)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.server.requests_served + self.server.errors_served, 0)
+        with self.settings(METRICS_ENABLED=True):
+            self.assertIn('chatbot_openai_circuit_state 2', self.client.get('/metrics').content.decode())
+
+
+class ResponseCacheTests(TestCase):
+    """Cache exacto de respuestas: TTL, desalojo LRU, mensajes autocontenidos y versión del catálogo"""
+
+    def setUp(self):
+        registry.reset()
+        self.clock = FakeClock()
+        self.matcher = IntentMatcher(IntentMatcherTests.catalog)
+
+    def test_ttl_and_lru_eviction(self):
+        backend = LocalMemoryBackend(max_entries=2, clock=self.clock)
+        backend.set('a', 'A', ttl=10)
+        backend.set('b', 'B', ttl=10)
+        self.assertEqual(backend.get('a'), 'A')
+        # "b" es la menos usada: la desaloja la tercera entrada
+        backend.set('c', 'C', ttl=10)
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), ('A', None, 'C'))
+
+        self.clock.now += 10
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(len(backend), 1)
+
+    def test_self_contained_messages(self):
+        cases = {
+            'precio del MacBook Pro': True,
+            '¿Está disponible el Galaxy S22 Ultra?': True,
+            '¿y ese cuánto cuesta?': False,
+            'quiero otro teléfono': False,
+            'hola, gracias': False,
+        }
+        for message, expected in cases.items():
+            with self.subTest(message):
+                self.assertIs(is_self_contained(message, self.matcher.match(message)), expected)
+
+    def test_key_normalizes_message_and_includes_catalog_version(self):
+        intents = self.matcher.match('¿Qué laptops tienen?')
+        key = ResponseCache.make_key('¿Qué LAPTOPS tienen?', intents, 1)
+        self.assertEqual(key, ResponseCache.make_key('que laptops  tienen', intents, 1))
+        self.assertNotEqual(key, ResponseCache.make_key('que laptops tienen', intents, 2))
+        self.assertNotEqual(key, ResponseCache.make_key('que laptops tienen', self.matcher.match('precio de laptops'), 1))
+
+        cache = ResponseCache(LocalMemoryBackend(), ttl=60)
+        cache.set(key, 'Tenemos laptops')
+        self.assertEqual(cache.get(key), 'Tenemos laptops')
+        self.assertIsNone(cache.get(ResponseCache.make_key('que laptops tienen', intents, 2)))
+        self.assertEqual((LOOKUPS.value(result='hit'), LOOKUPS.value(result='miss')), (1, 1))
+        self.assertIn('chatbot_response_cache_lookups_total{result="hit"} 1', registry.render())
+
+    @patch('chatbot.views.semantic_cache', None)
+    @patch('chatbot.views.client.chat.completions.create', return_value=fake_completion('Tenemos laptops'))
+    def test_catalog_change_invalidates_answers(self, create):
+        category = Category.objects.create(name='Computadoras')
+        brand = Brand.objects.create(name='Lenovo')
+        product = Product.objects.create(name='ThinkPad X1', description='Laptop', price=1500, stock=3,
+                                         category=category, brand=brand)
+        bump_catalog_version()
+
+        def ask(session_id):
+            response = self.client.post('/api/chatbot/', {'message': '¿Qué laptops tienen?', 'session_id': session_id})
+            return response['X-Chatbot-Cache']
+
+        with patch('chatbot.views.response_cache', ResponseCache(LocalMemoryBackend(), ttl=60)):
+            self.assertEqual([ask('uno'), ask('dos')], ['MISS', 'HIT'])
+            with self.captureOnCommitCallbacks(execute=True):
+                product.price = 1400
+                product.save()
+            self.assertEqual(ask('tres'), 'MISS')
+        self.assertEqual(create.call_count, 2)
+
+    def test_answers_that_used_history_are_not_shared(self):
+        category = Category.objects.create(name='Computadoras')
+        brand = Brand.objects.create(name='Lenovo')
+        Product.objects.create(name='ThinkPad X1', description='Laptop', price=1500, stock=3,
+                               category=category, brand=brand)
+        bump_catalog_version()
+        answers = [fake_completion('Hola, Ana'), fake_completion('Ana, para tu presupuesto de $900 tenemos...'),
+                   fake_completion('Tenemos laptops desde $1500')]
+
+        def ask(message, session_id):
+            return self.client.post('/api/chatbot/', {'message': message, 'session_id': session_id})
+
+        with patch('chatbot.views.response_cache', ResponseCache(LocalMemoryBackend(), ttl=60)) as cache, \
+                patch('chatbot.views.semantic_cache', SemanticCache(max_entries=100)), \
+                patch('chatbot.views.client.chat.completions.create', side_effect=answers) as create:
+            ask('Hola, soy Ana y tengo $900', 'ana')
+            # Mensaje autocontenido en un turno posterior: se busca en el cache, pero el prompt lleva el historial
+            later = ask('¿Qué laptops tienen?', 'ana')
+            self.assertEqual(later['X-Chatbot-Cache'], 'MISS')
+
+            other = ask('¿Qué laptops tienen?', 'otra-sesion')
+        self.assertEqual(other['X-Chatbot-Cache'], 'MISS')
+        self.assertEqual(other.data['response'], 'Tenemos laptops desde $1500')
+        prompt = json.dumps(create.call_args.kwargs['messages'], ensure_ascii=False)
+        self.assertNotIn('Ana', prompt)
+        self.assertNotIn('$900', prompt)
+        # Se guardaron los primeros turnos de cada sesión, no la respuesta que usó el historial
+        self.assertEqual(len(cache.backend._entries), 2)
+        self.assertNotIn('presupuesto', repr(list(cache.backend._entries.values())))
+
+
+class SingleFlightTests(TestCase):
+    """Las llamadas concurrentes con la misma clave comparten una sola ejecución"""
+
+    def setUp(self):
+        registry.reset()
+
+    def test_threads_share_one_call(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_answer():
+            calls.append(1)
+            release.wait(5)
+            return 'respuesta'
+
+        flights = SingleFlight(timeout=5)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            futures = [pool.submit(flights.run, 'clave', slow_answer) for _ in range(5)]
+            while flights.in_flight() == 0 or COALESCED.value(role='follower') < 4:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+        self.assertEqual({text for text, _ in results}, {'respuesta'})
+        self.assertEqual(flights.in_flight(), 0)
+
+    def test_errors_reach_every_waiter(self):
+        flights = SingleFlight(timeout=5)
+        release = threading.Event()
+
+        def failing():
+            release.wait(5)
+            raise RuntimeError('caído')
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flights.run, 'clave', failing)
+            while flights.in_flight() == 0:
+                time.sleep(0.01)
+            follower = pool.submit(flights.run, 'clave', failing)
+            time.sleep(0.05)
+            release.set()
+            for future in (leader, follower):
+                with self.assertRaisesMessage(RuntimeError, 'caído'):
+                    future.result()
+        # La siguiente llamada vuelve a ejecutarse
+        self.assertEqual(flights.run('clave', lambda: 'ok'), ('ok', False))
+
+    def test_async_leader_cancellation_keeps_the_call(self):
+        calls = []
+
+        async def slow_answer():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'respuesta'
+
+        async def scenario():
+            flights = AsyncSingleFlight(timeout=5)
+            leader = asyncio.ensure_future(flights.run('clave', slow_answer))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(flights.run('clave', slow_answer)) for _ in range(3)]
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await asyncio.gather(*followers), flights.in_flight()
+
+        results, in_flight = asyncio.run(scenario())
+        self.assertEqual(results, [('respuesta', True)] * 3)
+        self.assertEqual((len(calls), in_flight), (1, 0))
+
+
+@patch('chatbot.views.response_cache', None)
+@patch('chatbot.views.semantic_cache', None)
+class AsyncChatbotViewTests(TransactionTestCase):
+    """La vista asíncrona responde como la síncrona: historial, validación y errores de OpenAI"""
+
+    def setUp(self):
+        # Un solo hilo para la base de datos: la base de pruebas en memoria no admite escrituras concurrentes
+        executor = patch('chatbot.views.db_executor', ThreadPoolExecutor(max_workers=1))
+        executor.start()
+        self.addCleanup(executor.stop)
+
+    async def post(self, data):
+        return await AsyncClient().post('/api/chatbot/async/', data, content_type='application/json')
+
+    async def test_replies_and_keeps_history(self):
+        completions = [fake_completion('Hola, ¿en qué te ayudo?'), fake_completion('Tenemos laptops')]
+        with patch('chatbot.views.async_client.chat.completions.create', AsyncMock(side_effect=completions)) as create:
+            first = await self.post({'message': 'Hola', 'session_id': 'asincrona'})
+            second = await self.post({'message': '¿Qué laptops tienen?', 'session_id': 'asincrona'})
+
+        self.assertEqual(first.status_code, 200)
+        data = second.json()
+        self.assertEqual(data['response'], 'Tenemos laptops')
+        self.assertEqual(data['conversation_id'], first.json()['conversation_id'])
+        bot_message = await Message.objects.aget(pk=data['message_id'])
+        self.assertEqual(bot_message.sender, 'bot')
+        # El segundo turno envía a OpenAI el primero como historial
+        prompt = create.call_args.kwargs['messages']
+        self.assertEqual([message['content'] for message in prompt[1:3]], ['Hola', 'Hola, ¿en qué te ayudo?'])
+        self.assertEqual(await Message.objects.filter(conversation__session_id='asincrona').acount(), 4)
+
+    async def test_invalid_requests(self):
+        self.assertEqual((await self.post({'message': 'Hola'})).status_code, 400)
+        response = await AsyncClient().post('/api/chatbot/async/', '{no es json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_openai_error(self):
+        with patch('chatbot.views.async_client.chat.completions.create', AsyncMock(side_effect=RuntimeError('caído'))), \
+                self.assertLogs('chatbot.views', 'ERROR'):
+            response = await self.post({'message': 'Hola', 'session_id': 'con-error'})
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('problemas técnicos', response.json()['response'])
+
+
+def stream_chunks(*contents, error=None):
+    """Transmisión simulada de OpenAI: un fragmento por texto y, opcionalmente, un error al final"""
+    async def chunks():
+        for content in contents:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+        if error is not None:
+            raise error
+    return chunks()
+
+
+class ChatbotStreamTests(TransactionTestCase):
+    """Transmisión por SSE: tiempo hasta el primer token, respuestas vacías y fallos a mitad de la respuesta"""
+
+    def setUp(self):
+        registry.reset()
+        executor = patch('chatbot.views.db_executor', ThreadPoolExecutor(max_workers=1))
+        executor.start()
+        self.addCleanup(executor.stop)
+        breaker = patch('chatbot.views.async_llm.breaker', CircuitBreaker(failure_threshold=2))
+        self.breaker = breaker.start()
+        self.addCleanup(breaker.stop)
+
+    async def stream(self, stream, message='Hola'):
+        with patch('chatbot.views.async_client.chat.completions.create', AsyncMock(return_value=stream)), \
+                patch('chatbot.views.ChatbotMixin.store_cached_response') as store:
+            response = await AsyncClient().post('/api/chatbot/stream/', {'message': message, 'session_id': 'sse'},
+                                                content_type='application/json')
+            body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        events = [(block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+                  for block in body.strip().split('\n\n')]
+        return events, store
+
+    async def test_streams_tokens_and_records_ttft(self):
+        events, store = await self.stream(stream_chunks('Tenemos ', 'laptops'))
+        self.assertEqual([event for event, _ in events], ['token', 'token', 'done'])
+        self.assertIsInstance(events[-1][1]['ttft_ms'], int)
+        self.assertEqual(TTFT_SECONDS.snapshot()[1], 1)
+        self.assertIn('chatbot_ttft_seconds_count 1', registry.render())
+        self.assertEqual(CALLS.value(outcome='success'), 1)
+        store.assert_called_once()
+        self.assertEqual((await Message.objects.aget(pk=events[-1][1]['message_id'])).content, 'Tenemos laptops')
+
+    async def test_empty_reply_is_not_cached(self):
+        events, store = await self.stream(stream_chunks())
+        self.assertEqual(events[-1][0], 'done')
+        self.assertIsNone(events[-1][1]['ttft_ms'])
+        self.assertEqual(TTFT_SECONDS.snapshot()[1], 0)
+        store.assert_not_called()
+
+    async def test_mid_stream_failure_counts_for_the_breaker(self):
+        # Por ejemplo, la conexión se corta a mitad de la respuesta
+        error = ConnectionResetError('conexión cortada')
+        for _ in range(2):
+            with self.assertLogs('chatbot.views', 'ERROR'):
+                events, store = await self.stream(stream_chunks('Tenemos ', error=error))
+            self.assertEqual([event for event, _ in events], ['token', 'error'])
+            store.assert_not_called()
+        self.assertEqual(CALLS.value(outcome='error'), 2)
+        self.assertEqual(CALLS.value(outcome='success'), 0)
+        self.assertEqual(self.breaker.state, 'open')
+
+
+@patch('chatbot.views.response_cache', None)
+@patch('chatbot.views.semantic_cache', None)
+class RequestCoalescingTests(TransactionTestCase):
+    """Primeros mensajes idénticos y simultáneos en la vista asíncrona comparten una llamada a OpenAI"""
+
+    async def test_identical_first_turns_share_one_openai_call(self):
+        calls = []
+
+        async def slow_completion(**kwargs):
+            calls.append(kwargs['messages'])
+            await asyncio.sleep(0.2)
+            return fake_completion('Tenemos laptops desde $899.99')
+
+        # Un solo hilo para la base de datos: la base de pruebas en memoria no admite escrituras concurrentes
+        with patch('chatbot.views.db_executor', ThreadPoolExecutor(max_workers=1)), \
+                patch('chatbot.views.async_client.chat.completions.create', side_effect=slow_completion):
+            client = AsyncClient()
+            responses = await asyncio.gather(*[
+                client.post('/api/chatbot/async/', {'message': '¿Qué laptops tienen?', 'session_id': f'campana-{index}'},
+                            content_type='application/json')
+                for index in range(4)
+            ] + [
+                client.post('/api/chatbot/async/', {'message': 'Hola', 'session_id': 'otra-pregunta'},
+                            content_type='application/json')
+            ])
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        statuses = sorted(response['X-Chatbot-Cache'] for response in responses[:4])
+        self.assertEqual(statuses, ['BYPASS', 'COALESCED', 'COALESCED', 'COALESCED'])
+        self.assertEqual({response.json()['response'] for response in responses[:4]}, {'Tenemos laptops desde $899.99'})
+        # Cada conversación guarda su propia respuesta
+        bot_messages = Message.objects.filter(sender='bot', conversation__session_id__startswith='campana-')
+        self.assertEqual(await bot_messages.acount(), 4)
+
+
+class MessageWriterTests(TransactionTestCase):
+    """Escritura diferida de mensajes: lotes, lectura de lo propio, respaldo síncrono y cierre"""
+
+    def setUp(self):
+        self.conversation = Conversation.objects.create(session_id='diferida')
+        self.other = Conversation.objects.create(session_id='otra')
+
+    def writer(self, **options):
+        writer = MessageWriter(enabled=True, **{'batch_size': 3, 'interval': 60, **options})
+        self.addCleanup(writer.close)
+        return writer
+
+    def messages(self, conversation, count):
+        return [Message(conversation=conversation, content=f'Mensaje {index}', sender='user') for index in range(count)]
+
+    def wait_until_saved(self, writer):
+        deadline = time.monotonic() + 5
+        while writer.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_full_batch_is_flushed_in_background(self):
+        writer = self.writer()
+        self.assertTrue(writer.save(self.messages(self.conversation, 2)))
+        self.assertEqual((writer.pending(), Message.objects.count()), (2, 0))
+
+        writer.save(self.messages(self.other, 2))
+        self.wait_until_saved(writer)
+        self.assertEqual(Message.objects.count(), 4)
+        # Un lote de 3 y el mensaje restante, cada uno en su transacción
+        self.assertEqual(writer.flushes, 2)
+        self.assertEqual(list(self.conversation.messages.order_by('id').values_list('content', flat=True)),
+                         ['Mensaje 0', 'Mensaje 1'])
+
+    def test_flush_conversation_and_close(self):
+        writer = self.writer(batch_size=100)
+        writer.save(self.messages(self.conversation, 2) + self.messages(self.other, 1))
+        writer.flush_conversation(self.conversation.id)
+        self.assertEqual(self.conversation.messages.count(), 2)
+        self.assertFalse(writer.has_pending(self.conversation.id))
+        self.assertEqual(writer.pending(), 1)
+
+        writer.close()
+        self.assertEqual(self.other.messages.count(), 1)
+
+    def test_synchronous_fallback(self):
+        writer = self.writer(max_pending=2)
+        self.assertFalse(writer.save(self.messages(self.conversation, 3)))
+        self.assertEqual(Message.objects.count(), 3)
+        writer.enabled = False
+        self.assertFalse(writer.save(self.messages(self.conversation, 1)))
+        self.assertEqual(Message.objects.count(), 4)
+
+    def test_invalid_rows_do_not_block_the_queue(self):
+        writer = self.writer(batch_size=100)
+        writer.save(self.messages(self.conversation, 1) + self.messages(self.other, 1))
+        Conversation.objects.filter(pk=self.other.pk).delete()
+        with self.assertLogs('chatbot.persistence', 'ERROR'):
+            writer.flush()
+        self.assertEqual((Message.objects.count(), writer.pending()), (1, 0))
+
+    @patch('chatbot.views.response_cache', None)
+    @patch('chatbot.views.semantic_cache', None)
+    @patch('chatbot.views.client.chat.completions.create', return_value=fake_completion())
+    def test_chatbot_view_with_write_behind(self, create):
+        with patch('chatbot.views.message_writer', self.writer(batch_size=100)) as writer:
+            response = self.client.post('/api/chatbot/', {'message': 'hola', 'session_id': 'diferida'})
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(Message.objects.exists())
+            message_id = response.data['message_id']
+            self.assertIsNotNone(message_id)
+
+            # El siguiente turno ve el anterior en el historial enviado a OpenAI
+            self.client.post('/api/chatbot/', {'message': '¿y laptops?', 'session_id': 'diferida'})
+            prompt = create.call_args.kwargs['messages']
+            self.assertEqual([message['content'] for message in prompt[1:3]], ['hola', 'Respuesta de prueba'])
+
+            # El historial guarda sólo los mensajes pendientes de su conversación
+            writer.save(self.messages(self.other, 1))
+            history = self.client.get('/api/chatbot/conversations/diferida/')
+            self.assertEqual(writer.pending(), 1)
+        self.assertEqual([message['sender'] for message in history.data['messages']], ['user', 'bot', 'user', 'bot'])
+        self.assertEqual(Message.objects.get(id=message_id).content, 'Respuesta de prueba')
+
+    def test_timestamp_is_set_when_queued(self):
+        writer = self.writer(batch_size=100)
+        queued = self.messages(self.conversation, 1)
+        queued_at = queued[0].timestamp
+        writer.save(queued)
+        time.sleep(0.01)
+        writer.flush()
+        self.assertEqual(Message.objects.get(id=queued[0].id).timestamp, queued_at)
+
+    @patch('chatbot.views.response_cache', None)
+    @patch('chatbot.views.semantic_cache', None)
+    @patch('chatbot.views.client.chat.completions.create', return_value=fake_completion())
+    def test_flush_error_returns_error_payload(self, create):
+        writer = self.writer(batch_size=100)
+        writer.save(self.messages(self.conversation, 1))
+        with patch('chatbot.views.message_writer', writer), \
+                patch.object(writer, 'flush_conversation', side_effect=DatabaseError('sin conexión')), \
+                self.assertLogs('chatbot.views', 'ERROR'):
+            response = self.client.post('/api/chatbot/', {'message': 'hola', 'session_id': 'diferida'})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data['error'], 'sin conexión')
+        create.assert_not_called()
+        # El mensaje del usuario queda encolado igual, detrás del turno anterior
+        writer.flush()
+        self.assertEqual(list(self.conversation.messages.order_by('id').values_list('content', flat=True)),
+                         ['Mensaje 0', 'hola'])
+
+    def test_ids_are_reserved_before_queueing(self):
+        writer = self.writer(batch_size=100)
+        queued = self.messages(self.conversation, 2)
+        writer.save(queued)
+        self.assertEqual(queued[1].id, queued[0].id + 1)
+        # Las inserciones síncronas no reutilizan los ids reservados
+        saved = Message.objects.create(conversation=self.other, content='Síncrono', sender='user')
+        self.assertGreater(saved.id, queued[1].id)
+        later = self.messages(self.conversation, 1)
+        writer.save(later)
+        self.assertGreater(later[0].id, saved.id)
+
+        writer.flush()
+        self.assertEqual(list(self.conversation.messages.order_by('id').values_list('id', flat=True)),
+                         [queued[0].id, queued[1].id, later[0].id])
+
+    def test_backend_without_reservable_ids_writes_synchronously(self):
+        writer = self.writer()
+        with patch.object(writer, 'reserve_ids', return_value=None):
+            self.assertFalse(writer.save(self.messages(self.conversation, 2)))
+        self.assertEqual((writer.pending(), Message.objects.count()), (0, 2))
+
+
+class LoadTestHarnessTests(TransactionTestCase):
+    """Corpus, plan de sesiones, resumen y prueba de carga completa contra el servidor simulado"""
+
+    def test_corpus_and_session_plan(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as corpus:
+            corpus.write(json.dumps({'request_id': 'r-1', 'title': 'Laptops', 'body': '¿Qué laptops tienen?'}) + '\n')
+            corpus.write('\n' + json.dumps({'message': 'Hola', 'session_id': 'fija'}) + '\n')
+            corpus.write(json.dumps({'title': 'Sólo título'}) + '\n')
+        self.addCleanup(os.remove, corpus.name)
+        items = load_corpus(corpus.name)
+        self.assertEqual([item['message'] for item in items], ['¿Qué laptops tienen?', 'Hola', 'Sólo título'])
+
+        plan = dict(plan_sessions(items, sessions=2, iterations=2))
+        self.assertEqual(len(plan), 3)
+        self.assertEqual(sum(len(messages) for messages in plan.values()), 6)
+        self.assertEqual(next(messages for session, messages in plan.items() if session.endswith('-fija')),
+                         ['Hola', 'Hola'])
+
+    def test_report_summary(self):
+        report = LoadReport()
+        for latency in range(1, 101):
+            report.record(latency, 500 if latency > 95 else 200, queries=5, cache_status='MISS')
+        report.elapsed = 2.0
+        summary = report.summary()
+        self.assertEqual((summary['requests'], summary['throughput_rps'], summary['error_rate']), (100, 50.0, 0.05))
+        self.assertAlmostEqual(summary['latency_ms']['p50'], 50.5)
+        self.assertAlmostEqual(summary['latency_ms']['p99'], 99.0, delta=0.1)
+        self.assertEqual(summary['queries_per_request']['max'], 5)
+
+    @patch('chatbot.views.response_cache', None)
+    @patch('chatbot.views.semantic_cache', None)
+    def test_in_process_load_test(self):
+        # Una sesión a la vez: la base de datos de pruebas en memoria no admite escrituras concurrentes
+        output = StringIO()
+        call_command('load_test_chatbot', sessions=16, concurrency=1, latency_ms=5, jitter_ms=0,
+                     latency_distribution='fixed', json=True, stdout=output, stderr=StringIO())
+        summary = json.loads(output.getvalue())
+        self.assertEqual(summary['requests'], 32)
+        self.assertEqual(summary['statuses'], {'200': 32})
+        self.assertEqual(summary['openai']['responses'], 32)
+        self.assertGreater(summary['queries_per_request']['mean'], 0)
+        self.assertFalse(Conversation.objects.exists())
+
+
+class ContextBenchmarkTests(TestCase):
+    """El benchmark de get_relevant_context cubre cada intención y detecta regresiones frente a la línea base"""
+
+    def test_benchmark_output_and_baseline(self):
+        directory = tempfile.mkdtemp()
+        output = os.path.join(directory, 'context.json')
+        call_command('bench_chatbot_context', sizes=[200], repeat=2, output=output, stdout=StringIO())
+        with open(output, encoding='utf-8') as file:
+            results = json.load(file)['results']
+
+        rows = {row['case']: row for row in results}
+        self.assertEqual(rows['snapshot']['products'], 200)
+        for case in ('categorias', 'categoria', 'marca', 'producto', 'precio', 'stock', 'combinada'):
+            self.assertLessEqual(set(rows[case]['expected_intents']), set(rows[case]['intents']), case)
+            self.assertEqual(rows[case]['queries'], 0, case)
+            self.assertGreater(rows[case]['context_bytes'], rows[case]['prompt_bytes'] / 2, case)
+        self.assertEqual(rows['sin_intencion']['intents'], [])
+        self.assertFalse(Product.objects.exists())
+
+        baseline = os.path.join(directory, 'baseline.json')
+        for row in results:
+            row['p50_ms'] = 0.0001
+        with open(baseline, 'w', encoding='utf-8') as file:
+            json.dump({'results': results}, file)
+        with self.assertRaisesMessage(CommandError, 'Regresiones'):
+            call_command('bench_chatbot_context', sizes=[200], repeat=2, baseline=baseline, stdout=StringIO())
@@ -0,0 +1,400 @@
+# chatbot/transport.py
+"""
+Transporte resiliente hacia OpenAI.
+
+Los clientes se crean con un pool de conexiones HTTP acotado y plazos de
+conexión, lectura, escritura y espera del pool, sin los reintentos internos
+de la librería. `ResilientLLM` agrega sobre ellos:
+
+- un plazo total por llamada (`deadline`), que también acota el tiempo de
+  lectura de cada intento;
+- reintentos con backoff exponencial y jitter completo ante timeouts, errores
+  de conexión, 429 y 5xx, respetando Retry-After;
+- un presupuesto global de reintentos (`RetryBudget`): sólo se reintenta
+  mientras los reintentos de la ventana no superen una fracción de las
+  llamadas, para que los reintentos no multipliquen la carga cuando el
+  servicio ya está saturado;
+- un circuit breaker (`CircuitBreaker`): tras varias llamadas fallidas
+  seguidas rechaza las siguientes con `CircuitOpenError` sin tocar la red
+  y, pasado `reset_timeout`, deja pasar una sola llamada de prueba. Las
+  respuestas transmitidas cuentan al terminar la transmisión, no al abrirla.
+
+El estado del circuito y los contadores de llamadas y reintentos se publican
+en /metrics (`chatbot_openai_*`).
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from openai import (
+    APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, DEFAULT_CONNECTION_LIMITS, DefaultAsyncHttpxClient,
+    DefaultHttpxClient, OpenAI, Timeout,
+)
+
+from buynlarge.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Códigos que indican un problema transitorio del servicio
+RETRYABLE_STATUS = {408, 409, 429}
+
+# Respuesta enlatada mientras el circuito está abierto
+CIRCUIT_OPEN_RESPONSE = ("En este momento nuestro asistente no está disponible. "
+                         "Por favor, inténtalo de nuevo en unos minutos.")
+
+CALLS = registry.counter(
+    'chatbot_openai_calls_total', 'Llamadas a OpenAI por resultado (success, error, rejected)', ('outcome',)
+)
+RETRIES = registry.counter(
+    'chatbot_openai_retries_total', 'Reintentos de llamadas a OpenAI por motivo', ('reason',)
+)
+RETRIES_DENIED = registry.counter(
+    'chatbot_openai_retries_denied_total', 'Reintentos descartados por presupuesto agotado o plazo vencido', ('reason',)
+)
+CIRCUIT_STATE = registry.gauge(
+    'chatbot_openai_circuit_state', 'Estado del circuit breaker de OpenAI (0 cerrado, 1 semiabierto, 2 abierto)'
+)
+CIRCUIT_OPENED = registry.counter('chatbot_openai_circuit_opened_total', 'Veces que se abrió el circuito de OpenAI')
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada se rechaza sin contactar a OpenAI"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Servicio de OpenAI no disponible; reintentar en {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+class RetryBudget:
+    """
+    Presupuesto de reintentos en una ventana deslizante: se permite reintentar
+    mientras los reintentos sean menos que `min_retries` más `ratio` veces las
+    llamadas de la ventana.
+    """
+
+    def __init__(self, ratio=0.1, min_retries=3, window=10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._retries = deque()
+
+    def _expire(self, now):
+        for events in (self._calls, self._retries):
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+    def record_call(self):
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            self._calls.append(now)
+
+    def try_retry(self):
+        """Reserva un reintento si el presupuesto lo permite"""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._calls):
+                return False
+            self._retries.append(now)
+            return True
+
+    def status(self):
+        with self._lock:
+            self._expire(self.clock())
+            return {'calls': len(self._calls), 'retries': len(self._retries),
+                    'available': max(0, int(self.min_retries + self.ratio * len(self._calls)) - len(self._retries))}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de tres estados. Cerrado: las llamadas pasan y se cuentan
+    los fallos seguidos; con `failure_threshold` se abre. Abierto: `allow`
+    lanza CircuitOpenError hasta que pasa `reset_timeout`. Semiabierto: pasa
+    una sola llamada de prueba; si funciona el circuito se cierra y si falla
+    vuelve a abrirse.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        CIRCUIT_STATE.set(STATE_VALUES[CLOSED])
+
+    def _transition(self, state):
+        if state != self.state:
+            logger.warning(f"Circuito de OpenAI: {self.state} -> {state}")
+            self.state = state
+            CIRCUIT_STATE.set(STATE_VALUES[state])
+            if state == OPEN:
+                CIRCUIT_OPENED.inc()
+
+    def allow(self):
+        """Autoriza una llamada o lanza CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.reset_timeout - self.clock()
+                if remaining > 0:
+                    raise CircuitOpenError(remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(self.reset_timeout)
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._transition(CLOSED)
+
+    def release(self):
+        """Termina una llamada sin resultado (cancelada): libera la prueba del estado semiabierto"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self._transition(OPEN)
+
+    def status(self):
+        with self._lock:
+            retry_after = None
+            if self.state == OPEN:
+                retry_after = max(0.0, self.opened_at + self.reset_timeout - self.clock())
+            return {'state': self.state, 'consecutive_failures': self.failures, 'retry_after': retry_after}
+
+
+def failure_reason(error):
+    """Motivo de un error transitorio (timeout, connection, 429, 5xx...) o None si no debe reintentarse"""
+    if isinstance(error, APIConnectionError):
+        return 'timeout' if isinstance(error, APITimeoutError) else 'connection'
+    if isinstance(error, APIStatusError):
+        if error.status_code in RETRYABLE_STATUS or error.status_code >= 500:
+            return str(error.status_code)
+    return None
+
+
+def retry_after_seconds(error):
+    """Segundos indicados por la cabecera Retry-After de la respuesta, si existe"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientLLM:
+    """
+    Envuelve un cliente de OpenAI (síncrono con `create`, asíncrono con
+    `acreate`). El cliente se consulta en cada llamada, así que cambiar su
+    `base_url` o parchear `client.chat.completions.create` sigue funcionando.
+    """
+
+    def __init__(self, client, breaker, budget, timeout=None, deadline=45.0,
+                 max_retries=2, backoff=0.5, backoff_max=8.0, clock=time.monotonic):
+        self.client = client
+        self.breaker = breaker
+        self.budget = budget
+        self.timeout = timeout or Timeout(30.0, connect=5.0)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.clock = clock
+
+    def create(self, **params):
+        self.begin()
+        started = self.clock()
+        attempt = 0
+        while True:
+            try:
+                response = self.client.chat.completions.create(timeout=self.attempt_timeout(started), **params)
+            except Exception as e:
+                delay = self.handle_error(e, attempt, started)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self.record_success()
+            return response
+
+    async def acreate(self, **params):
+        self.begin()
+        started = self.clock()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = await self.client.chat.completions.create(
+                        timeout=self.attempt_timeout(started), **params
+                    )
+                except Exception as e:
+                    delay = self.handle_error(e, attempt, started)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                if params.get('stream'):
+                    # Abrir la transmisión no prueba que el servicio responda: el resultado se registra al terminarla
+                    return MonitoredStream(response, self)
+                self.record_success()
+                return response
+        except asyncio.CancelledError:
+            # El cliente se desconectó (durante la llamada o la espera): no dice nada de la salud del servicio
+            self.breaker.release()
+            raise
+
+    def begin(self):
+        """Autoriza la llamada en el circuito y la cuenta en el presupuesto de reintentos"""
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            CALLS.inc(outcome='rejected')
+            raise
+        self.budget.record_call()
+
+    def attempt_timeout(self, started):
+        """Plazos del intento: el de lectura no supera lo que queda del plazo total de la llamada"""
+        remaining = self.deadline - (self.clock() - started)
+        read = max(0.1, min(self.timeout.read, remaining)) if self.timeout.read else max(0.1, remaining)
+        return Timeout(connect=self.timeout.connect, read=read, write=self.timeout.write, pool=self.timeout.pool)
+
+    def handle_error(self, error, attempt, started):
+        """
+        Decide si reintentar: devuelve la espera antes del siguiente intento o
+        relanza el error (registrando el fallo en el circuito si es transitorio)
+        """
+        reason = failure_reason(error)
+        if reason is None:
+            CALLS.inc(outcome='error')
+            if isinstance(error, APIStatusError):
+                # Error del pedido (400, 401...): el servicio respondió, así que no cuenta como fallo
+                self.breaker.record_success()
+            else:
+                self.breaker.release()
+            raise error
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        denied = None
+        if attempt >= self.max_retries:
+            denied = 'attempts'
+        elif self.clock() - started + delay >= self.deadline:
+            denied = 'deadline'
+        elif not self.budget.try_retry():
+            denied = 'budget'
+        if denied:
+            if attempt < self.max_retries:
+                RETRIES_DENIED.inc(reason=denied)
+            CALLS.inc(outcome='error')
+            self.breaker.record_failure()
+            raise error
+
+        RETRIES.inc(reason=reason)
+        logger.info(f"Reintentando la llamada a OpenAI en {delay:.2f} s (intento {attempt + 2}, motivo {reason})")
+        return delay
+
+    def record_success(self):
+        CALLS.inc(outcome='success')
+        self.breaker.record_success()
+
+    def status(self):
+        """Estado del circuito y del presupuesto de reintentos"""
+        return {'circuit': self.breaker.status(), 'retry_budget': self.budget.status()}
+
+
+class MonitoredStream:
+    """
+    Transmisión de una respuesta de OpenAI (`acreate(stream=True)`) que registra
+    su resultado en el circuito al terminar: un corte a mitad de la respuesta
+    cuenta como fallo y una transmisión abandonada por el cliente no cuenta.
+    """
+
+    def __init__(self, stream, llm):
+        self.stream = stream
+        self.llm = llm
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            self.llm.breaker.release()
+            raise
+        except Exception:
+            CALLS.inc(outcome='error')
+            self.llm.breaker.record_failure()
+            raise
+        self.llm.record_success()
+
+
+def openai_timeout():
+    """Plazos de conexión, lectura, escritura y espera de una conexión libre del pool"""
+    return Timeout(
+        connect=settings.OPENAI_CONNECT_TIMEOUT,
+        read=settings.OPENAI_READ_TIMEOUT,
+        write=settings.OPENAI_WRITE_TIMEOUT,
+        pool=settings.OPENAI_POOL_TIMEOUT,
+    )
+
+
+def build_openai_clients():
+    """Devuelve (cliente síncrono, cliente asíncrono) con el pool y los plazos configurados, sin reintentos internos"""
+    # Clase Limits del cliente HTTP que usa la librería de OpenAI
+    limits = type(DEFAULT_CONNECTION_LIMITS)(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    options = {'timeout': openai_timeout(), 'limits': limits}
+    common = {'api_key': settings.OPENAI_API_KEY, 'base_url': settings.OPENAI_BASE_URL,
+              'timeout': options['timeout'], 'max_retries': 0}
+    return (
+        OpenAI(http_client=DefaultHttpxClient(**options), **common),
+        AsyncOpenAI(http_client=DefaultAsyncHttpxClient(**options), **common),
+    )
+
+
+def build_resilient_llm(client, breaker, budget):
+    return ResilientLLM(
+        client, breaker, budget,
+        timeout=openai_timeout(),
+        deadline=settings.OPENAI_DEADLINE,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        backoff=settings.OPENAI_RETRY_BACKOFF,
+        backoff_max=settings.OPENAI_RETRY_BACKOFF_MAX,
+    )
+
+
+def build_circuit_breaker():
+    return CircuitBreaker(settings.OPENAI_BREAKER_FAILURE_THRESHOLD, settings.OPENAI_BREAKER_RESET_TIMEOUT)
+
+
+def build_retry_budget():
+    return RetryBudget(settings.OPENAI_RETRY_BUDGET_RATIO, settings.OPENAI_RETRY_BUDGET_MIN_RETRIES,
+                       settings.OPENAI_RETRY_BUDGET_WINDOW)
@@ -1,8 +1,11 @@
 # chatbot/urls.py
 from django.urls import path
-from .views import ChatbotAPIView, ConversationHistoryView
+from django.views.decorators.csrf import csrf_exempt
+from .views import ChatbotAPIView, AsyncChatbotView, ChatbotStreamView, ConversationHistoryView
 
 urlpatterns = [
     path('', ChatbotAPIView.as_view(), name='chatbot-api'),
+    path('async/', csrf_exempt(AsyncChatbotView.as_view()), name='chatbot-async-api'),
+    path('stream/', csrf_exempt(ChatbotStreamView.as_view()), name='chatbot-stream-api'),
     path('conversations/<str:session_id>/', ConversationHistoryView.as_view(), name='conversation-history'),
 ]
\ No newline at end of file
@@ -3,451 +3,602 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Conversation, Message
-from products.models import Product, Category, Brand, ProductSpecification
+from products.catalog import get_catalog_snapshot, PRODUCT_CONTEXT_FIELDS
+from .intents import get_intent_matcher
+from .context import ContextCompactor, key_legend
+from .cache import ResponseCache, response_cache, is_self_contained
+from .coalescing import AsyncSingleFlight, SingleFlight
+from .semantic_cache import semantic_cache
+from .memory import build_conversation_memory
+from .persistence import MESSAGE_WRITES, build_message_writer
+import asyncio
+import contextvars
 import json
 import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from django.conf import settings
-from openai import OpenAI
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework import status, generics
 
+from buynlarge.metrics import registry, RequestTimings, SIZE_BUCKETS, TOKEN_BUCKETS
 from .serializers import ConversationSerializer
+from .transport import (
+    CIRCUIT_OPEN_RESPONSE, CircuitOpenError, build_circuit_breaker, build_openai_clients, build_resilient_llm,
+    build_retry_budget,
+)
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-# Inicializar el cliente de OpenAI con la clave API configurada
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
 
-
-class ChatbotAPIView(APIView):
+def _run_db_task(func, *args, **kwargs):
+    # Los hilos del pool conservan su conexión; se descartan las caducadas o rotas como en cada request
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def sse_event(event, data):
+    """Formatea un evento Server-Sent Events con datos JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def run_in_db_pool(func, *args, **kwargs):
+    """Ejecuta código síncrono con acceso al ORM en el pool acotado de la base de datos"""
+    loop = asyncio.get_running_loop()
+    # Se copia el contexto para que la instrumentación de la petición cuente también estas consultas
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, context.run, partial(_run_db_task, func, *args, **kwargs))
+
+# Clientes de OpenAI (síncrono y, para la vista asíncrona, no bloqueante) con pool de conexiones y plazos
+client, async_client = build_openai_clients()
+# Reintentos, presupuesto de reintentos y circuit breaker compartidos por ambos clientes
+openai_breaker = build_circuit_breaker()
+openai_retry_budget = build_retry_budget()
+llm = build_resilient_llm(client, openai_breaker, openai_retry_budget)
+async_llm = build_resilient_llm(async_client, openai_breaker, openai_retry_budget)
+
+# Historial acotado con resúmenes generados en segundo plano
+conversation_memory = build_conversation_memory(llm)
+
+# Primeros mensajes idénticos en curso: una sola construcción de contexto y llamada a OpenAI por grupo
+request_flights = SingleFlight(timeout=settings.CHATBOT_COALESCING_TIMEOUT)
+async_request_flights = AsyncSingleFlight(timeout=settings.CHATBOT_COALESCING_TIMEOUT)
+
+# Escritura diferida de los mensajes (CHATBOT_MESSAGE_WRITE_BEHIND)
+message_writer = build_message_writer()
+
+# Pool acotado para el acceso a la base de datos desde la vista asíncrona
+db_executor = ThreadPoolExecutor(max_workers=settings.CHATBOT_DB_POOL_SIZE, thread_name_prefix='chatbot-db')
+
+# Parámetros de generación usados por todas las vistas del chatbot
+OPENAI_COMPLETION_PARAMS = {
+    'model': "gpt-3.5-turbo",  # También puedes usar gpt-4 para respuestas más avanzadas
+    'max_tokens': 500,  # Aumentado para permitir respuestas más completas
+    'temperature': 0.7,  # Balance entre creatividad y precisión
+    'top_p': 0.9,
+    'presence_penalty': 0.2,  # Leve penalización para evitar repeticiones
+    'frequency_penalty': 0.4  # Penalización para evitar repetición de frases
+}
+
+# Métricas publicadas en /metrics
+STAGE_SECONDS = registry.histogram(
+    'chatbot_stage_duration_seconds', 'Duración de cada etapa de una petición al chatbot', ('view', 'stage')
+)
+REQUEST_SECONDS = registry.histogram(
+    'chatbot_request_duration_seconds', 'Duración total de una petición al chatbot', ('view', 'cache', 'status')
+)
+CONTEXT_BYTES = registry.histogram(
+    'chatbot_context_bytes', 'Tamaño en bytes del contexto del inventario enviado a OpenAI', buckets=SIZE_BUCKETS
+)
+PROMPT_TOKENS = registry.histogram(
+    'chatbot_prompt_tokens', 'Tokens del prompt según OpenAI', buckets=TOKEN_BUCKETS
+)
+COMPLETION_TOKENS = registry.histogram(
+    'chatbot_completion_tokens', 'Tokens de la respuesta según OpenAI', buckets=TOKEN_BUCKETS
+)
+TTFT_SECONDS = registry.histogram(
+    'chatbot_ttft_seconds', 'Tiempo hasta el primer fragmento de texto de una respuesta transmitida'
+)
+
+
+class ChatbotMixin:
     """
-    API View para el chatbot que procesa mensajes a través de OpenAI ChatGPT
+    Lógica del chatbot compartida por las vistas síncrona y asíncrona:
+    construcción del contexto del inventario y de los mensajes para OpenAI
     """
 
-    def post(self, request):
+    # Nombre de la vista en las métricas y etapas de la petición en curso
+    metrics_name = None
+    timings = None
+    # Si la vista admite la escritura diferida de los mensajes
+    write_behind = True
+
+    def create_message(self, conversation, content, sender):
         """
-        Procesa los mensajes del usuario y devuelve respuestas generadas por ChatGPT
+        Guarda un mensaje o, con escritura diferida, lo deja sin guardar hasta
+        persist_messages, que le asigna su id al encolarlo
+        """
+        if not (self.write_behind and message_writer.enabled):
+            MESSAGE_WRITES.inc(mode='sync')
+            return Message.objects.create(conversation=conversation, content=content, sender=sender)
+        message = Message(conversation=conversation, content=content, sender=sender)
+        self.__dict__.setdefault('unsaved_messages', []).append(message)
+        return message
+
+    def persist_messages(self):
+        """Encola los mensajes diferidos de la petición, en orden"""
+        unsaved = self.__dict__.get('unsaved_messages')
+        if unsaved:
+            message_writer.save(unsaved)
+        self.__dict__.pop('unsaved_messages', None)
+
+    def persist_pending_messages(self):
+        """
+        Al terminar la petición, con o sin respuesta del bot, encola los mensajes
+        que sigan sin guardar para que el del usuario no se pierda
         """
-        message = request.data.get('message', '')
-        session_id = request.data.get('session_id', '')
-
-        if not session_id:
-            return Response({"error": "Se requiere un session_id"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Obtener o crear la conversación
-        conversation, created = Conversation.objects.get_or_create(session_id=session_id)
-
-        # Guardar mensaje del usuario
-        user_message = Message.objects.create(
-            conversation=conversation,
-            content=message,
-            sender='user'
-        )
-
         try:
-            # Obtener información relevante de la base de datos
-            context = self.get_relevant_context(message)
-
-            # Obtener respuesta de OpenAI
-            response_text = self.get_openai_response(message, context, conversation)
-
-            # Guardar respuesta del bot
-            bot_message = Message.objects.create(
-                conversation=conversation,
-                content=response_text,
-                sender='bot'
-            )
-
-            return Response({
-                'response': response_text,
-                'message_id': bot_message.id,
-                'conversation_id': conversation.id
-            })
+            self.persist_messages()
         except Exception as e:
-            logger.error(f"Error al procesar la consulta del chatbot: {str(e)}")
-            return Response({
-                'response': "Lo siento, estoy teniendo problemas técnicos para procesar tu consulta en este momento. ¿Puedes intentarlo de nuevo?",
-                'error': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            count = len(self.__dict__.pop('unsaved_messages', []))
+            logger.error(f"No se pudieron guardar {count} mensajes de la petición: {str(e)}")
+
+    def flush_previous_turns(self, conversation):
+        """Con escritura diferida, guarda los turnos anteriores que sigan en la cola antes de leer el historial"""
+        if message_writer.has_pending(conversation.id):
+            with self.stage('conversation'):
+                message_writer.flush_conversation(conversation.id)
+
+    def store_bot_message(self, conversation, content):
+        """Guarda la respuesta del bot y encola, si corresponde, los mensajes diferidos de la petición"""
+        bot_message = self.create_message(conversation, content, 'bot')
+        self.persist_messages()
+        return bot_message
+
+    def stage(self, name):
+        """Mide un bloque como etapa de la petición (sin efecto si no se están midiendo)"""
+        return self.timings.stage(name) if self.timings is not None else nullcontext()
+
+    def start_timings(self):
+        self.timings = RequestTimings(STAGE_SECONDS, view=self.metrics_name)
+
+    def finish_timings(self, response, cache_status):
+        """Registra la duración total y agrega la cabecera Server-Timing"""
+        total = self.timings.total()
+        REQUEST_SECONDS.observe(total, view=self.metrics_name, cache=cache_status, status=response.status_code)
+        if settings.CHATBOT_SERVER_TIMING:
+            response['Server-Timing'] = self.timings.server_timing(total)
+        return response
+
+    @staticmethod
+    def record_usage(completion):
+        """Registra los tokens informados por OpenAI, si la respuesta los incluye"""
+        usage = getattr(completion, 'usage', None)
+        if usage is None:
+            return
+        PROMPT_TOKENS.observe(usage.prompt_tokens)
+        COMPLETION_TOKENS.observe(usage.completion_tokens)
+
+    @staticmethod
+    def analyze_message(message):
+        """
+        Snapshot del catálogo e intenciones del mensaje. Se calculan una vez por
+        petición y se pasan a cada paso, para que la clave del cache, el contexto
+        y el prompt correspondan a la misma versión del catálogo.
+        """
+        catalog = get_catalog_snapshot()
+        # Detectar todas las intenciones del mensaje en una sola pasada
+        return catalog, get_intent_matcher(catalog).match(message)
 
-    def get_relevant_context(self, message):
+    def get_relevant_context(self, message, catalog=None, intents=None):
         """
-        Obtiene datos relevantes de la base de datos según la consulta del usuario
-        con información detallada sobre productos, categorías y marcas
+        Obtiene datos relevantes del snapshot del catálogo según la consulta del usuario
+        con información detallada sobre productos, categorías y marcas.
+        No realiza consultas a la base de datos salvo cuando el catálogo cambió
+        y hay que reconstruir el snapshot.
         """
         context = {}
-        message_lower = message.lower()
+        if catalog is None:
+            catalog, intents = self.analyze_message(message)
+        matcher = get_intent_matcher(catalog)
 
         # Obtener resumen general de inventario
         context['general_stats'] = {
-            'total_products': Product.objects.count(),
-            'total_categories': Category.objects.count(),
-            'total_brands': Brand.objects.count()
+            'total_products': len(catalog.products),
+            'total_categories': len(catalog.categories),
+            'total_brands': len(catalog.brands)
         }
 
         # Detección específica de consulta sobre categorías disponibles
-        category_query_keywords = ['categorías', 'categorias', 'tipos de productos', 'qué venden', 'que venden',
-                                   'qué productos', 'que productos', 'secciones', 'departamentos']
-
-        if any(keyword in message_lower for keyword in category_query_keywords):
+        if intents.category_query:
             # Marcar específicamente que el usuario está consultando sobre categorías
             context['query_type'] = 'categories_list'
             # Asegurarnos de incluir información detallada de categorías
             context['categories_detailed'] = [
                 {
-                    'name': category.name,
-                    'description': category.description,
-                    'product_count': Product.objects.filter(category=category).count(),
-                    'brands': list(set(Product.objects.filter(category=category).values_list('brand__name', flat=True)))
+                    'name': category['name'],
+                    'description': category['description'],
+                    'product_count': catalog.category_product_count(category['id']),
+                    'brands': catalog.category_brand_names(category['id'])
                 }
-                for category in Category.objects.all()
+                for category in catalog.categories.values()
             ]
 
         # Obtener todas las categorías disponibles
-        categories = Category.objects.all()
-        categories_info = []
-        for category in categories:
-            product_count = Product.objects.filter(category=category).count()
-            categories_info.append({
-                'id': category.id,
-                'name': category.name,
-                'description': category.description,
-                'product_count': product_count
-            })
-        context['categories'] = categories_info
+        context['categories'] = [
+            {
+                'id': category['id'],
+                'name': category['name'],
+                'description': category['description'],
+                'product_count': catalog.category_product_count(category['id'])
+            }
+            for category in catalog.categories.values()
+        ]
 
         # Obtener todas las marcas disponibles
-        brands = Brand.objects.all()
-        brands_info = []
-        for brand in brands:
-            product_count = Product.objects.filter(brand=brand).count()
-            brands_info.append({
-                'id': brand.id,
-                'name': brand.name,
-                'description': brand.description,
-                'product_count': product_count
-            })
-        context['brands'] = brands_info
-
-        # Procesamiento semántico del mensaje para determinar intenciones
-
-        # Detección de intención de búsqueda por categoría
-        category_keywords = {
-            'computadora': ['computadora', 'laptop', 'pc', 'ordenador', 'notebook', 'desktop', 'computadoras',
-                            'laptops', 'pcs', 'ordenadores'],
-            'teléfono': ['teléfono', 'celular', 'smartphone', 'móvil', 'telefono', 'movil', 'telefonos', 'celulares',
-                         'smartphones'],
-            'tablet': ['tablet', 'tableta', 'ipad', 'tablets', 'tabletas'],
-            'accesorio': ['accesorio', 'periférico', 'periferico', 'accesorios', 'periféricos', 'perifericos', 'gadget',
-                          'gadgets'],
-            'audio': ['audio', 'auricular', 'altavoz', 'audifono', 'parlante', 'auriculares', 'altavoces', 'audifonos',
-                      'parlantes', 'bocina', 'bocinas'],
-            'gaming': ['gaming', 'juego', 'consola', 'gamer', 'videojuego', 'juegos', 'consolas', 'videojuegos']
-        }
-
-        detected_categories = []
-        for category_name, keywords in category_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                detected_categories.append(category_name)
+        context['brands'] = [
+            {
+                'id': brand['id'],
+                'name': brand['name'],
+                'description': brand['description'],
+                'product_count': catalog.brand_product_count(brand['id'])
+            }
+            for brand in catalog.brands.values()
+        ]
 
         # Si se detecta una categoría, obtener productos relacionados
-        if detected_categories:
-            for category_name in detected_categories:
-                category_products = Product.objects.filter(category__name__icontains=category_name)
-                products_info = []
-
-                for product in category_products:
-                    # Recopilar especificaciones del producto
-                    specs = {}
-                    for spec in product.specifications.all():
-                        specs[spec.key] = spec.value
-
-                    # Agregar información completa del producto
-                    product_info = {
-                        'id': product.id,
-                        'name': product.name,
-                        'description': product.description,
-                        'price': float(product.price),
-                        'stock': product.stock,
-                        'brand': product.brand.name,
-                        'category': product.category.name,
-                        'image_url': product.image.url if product.image and hasattr(product.image, 'url') else None,
-                        'created_at': product.created_at.strftime('%Y-%m-%d'),
-                        'specs': specs
-                    }
-                    products_info.append(product_info)
-
-                # Agrupar por marca para análisis estadístico
-                brands_in_category = {}
-                for product in category_products:
-                    brand_name = product.brand.name
-                    if brand_name not in brands_in_category:
-                        brands_in_category[brand_name] = {
-                            'count': 0,
-                            'min_price': float('inf'),
-                            'max_price': 0,
-                            'avg_price': 0,
-                            'total_price': 0
-                        }
-
-                    brands_in_category[brand_name]['count'] += 1
-                    brands_in_category[brand_name]['total_price'] += float(product.price)
-                    brands_in_category[brand_name]['min_price'] = min(brands_in_category[brand_name]['min_price'],
-                                                                      float(product.price))
-                    brands_in_category[brand_name]['max_price'] = max(brands_in_category[brand_name]['max_price'],
-                                                                      float(product.price))
-
-                # Calcular precios promedio
-                for brand in brands_in_category:
-                    if brands_in_category[brand]['count'] > 0:
-                        brands_in_category[brand]['avg_price'] = brands_in_category[brand]['total_price'] / \
-                                                                 brands_in_category[brand]['count']
-
-                # Agregar al contexto
-                context[f'{category_name}_products'] = {
-                    'total': category_products.count(),
-                    'by_brand': brands_in_category,
-                    'products': products_info
-                }
+        for category_name in intents.categories:
+            category_ids = matcher.category_ids[category_name]
+            category_products = [
+                product
+                for category_id in category_ids
+                for product in catalog.products_by_category[category_id]
+            ]
+
+            # Agregar al contexto la información completa de los productos
+            # y las estadísticas por marca calculadas en la base de datos
+            context[f'{category_name}_products'] = {
+                'total': len(category_products),
+                'by_brand': catalog.brand_stats(category_ids),
+                'products': catalog.product_contexts(category_products)
+            }
 
         # Detección de intención de búsqueda por marca
-        for brand in Brand.objects.all():
-            brand_lower = brand.name.lower()
-            if brand_lower in message_lower:
-                brand_products = Product.objects.filter(brand__name=brand.name)
-                brand_products_info = []
-
-                for product in brand_products:
-                    # Obtener todas las especificaciones
-                    specs = {}
-                    for spec in product.specifications.all():
-                        specs[spec.key] = spec.value
-
-                    # Agregar información completa del producto
-                    product_info = {
-                        'id': product.id,
-                        'name': product.name,
-                        'description': product.description,
-                        'price': float(product.price),
-                        'stock': product.stock,
-                        'category': product.category.name,
-                        'image_url': product.image.url if product.image and hasattr(product.image, 'url') else None,
-                        'created_at': product.created_at.strftime('%Y-%m-%d'),
-                        'specs': specs
-                    }
-                    brand_products_info.append(product_info)
-
-                # Agrupar por categoría para análisis
-                categories_in_brand = {}
-                for product in brand_products:
-                    category_name = product.category.name
-                    if category_name not in categories_in_brand:
-                        categories_in_brand[category_name] = 0
-                    categories_in_brand[category_name] += 1
-
-                # Agregar al contexto
-                context['brand_info'] = {
-                    'id': brand.id,
-                    'name': brand.name,
-                    'description': brand.description,
-                    'total_products': brand_products.count(),
-                    'by_category': categories_in_brand,
-                    'products': brand_products_info
-                }
+        brand_product_fields = tuple(field for field in PRODUCT_CONTEXT_FIELDS if field != 'brand')
+        for brand_id in intents.brand_ids:
+            brand = catalog.brands[brand_id]
+            brand_products = catalog.products_by_brand[brand_id]
+
+            # Agrupar por categoría para análisis
+            categories_in_brand = {}
+            for product in brand_products:
+                categories_in_brand[product['category']] = categories_in_brand.get(product['category'], 0) + 1
+
+            # Agregar al contexto
+            context['brand_info'] = {
+                'id': brand['id'],
+                'name': brand['name'],
+                'description': brand['description'],
+                'total_products': len(brand_products),
+                'by_category': categories_in_brand,
+                'products': catalog.product_contexts(brand_products, brand_product_fields)
+            }
 
         # Búsqueda de producto específico por nombre
-        products = Product.objects.all()
-        for product in products:
-            product_name_lower = product.name.lower()
-            # Verificar si el nombre del producto está en el mensaje
-            if product_name_lower in message_lower:
-                # Obtener todas las especificaciones
-                specs = {}
-                for spec in product.specifications.all():
-                    specs[spec.key] = spec.value
-
-                # Crear contexto detallado del producto específico
-                context['specific_product'] = {
-                    'id': product.id,
-                    'name': product.name,
-                    'description': product.description,
-                    'price': float(product.price),
-                    'stock': product.stock,
-                    'brand': {
-                        'id': product.brand.id,
-                        'name': product.brand.name,
-                        'description': product.brand.description
-                    },
-                    'category': {
-                        'id': product.category.id,
-                        'name': product.category.name,
-                        'description': product.category.description
-                    },
-                    'image_url': product.image.url if product.image and hasattr(product.image, 'url') else None,
-                    'created_at': product.created_at.strftime('%Y-%m-%d'),
-                    'updated_at': product.updated_at.strftime('%Y-%m-%d'),
-                    'specs': specs
-                }
-
-                # Productos similares (misma categoría)
-                similar_products = Product.objects.filter(
-                    category=product.category
-                ).exclude(id=product.id)[:5]
-
-                similar_products_info = []
-                for similar in similar_products:
-                    similar_products_info.append({
-                        'id': similar.id,
-                        'name': similar.name,
-                        'price': float(similar.price),
-                        'brand': similar.brand.name,
-                    })
+        # Solo procesamos el primer producto encontrado para evitar contextos demasiado grandes
+        if intents.product_ids:
+            product_id = intents.product_ids[0]
+            product = catalog.products[product_id]
+            brand = catalog.brands[product['brand_id']]
+            category = catalog.categories[product['category_id']]
+
+            # Crear contexto detallado del producto específico
+            specific_product = catalog.product_contexts([product_id], PRODUCT_CONTEXT_FIELDS + ('updated_at',))[0]
+            specific_product['brand'] = {
+                'id': brand['id'],
+                'name': brand['name'],
+                'description': brand['description']
+            }
+            specific_product['category'] = {
+                'id': category['id'],
+                'name': category['name'],
+                'description': category['description']
+            }
 
-                context['specific_product']['similar_products'] = similar_products_info
-                break  # Solo procesamos el primer producto encontrado para evitar contextos demasiado grandes
+            # Productos similares (misma categoría)
+            similar_products = [
+                similar for similar in catalog.products_by_category[category['id']]
+                if similar['id'] != product_id
+            ][:5]
+            specific_product['similar_products'] = catalog.product_contexts(
+                similar_products, ('id', 'name', 'price', 'brand')
+            )
+            context['specific_product'] = specific_product
 
         # Búsqueda por rango de precios
-        price_keywords = ['precio', 'costo', 'valor', 'cuánto cuesta', 'cuanto cuesta', 'precios', 'costos']
-        if any(keyword in message_lower for keyword in price_keywords):
+        if intents.price:
             # Obtener estadísticas de precios por categoría
             price_stats = {}
-            for category in Category.objects.all():
-                category_products = Product.objects.filter(category=category)
-                if category_products.exists():
-                    products_info = []
-                    for product in category_products:
-                        products_info.append({
-                            'name': product.name,
-                            'price': float(product.price),
-                            'brand': product.brand.name
-                        })
-
-                    # Calcular precios min, max y promedio
-                    prices = [float(p.price) for p in category_products]
-                    price_stats[category.name] = {
-                        'min_price': min(prices) if prices else 0,
-                        'max_price': max(prices) if prices else 0,
-                        'avg_price': sum(prices) / len(prices) if prices else 0,
-                        'count': len(prices),
-                        'products': products_info[:10]  # Limitamos a 10 productos para no sobrecargar el contexto
-                    }
+            for category in catalog.categories.values():
+                stats = catalog.category_price_stats(category['id'])
+                if stats:
+                    # Limitamos a 10 productos para no sobrecargar el contexto
+                    stats['products'] = catalog.product_contexts(
+                        catalog.products_by_category[category['id']][:10], ('name', 'price', 'brand')
+                    )
+                    price_stats[category['name']] = stats
 
             context['price_info'] = price_stats
 
         # Búsqueda por disponibilidad o stock
-        stock_keywords = ['disponible', 'stock', 'hay', 'disponibilidad', 'existencia', 'existencias', 'inventario']
-        if any(keyword in message_lower for keyword in stock_keywords):
-            # Obtener productos con poco stock (menos de 5 unidades)
-            low_stock = Product.objects.filter(stock__lt=5)
-            low_stock_info = []
-            for product in low_stock:
-                low_stock_info.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'stock': product.stock,
-                    'price': float(product.price),
-                    'brand': product.brand.name,
-                    'category': product.category.name
-                })
-
-            # Obtener productos sin stock
-            out_of_stock = Product.objects.filter(stock=0)
-            out_of_stock_info = []
-            for product in out_of_stock:
-                out_of_stock_info.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'price': float(product.price),
-                    'brand': product.brand.name,
-                    'category': product.category.name
-                })
-
-            # Obtener productos con mayor stock
-            high_stock = Product.objects.order_by('-stock')[:10]
-            high_stock_info = []
-            for product in high_stock:
-                high_stock_info.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'stock': product.stock,
-                    'price': float(product.price),
-                    'brand': product.brand.name,
-                    'category': product.category.name
-                })
+        if intents.stock:
+            all_products = list(catalog.products.values())
+            stock_fields = ('id', 'name', 'stock', 'price', 'brand', 'category')
 
             context['stock_info'] = {
-                'low_stock': low_stock_info,
-                'out_of_stock': out_of_stock_info,
-                'high_stock': high_stock_info
+                # Productos con poco stock (menos de 5 unidades)
+                'low_stock': catalog.product_contexts(
+                    [p for p in all_products if p['stock'] < 5], stock_fields
+                ),
+                # Productos sin stock
+                'out_of_stock': catalog.product_contexts(
+                    [p for p in all_products if p['stock'] == 0], ('id', 'name', 'price', 'brand', 'category')
+                ),
+                # Productos con mayor stock
+                'high_stock': catalog.product_contexts(
+                    sorted(all_products, key=lambda p: -p['stock'])[:10], stock_fields
+                )
             }
 
         return context
 
-    def get_openai_response(self, message, context, conversation):
+    def build_openai_messages(self, message, context, catalog, intents, previous_messages, summary=''):
         """
-        Obtiene respuesta de OpenAI (ChatGPT) con el contexto de la conversación
-        y datos relevantes sobre productos
+        Arma los mensajes para OpenAI: instrucciones del sistema, resumen de la
+        conversación, mensajes recientes y la consulta actual con el contexto del
+        inventario compactado
         """
-        try:
-            # Obtener mensajes anteriores para contexto (máximo 8 mensajes para mantener el contexto limitado)
-            previous_messages = conversation.messages.order_by('timestamp')[:8]
-
-            # Configurar el sistema con instrucciones específicas para el asistente
-            messages = [
-                {"role": "system", "content": """Eres un asistente virtual especializado para la tienda de tecnología Buy n Large. 
-                Tu objetivo es proporcionar información precisa y detallada sobre los productos, inventario y características técnicas.
-
-                Directrices importantes:
-                1. Sé amigable, profesional y conciso pero completo en tus respuestas.
-                2. Usa SIEMPRE los datos del inventario proporcionados para responder con precisión.
-                3. Cuando hables de precios, usa el formato de dólares (por ejemplo, $899.99).
-                4. Si no tienes información sobre un producto específico, indícalo claramente.
-                5. Cuando menciones especificaciones técnicas, estructúralas de manera clara y legible.
-                6. Si el cliente pregunta por comparaciones entre productos, destaca diferencias clave.
-                7. Personaliza tus recomendaciones basándote en las necesidades expresadas por el cliente.
-                8. Responde en español, de manera profesional pero conversacional.
-                9. Cuando menciones características técnicas importantes (como procesador, memoria, etc.), resáltalas.
-                10. Si el cliente menciona un rango de precio, recomienda productos dentro de ese rango.
-
-                Buy n Large es una tienda que se especializa en productos electrónicos de alta calidad, incluyendo computadoras,
-                teléfonos, tablets, accesorios, equipos de audio y productos para gaming.
-                """}
-            ]
+        # Configurar el sistema con instrucciones específicas para el asistente
+        messages = [
+            {"role": "system", "content": """Eres un asistente virtual especializado para la tienda de tecnología Buy n Large. 
+            Tu objetivo es proporcionar información precisa y detallada sobre los productos, inventario y características técnicas.
+
+            Directrices importantes:
+            1. Sé amigable, profesional y conciso pero completo en tus respuestas.
+            2. Usa SIEMPRE los datos del inventario proporcionados para responder con precisión.
+            3. Cuando hables de precios, usa el formato de dólares (por ejemplo, $899.99).
+            4. Si no tienes información sobre un producto específico, indícalo claramente.
+            5. Cuando menciones especificaciones técnicas, estructúralas de manera clara y legible.
+            6. Si el cliente pregunta por comparaciones entre productos, destaca diferencias clave.
+            7. Personaliza tus recomendaciones basándote en las necesidades expresadas por el cliente.
+            8. Responde en español, de manera profesional pero conversacional.
+            9. Cuando menciones características técnicas importantes (como procesador, memoria, etc.), resáltalas.
+            10. Si el cliente menciona un rango de precio, recomienda productos dentro de ese rango.
+
+            Buy n Large es una tienda que se especializa en productos electrónicos de alta calidad, incluyendo computadoras,
+            teléfonos, tablets, accesorios, equipos de audio y productos para gaming.
+            """}
+        ]
+
+        # Los turnos antiguos llegan resumidos
+        if summary:
+            messages.append({"role": "system", "content": f"Resumen de la conversación anterior con el cliente: {summary}"})
+
+        # Agregar mensajes previos para mantener contexto conversacional
+        for prev_msg in previous_messages:
+            role = "assistant" if prev_msg.sender == "bot" else "user"
+            messages.append({"role": role, "content": prev_msg.content})
+
+        # Compactar el contexto según las intenciones detectadas para respetar el presupuesto de tokens
+        context_str = ContextCompactor().compact(context, intents, catalog)
+        CONTEXT_BYTES.observe(len(context_str.encode('utf-8')))
+
+        # Agregar el mensaje actual con el contexto
+        prompt = f"""
+        Datos del inventario y productos de Buy n Large (JSON compacto; claves abreviadas: {key_legend()}):
+        {context_str}
+
+        Consulta del cliente: {message}
+
+        Proporciona una respuesta detallada y útil basándote en la información del inventario proporcionada,
+        teniendo en cuenta la conversación previa con el cliente.
+        """
+
+        messages.append({"role": "user", "content": prompt})
 
-            # Agregar mensajes previos para mantener contexto conversacional
-            for prev_msg in previous_messages:
-                role = "assistant" if prev_msg.sender == "bot" else "user"
-                messages.append({"role": role, "content": prev_msg.content})
+        return messages
+
+    def load_openai_messages(self, message, catalog, intents, conversation, user_message=None):
+        """
+        Contexto del inventario, historial y mensajes para OpenAI. Devuelve
+        (mensajes, si el prompt incluye historial de la conversación)
+        """
+        with self.stage('context'):
+            context = self.get_relevant_context(message, catalog, intents)
+        # Resumen y mensajes más recientes de la conversación, sin repetir el mensaje actual
+        with self.stage('memory'):
+            summary, previous_messages = conversation_memory.load(
+                conversation, exclude_id=user_message.id if user_message else None
+            )
+        with self.stage('prompt'):
+            messages = self.build_openai_messages(message, context, catalog, intents, previous_messages, summary)
+        return messages, bool(summary or previous_messages)
 
-            # Formatear el contexto para que sea legible para el modelo
-            context_str = json.dumps(context, indent=2)
+    def lookup_cached_response(self, message, catalog, intents, first_turn):
+        """
+        Busca una respuesta guardada para el mensaje cuando el historial no influye
+        en ella (primer turno de la conversación o mensaje autocontenido).
+        Devuelve (clave, respuesta o None); la clave es None si no debe cachearse.
+        Una respuesta generada con historial no se guarda aunque tenga clave
+        (ver store_cached_response).
+        """
+        # Cada cache se puede desactivar por separado; la clave no depende del backend del exacto
+        if response_cache is None and semantic_cache is None:
+            return None, None
+        if not (first_turn or is_self_contained(message, intents)):
+            return None, None
+
+        cache_key = ResponseCache.make_key(message, intents, catalog.version)
+        # Datos necesarios para indexar la respuesta en el cache semántico al guardarla
+        self.cached_question = (message, intents, catalog.version)
+
+        cached = response_cache.get(cache_key) if response_cache is not None else None
+        if cached is None and semantic_cache is not None:
+            # Sin coincidencia exacta: buscar una pregunta equivalente ya respondida
+            cached = semantic_cache.lookup(message, intents, catalog.version)
+            if cached is not None:
+                logger.info(f"Respuesta reutilizada del cache semántico para: {message}")
+        return cache_key, cached
+
+    def store_cached_response(self, cache_key, response_text):
+        """
+        Guarda la respuesta generada en el cache exacto y en el semántico. Sólo
+        debe llamarse con respuestas de un prompt sin historial: los caches se
+        comparten entre conversaciones y una respuesta que usó el historial
+        llevaría a otro cliente datos de esta conversación.
+        """
+        if response_cache is not None:
+            response_cache.set(cache_key, response_text)
+        if semantic_cache is not None:
+            message, intents, catalog_version = self.cached_question
+            semantic_cache.add(message, intents, catalog_version, response_text)
+
+    @staticmethod
+    def coalescing_key(message, catalog, intents, first_turn):
+        """
+        Clave para agrupar peticiones idénticas en curso (la del cache de respuestas),
+        o None si no se agrupan: sólo los primeros turnos, cuyo prompt no depende
+        del historial, reciben la respuesta de otra conversación
+        """
+        if not (first_turn and settings.CHATBOT_COALESCING_ENABLED):
+            return None
+        return ResponseCache.make_key(message, intents, catalog.version)
+
+    @staticmethod
+    def circuit_open_payload(error):
+        """Respuesta enlatada y cabeceras mientras el circuito de OpenAI está abierto"""
+        return {'response': CIRCUIT_OPEN_RESPONSE, 'error': str(error)}, {'Retry-After': str(math.ceil(error.retry_after))}
+
+    @staticmethod
+    def cache_status(cache_key, cached, shared=False):
+        """Valor de la cabecera X-Chatbot-Cache (COALESCED si se reutilizó la respuesta de una petición en curso)"""
+        if shared:
+            return 'COALESCED'
+        if cache_key is None:
+            return 'BYPASS'
+        return 'HIT' if cached else 'MISS'
+
+
+class ChatbotAPIView(ChatbotMixin, APIView):
+    """
+    API View para el chatbot que procesa mensajes a través de OpenAI ChatGPT
+    """
+    metrics_name = 'sync'
 
-            # Agregar el mensaje actual con el contexto
-            prompt = f"""
-            Datos del inventario y productos de Buy n Large:
-            {context_str}
+    def post(self, request):
+        """
+        Procesa los mensajes del usuario y devuelve respuestas generadas por ChatGPT
+        """
+        message = request.data.get('message', '')
+        session_id = request.data.get('session_id', '')
 
-            Consulta del cliente: {message}
+        if not session_id:
+            return Response({"error": "Se requiere un session_id"}, status=status.HTTP_400_BAD_REQUEST)
 
-            Proporciona una respuesta detallada y útil basándote en la información del inventario proporcionada,
-            teniendo en cuenta la conversación previa con el cliente.
-            """
+        self.start_timings()
+        cache_status = 'ERROR'
+        try:
+            # Obtener o crear la conversación
+            with self.stage('conversation'):
+                conversation, created = Conversation.objects.get_or_create(session_id=session_id)
+
+            # Guardar mensaje del usuario (antes de vaciar la cola, para no perderlo si eso falla)
+            with self.stage('user_message'):
+                user_message = self.create_message(conversation, message, 'user')
+            self.flush_previous_turns(conversation)
+
+            with self.stage('intents'):
+                catalog, intents = self.analyze_message(message)
+
+            # Reutilizar una respuesta cacheada si el historial no influye en ella
+            with self.stage('cache_lookup'):
+                cache_key, response_text = self.lookup_cached_response(message, catalog, intents, first_turn=created)
+            cached = response_text is not None
+            cache_status = self.cache_status(cache_key, cached)
+
+            if not cached:
+                generate = partial(
+                    self.generate_response, message, catalog, intents, conversation, user_message, cache_key
+                )
+                flight_key = self.coalescing_key(message, catalog, intents, created)
+                if flight_key is None:
+                    response_text = generate()
+                else:
+                    # Si otra conversación ya está generando la respuesta a este mismo mensaje, se espera la suya
+                    start = time.perf_counter()
+                    response_text, shared = request_flights.run(flight_key, generate)
+                    if shared:
+                        self.timings.record('coalesced', time.perf_counter() - start)
+                        cache_status = self.cache_status(cache_key, cached, shared)
 
-            messages.append({"role": "user", "content": prompt})
+            # Guardar respuesta del bot
+            with self.stage('bot_message'):
+                bot_message = self.store_bot_message(conversation, response_text)
 
+            response = Response({
+                'response': response_text,
+                'message_id': bot_message.id,
+                'conversation_id': conversation.id
+            }, headers={'X-Chatbot-Cache': cache_status})
+        except CircuitOpenError as e:
+            # OpenAI no está disponible: se responde de inmediato sin ocupar el worker esperando
+            data, headers = self.circuit_open_payload(e)
+            response = Response(data, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=headers)
+        except Exception as e:
+            logger.error(f"Error al procesar la consulta del chatbot: {str(e)}")
+            response = Response({
+                'response': "Lo siento, estoy teniendo problemas técnicos para procesar tu consulta en este momento. ¿Puedes intentarlo de nuevo?",
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Sin respuesta del bot, el mensaje del usuario diferido se guarda igual
+        self.persist_pending_messages()
+        return self.finish_timings(response, cache_status)
+
+    def generate_response(self, message, catalog, intents, conversation, user_message, cache_key=None):
+        """Construye el contexto, obtiene la respuesta de OpenAI y la guarda en el cache"""
+        messages, uses_history = self.load_openai_messages(message, catalog, intents, conversation, user_message)
+
+        # Obtener respuesta de OpenAI
+        response_text = self.get_openai_response(messages)
+        if cache_key and not uses_history:
+            with self.stage('cache_store'):
+                self.store_cached_response(cache_key, response_text)
+        return response_text
+
+    def get_openai_response(self, messages):
+        """
+        Obtiene respuesta de OpenAI (ChatGPT) con el contexto de la conversación
+        y datos relevantes sobre productos
+        """
+        try:
             # Llamar a la API de OpenAI con el cliente
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",  # También puedes usar gpt-4 para respuestas más avanzadas
-                messages=messages,
-                max_tokens=500,  # Aumentado para permitir respuestas más completas
-                temperature=0.7,  # Balance entre creatividad y precisión
-                top_p=0.9,
-                presence_penalty=0.2,  # Leve penalización para evitar repeticiones
-                frequency_penalty=0.4  # Penalización para evitar repetición de frases
-            )
+            with self.stage('openai'):
+                response = llm.create(messages=messages, **OPENAI_COMPLETION_PARAMS)
+            self.record_usage(response)
 
             return response.choices[0].message.content
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             # Manejo de errores detallado
             logger.error(f"Error al comunicarse con OpenAI: {str(e)}")
@@ -455,6 +606,242 @@ class ChatbotAPIView(APIView):
             raise
 
 
+class AsyncChatbotView(ChatbotMixin, View):
+    """
+    Versión asíncrona del chatbot para servirse bajo ASGI.
+
+    La llamada a OpenAI se hace con el cliente asíncrono, por lo que un mismo
+    proceso puede atender cientos de conversaciones en curso. El acceso a la
+    base de datos se ejecuta en un pool de hilos acotado (CHATBOT_DB_POOL_SIZE),
+    que limita también el número de conexiones abiertas.
+    """
+    metrics_name = 'async'
+
+    async def post(self, request):
+        """
+        Procesa los mensajes del usuario y devuelve respuestas generadas por ChatGPT
+        """
+        message, session_id, error_response = self.parse_chat_request(request)
+        if error_response:
+            return error_response
+
+        self.start_timings()
+        cache_status = 'ERROR'
+        try:
+            # Conversación, mensaje del usuario y cache en un solo paso por el pool de la base de datos
+            conversation, user_message, catalog, intents, cache_key, response_text, flight_key = await run_in_db_pool(
+                self.prepare_request, session_id, message
+            )
+            cached = response_text is not None
+            cache_status = self.cache_status(cache_key, cached)
+
+            if not cached:
+                generate = partial(
+                    self.generate_response, message, catalog, intents, conversation, user_message, cache_key
+                )
+                if flight_key is None:
+                    response_text = await generate()
+                else:
+                    # Si otra conversación ya está generando la respuesta a este mismo mensaje, se espera la suya
+                    start = time.perf_counter()
+                    response_text, shared = await async_request_flights.run(flight_key, generate)
+                    if shared:
+                        self.timings.record('coalesced', time.perf_counter() - start)
+                        cache_status = self.cache_status(cache_key, cached, shared)
+
+            # Guardar respuesta del bot
+            with self.stage('bot_message'):
+                bot_message = await run_in_db_pool(self.store_bot_message, conversation, response_text)
+
+            response = JsonResponse({
+                'response': response_text,
+                'message_id': bot_message.id,
+                'conversation_id': conversation.id
+            })
+            response['X-Chatbot-Cache'] = cache_status
+        except CircuitOpenError as e:
+            data, headers = self.circuit_open_payload(e)
+            response = JsonResponse(data, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=headers)
+        except Exception as e:
+            logger.error(f"Error al procesar la consulta del chatbot: {str(e)}")
+            response = JsonResponse({
+                'response': "Lo siento, estoy teniendo problemas técnicos para procesar tu consulta en este momento. ¿Puedes intentarlo de nuevo?",
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if 'unsaved_messages' in self.__dict__:
+            await run_in_db_pool(self.persist_pending_messages)
+        return self.finish_timings(response, cache_status)
+
+    @staticmethod
+    def parse_chat_request(request):
+        """Devuelve (message, session_id, respuesta de error) a partir de un cuerpo JSON o de formulario"""
+        try:
+            data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+        except ValueError:
+            return None, None, JsonResponse({"error": "JSON inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        message = data.get('message', '')
+        session_id = data.get('session_id', '')
+
+        if not session_id:
+            return None, None, JsonResponse({"error": "Se requiere un session_id"}, status=status.HTTP_400_BAD_REQUEST)
+        return message, session_id, None
+
+    async def generate_response(self, message, catalog, intents, conversation, user_message, cache_key=None):
+        """Arma los mensajes (en el pool de la base de datos), llama a OpenAI y guarda la respuesta en el cache"""
+        messages, uses_history = await run_in_db_pool(
+            self.load_openai_messages, message, catalog, intents, conversation, user_message
+        )
+        with self.stage('openai'):
+            completion = await async_llm.acreate(messages=messages, **OPENAI_COMPLETION_PARAMS)
+        self.record_usage(completion)
+        response_text = completion.choices[0].message.content
+        if cache_key and not uses_history:
+            with self.stage('cache_store'):
+                await run_in_db_pool(self.store_cached_response, cache_key, response_text)
+        return response_text
+
+    def prepare_request(self, session_id, message, coalesce=True):
+        """
+        Parte síncrona inicial: registra el mensaje del usuario, detecta sus
+        intenciones y consulta el cache de respuestas. Devuelve (conversation,
+        user_message, catalog, intents, cache_key, respuesta cacheada o None,
+        clave para agrupar peticiones idénticas o None)
+        """
+        with self.stage('conversation'):
+            conversation, created = Conversation.objects.get_or_create(session_id=session_id)
+        with self.stage('user_message'):
+            user_message = self.create_message(conversation, message, 'user')
+        self.flush_previous_turns(conversation)
+
+        with self.stage('intents'):
+            catalog, intents = self.analyze_message(message)
+        with self.stage('cache_lookup'):
+            cache_key, cached_response = self.lookup_cached_response(message, catalog, intents, first_turn=created)
+        if coalesce and cached_response is None:
+            flight_key = self.coalescing_key(message, catalog, intents, created)
+        else:
+            flight_key = None
+        return conversation, user_message, catalog, intents, cache_key, cached_response, flight_key
+
+    def prepare_openai_messages(self, session_id, message):
+        """
+        Parte síncrona del flujo en un solo paso por el pool: registra el mensaje del
+        usuario, consulta el cache de respuestas y, si no hay respuesta guardada, arma
+        los mensajes para OpenAI.
+        Devuelve (conversation, cache_key, respuesta cacheada o None, mensajes o None,
+        clave con la que guardar la respuesta o None si el prompt incluye historial)
+        """
+        conversation, user_message, catalog, intents, cache_key, cached_response, _ = self.prepare_request(
+            session_id, message, coalesce=False
+        )
+        if cached_response is not None:
+            return conversation, cache_key, cached_response, None, None
+        messages, uses_history = self.load_openai_messages(message, catalog, intents, conversation, user_message)
+        return conversation, cache_key, None, messages, None if uses_history else cache_key
+
+
+class ChatbotStreamView(AsyncChatbotView):
+    """
+    Variante del chatbot que transmite la respuesta mediante Server-Sent Events
+    a medida que OpenAI genera los tokens.
+
+    Eventos emitidos:
+    - token: {"content": "..."} por cada fragmento de texto
+    - done: {"message_id", "conversation_id", "ttft_ms"} al terminar
+    - error: {"response", "error"} si falla la comunicación con OpenAI
+
+    El mensaje del bot se guarda al completarse la respuesta o, con el texto
+    recibido hasta ese momento, si el cliente cancela la transmisión.
+    """
+    # Los mensajes se guardan al terminar o cancelarse la transmisión, fuera del ciclo de la petición
+    write_behind = False
+
+    async def post(self, request):
+        message, session_id, error_response = self.parse_chat_request(request)
+        if error_response:
+            return error_response
+
+        try:
+            conversation, cache_key, cached_response, messages, store_key = await run_in_db_pool(
+                self.prepare_openai_messages, session_id, message
+            )
+        except Exception as e:
+            logger.error(f"Error al preparar la consulta del chatbot: {str(e)}")
+            return JsonResponse({
+                'response': "Lo siento, estoy teniendo problemas técnicos para procesar tu consulta en este momento. ¿Puedes intentarlo de nuevo?",
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if cached_response is not None:
+            events = self.stream_cached_events(conversation, cached_response)
+        else:
+            events = self.stream_events(conversation, messages, store_key)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Chatbot-Cache'] = self.cache_status(cache_key, cached_response is not None)
+        # Evita que proxies como nginx acumulen la respuesta antes de enviarla
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream_cached_events(self, conversation, response_text):
+        """Envía una respuesta del cache como un único fragmento"""
+        bot_message = await self.save_bot_message(conversation, response_text)
+        yield sse_event('token', {'content': response_text})
+        yield sse_event('done', {'message_id': bot_message.id, 'conversation_id': conversation.id, 'ttft_ms': 0})
+
+    async def stream_events(self, conversation, messages, cache_key=None):
+        start = time.monotonic()
+        ttft_ms = None
+        chunks = []
+
+        try:
+            stream = await async_llm.acreate(messages=messages, stream=True, **OPENAI_COMPLETION_PARAMS)
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if not content:
+                    continue
+                if ttft_ms is None:
+                    ttft = time.monotonic() - start
+                    TTFT_SECONDS.observe(ttft)
+                    ttft_ms = ttft * 1000
+                    logger.info(f"Tiempo hasta el primer token: {ttft_ms:.0f} ms (conversación {conversation.id})")
+                chunks.append(content)
+                yield sse_event('token', {'content': content})
+        except (asyncio.CancelledError, GeneratorExit):
+            # El cliente cerró la conexión: guardar lo generado hasta ahora sin que la cancelación lo interrumpa
+            if chunks:
+                await asyncio.shield(self.save_bot_message(conversation, ''.join(chunks)))
+            logger.info(f"Transmisión cancelada por el cliente tras {len(chunks)} fragmentos (conversación {conversation.id})")
+            raise
+        except CircuitOpenError as e:
+            yield sse_event('error', {**self.circuit_open_payload(e)[0], 'retry_after': math.ceil(e.retry_after)})
+            return
+        except Exception as e:
+            logger.error(f"Error al transmitir la respuesta de OpenAI: {str(e)}")
+            yield sse_event('error', {
+                'response': "Lo siento, estoy teniendo problemas técnicos para procesar tu consulta en este momento. ¿Puedes intentarlo de nuevo?",
+                'error': str(e)
+            })
+            return
+
+        response_text = ''.join(chunks)
+        if not response_text:
+            logger.warning(f"OpenAI transmitió una respuesta vacía (conversación {conversation.id})")
+        elif cache_key:
+            await run_in_db_pool(self.store_cached_response, cache_key, response_text)
+        bot_message = await self.save_bot_message(conversation, response_text)
+        yield sse_event('done', {
+            'message_id': bot_message.id,
+            'conversation_id': conversation.id,
+            'ttft_ms': round(ttft_ms) if ttft_ms is not None else None
+        })
+
+    @staticmethod
+    async def save_bot_message(conversation, content):
+        return await run_in_db_pool(Message.objects.create, conversation=conversation, content=content, sender='bot')
+
+
 class ConversationHistoryView(generics.RetrieveAPIView):
     """
     Endpoint para obtener el historial de mensajes de una conversación
@@ -468,6 +855,10 @@ class ConversationHistoryView(generics.RetrieveAPIView):
     def retrieve(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
+            if message_writer.has_pending(instance.id):
+                # Guardar los mensajes diferidos de esta conversación antes de mostrar el historial
+                message_writer.flush_conversation(instance.id)
+                instance = self.get_object()
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         except Conversation.DoesNotExist:
@@ -476,6 +867,7 @@ class ConversationHistoryView(generics.RetrieveAPIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         except Exception as e:
+            logger.error(f"Error al recuperar el historial de {kwargs.get('session_id')}: {str(e)}")
             return Response(
                 {"error": f"Error al recuperar el historial: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -16,6 +16,10 @@ python manage.py migrate
 echo "Cargando datos de demostración..."
 python manage.py load_demo_data
 
-# Iniciar el servidor
+# Generar las versiones de las imágenes que aún no las tengan (las existentes se omiten)
+echo "Generando versiones de las imágenes..."
+python manage.py generate_image_renditions
+
+# Iniciar el servidor ASGI (las vistas asíncronas y la transmisión por SSE lo necesitan)
 echo "Iniciando servidor Django..."
-python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+uvicorn buynlarge.asgi:application --host 0.0.0.0 --port 8000
\ No newline at end of file
@@ -0,0 +1,265 @@
+# products/benchmarks.py
+"""
+Catálogo sintético para pruebas de carga y benchmarks.
+
+El catálogo es determinista para una semilla dada y reproduce la forma de un
+inventario real: pocas categorías y marcas concentran la mayoría de los
+productos (distribución tipo Zipf), cada categoría tiene sus propias
+especificaciones con valores frecuentes y raros, y los precios siguen una
+distribución log-normal alrededor de la mediana de la categoría.
+
+Los productos se insertan con bulk_create en lotes, cada uno en su propia
+transacción, así que las señales no se disparan: al terminar hay que
+reconstruir el índice de búsqueda e incrementar la versión del catálogo
+(el comando generate_catalog lo hace).
+"""
+import math
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import Category, Brand, Product, ProductSpecification
+from .renditions import generate_renditions
+from .specs import normalize_spec_key, parse_spec_value
+
+COLORS = [('Negro', 40), ('Plateado', 20), ('Blanco', 15), ('Azul', 10), ('Gris', 10), ('Rojo', 5)]
+CONNECTIVITY = [('Bluetooth', 45), ('USB-C', 25), ('Inalámbrico 2.4GHz', 20), ('USB', 10)]
+
+# Peso relativo de la categoría, familias, marcas de la más a la menos frecuente,
+# (mediana, dispersión) del precio y distribución de valores de cada especificación
+CATEGORY_PROFILES = {
+    'Computadoras': {
+        'weight': 30,
+        'families': ['Laptop', 'Notebook', 'Desktop', 'All-in-One'],
+        'brands': ['Lenovo', 'HP', 'Dell', 'Apple', 'Asus', 'Acer', 'MSI', 'Microsoft', 'Razer'],
+        'price': (900, 0.5),
+        'specs': {
+            'RAM': [('8GB', 35), ('16GB', 40), ('4GB', 8), ('32GB', 14), ('64GB', 3)],
+            'Procesador': [('Intel Core i5', 30), ('Intel Core i7', 25), ('AMD Ryzen 5', 18), ('AMD Ryzen 7', 12),
+                           ('Apple M2', 8), ('Intel Core i3', 7)],
+            'Almacenamiento': [('512GB SSD', 40), ('256GB SSD', 25), ('1TB SSD', 25), ('2TB SSD', 5),
+                               ('128GB SSD', 5)],
+            'Pantalla': [('15.6 pulgadas', 40), ('14 pulgadas', 30), ('13.3 pulgadas', 15), ('17.3 pulgadas', 10),
+                         ('24 pulgadas', 5)],
+            'Peso': [('1.5 kg', 30), ('1.8 kg', 25), ('1.2 kg', 20), ('2.3 kg', 20), ('5 kg', 5)],
+            'Color': COLORS,
+        },
+    },
+    'Teléfonos': {
+        'weight': 25,
+        'families': ['Teléfono', 'Smartphone'],
+        'brands': ['Samsung', 'Apple', 'Xiaomi', 'Motorola', 'Google', 'Huawei', 'Sony'],
+        'price': (600, 0.6),
+        'specs': {
+            'RAM': [('8GB', 40), ('6GB', 25), ('4GB', 20), ('12GB', 15)],
+            'Almacenamiento': [('128GB', 45), ('256GB', 30), ('64GB', 15), ('512GB', 10)],
+            'Pantalla': [('6.5 pulgadas', 40), ('6.1 pulgadas', 35), ('6.7 pulgadas', 25)],
+            'Batería': [('5000 mAh', 45), ('4500 mAh', 30), ('4000 mAh', 25)],
+            'Cámara': [('50 MP', 40), ('12 MP', 30), ('108 MP', 20), ('200 MP', 10)],
+            'Color': COLORS,
+        },
+    },
+    'Tablets': {
+        'weight': 10,
+        'families': ['Tableta', 'Tablet'],
+        'brands': ['Apple', 'Samsung', 'Lenovo', 'Xiaomi', 'Huawei', 'Microsoft'],
+        'price': (500, 0.5),
+        'specs': {
+            'RAM': [('4GB', 35), ('8GB', 40), ('6GB', 15), ('16GB', 10)],
+            'Almacenamiento': [('64GB', 30), ('128GB', 40), ('256GB', 25), ('1TB', 5)],
+            'Pantalla': [('10.9 pulgadas', 40), ('11 pulgadas', 30), ('8.7 pulgadas', 20), ('12.9 pulgadas', 10)],
+            'Batería': [('10 horas', 50), ('12 horas', 35), ('15 horas', 15)],
+            'Color': COLORS,
+        },
+    },
+    'Accesorios': {
+        'weight': 20,
+        'families': ['Teclado', 'Mouse', 'Monitor', 'Cargador', 'Funda', 'Impresora', 'Smartwatch'],
+        'brands': ['Logitech', 'Samsung', 'HP', 'LG', 'Razer', 'Dell', 'Huawei', 'Xiaomi'],
+        'price': (60, 0.9),
+        'specs': {
+            'Conectividad': CONNECTIVITY,
+            'Peso': [('120 g', 35), ('80 g', 30), ('450 g', 25), ('1 kg', 10)],
+            'Color': COLORS,
+        },
+    },
+    'Audio': {
+        'weight': 10,
+        'families': ['Auriculares', 'Audífonos', 'Parlante', 'Barra de sonido'],
+        'brands': ['Sony', 'JBL', 'Bose', 'Apple', 'Samsung', 'Xiaomi'],
+        'price': (150, 0.7),
+        'specs': {
+            'Batería': [('20 horas', 40), ('30 horas', 30), ('8 horas', 20), ('60 horas', 10)],
+            'Conectividad': CONNECTIVITY,
+            'Cancelación de ruido': [('No', 60), ('Sí', 40)],
+            'Color': COLORS,
+        },
+    },
+    'Gaming': {
+        'weight': 5,
+        'families': ['Consola', 'Control', 'Headset gamer', 'Silla gamer'],
+        'brands': ['Sony', 'Microsoft', 'Nintendo', 'Razer', 'Logitech', 'MSI'],
+        'price': (350, 0.6),
+        'specs': {
+            'Almacenamiento': [('1TB', 40), ('825GB', 25), ('512GB', 20), ('64GB', 15)],
+            'Conectividad': CONNECTIVITY,
+            'Color': COLORS,
+        },
+    },
+}
+
+ADJECTIVES = ['ultraligera', 'profesional', 'inalámbrico', 'compacto', 'gamer', 'resistente', 'económico',
+              'potente', 'silencioso', 'portátil']
+FEATURES = ['batería de larga duración', 'pantalla táctil', 'cancelación de ruido', 'carga rápida',
+            'procesador de última generación', 'conexión bluetooth', 'almacenamiento SSD', 'cámara de alta resolución']
+
+# Probabilidad de que un producto tenga cada una de las especificaciones de su categoría
+SPEC_COVERAGE = 0.8
+# Exponente de la distribución de popularidad de las marcas dentro de cada categoría
+BRAND_SKEW = 1.1
+
+# Imágenes de relleno: tamaño y variantes por categoría (todos los productos comparten estas imágenes)
+PLACEHOLDER_SIZE = (600, 400)
+PLACEHOLDER_VARIANTS = 3
+PLACEHOLDER_COLORS = {
+    'Computadoras': (0, 123, 255), 'Teléfonos': (253, 126, 20), 'Tablets': (40, 167, 69),
+    'Accesorios': (220, 53, 69), 'Audio': (102, 16, 242), 'Gaming': (214, 51, 132),
+}
+
+
+def cumulative(weights):
+    """Pesos acumulados para rng.choices"""
+    total = 0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+
+def placeholder_images(storage=default_storage):
+    """
+    Genera localmente con Pillow las imágenes de relleno (y sus versiones) que
+    aún no existen en el almacenamiento y devuelve {categoría: [nombres]}.
+    """
+    from PIL import Image, ImageDraw
+
+    images = {}
+    for category, profile in CATEGORY_PROFILES.items():
+        red, green, blue = PLACEHOLDER_COLORS.get(category, (108, 117, 125))
+        slug = category.lower().replace('é', 'e').replace(' ', '_')
+        images[category] = []
+        for variant in range(PLACEHOLDER_VARIANTS):
+            name = f'products/synthetic/{slug}_{variant}.jpg'
+            if not storage.exists(name):
+                # Cada variante con un tono más oscuro del color de la categoría
+                shade = 1 - variant * 0.2
+                image = Image.new('RGB', PLACEHOLDER_SIZE, (int(red * shade), int(green * shade), int(blue * shade)))
+                draw = ImageDraw.Draw(image)
+                draw.text((24, PLACEHOLDER_SIZE[1] // 2), profile['families'][variant % len(profile['families'])],
+                          fill=(255, 255, 255))
+                buffer = BytesIO()
+                image.save(buffer, format='JPEG', quality=80)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            generate_renditions(name, storage)
+            images[category].append(name)
+    return images
+
+
+class CatalogGenerator:
+    """
+    Generador del catálogo sintético. El mismo `rng` (random.Random con la
+    misma semilla) y los mismos parámetros producen siempre el mismo catálogo.
+    """
+
+    def __init__(self, rng, images=None, batch_size=5000, using='default'):
+        self.rng = rng
+        self.images = images or {}
+        self.batch_size = batch_size
+        self.using = using
+        self.categories = []
+        self.category_weights = cumulative(profile['weight'] for profile in CATEGORY_PROFILES.values())
+        self.brands = {}
+
+    def create_taxonomy(self):
+        """Categorías y marcas de los perfiles, reutilizando las que ya existen por nombre"""
+        brand_names = {name for profile in CATEGORY_PROFILES.values() for name in profile['brands']}
+        brands = {name: Brand.objects.using(self.using).get_or_create(name=name)[0] for name in sorted(brand_names)}
+        for name, profile in CATEGORY_PROFILES.items():
+            category = Category.objects.using(self.using).get_or_create(name=name)[0]
+            self.categories.append((category, profile, {
+                'brands': [brands[brand] for brand in profile['brands']],
+                'brand_weights': cumulative(1 / (rank + 1) ** BRAND_SKEW for rank in range(len(profile['brands']))),
+                # Los valores se repiten: se interpretan una sola vez (ver ProductSpecification.parse_value)
+                'specs': [(key, [(value, normalize_spec_key(key), *parse_spec_value(value)) for value, _ in values],
+                           cumulative(weight for _, weight in values))
+                          for key, values in profile['specs'].items()],
+            }))
+
+    def product(self):
+        """Un producto sin guardar y sus especificaciones como (clave, (valor, clave normalizada, número, unidad))"""
+        rng = self.rng
+        category, profile, tables = rng.choices(self.categories, cum_weights=self.category_weights)[0]
+        brand = rng.choices(tables['brands'], cum_weights=tables['brand_weights'])[0]
+        family = rng.choice(profile['families'])
+        adjective = rng.choice(ADJECTIVES)
+        median, sigma = profile['price']
+        cents = max(500, int(median * math.exp(rng.gauss(0, sigma)) * 100))
+        # La mayoría de los productos tiene stock; algunos están agotados o por agotarse
+        roll = rng.random()
+        stock = 0 if roll < 0.08 else rng.randint(1, 5) if roll < 0.2 else rng.randint(6, 200)
+        images = self.images.get(category.name)
+
+        product = Product(
+            name=f'{family} {brand.name} {adjective} {rng.randint(100, 9999)}',
+            description=f'{family} {adjective} de {brand.name} con {rng.choice(FEATURES)} '
+                        f'y {rng.choice(FEATURES)}.',
+            price=Decimal(cents) / 100,
+            stock=stock,
+            category=category,
+            brand=brand,
+            image=rng.choice(images) if images else None,
+        )
+        specs = [
+            (key, rng.choices(values, cum_weights=weights)[0])
+            for key, values, weights in tables['specs']
+            if rng.random() < SPEC_COVERAGE
+        ]
+        return product, specs
+
+    def generate(self, size, progress=None):
+        """
+        Inserta `size` productos con sus especificaciones en lotes de
+        `batch_size`, cada lote en una transacción. Llama a `progress(creados)`
+        tras cada lote y devuelve el número de productos creados.
+        """
+        if not self.categories:
+            self.create_taxonomy()
+        created = 0
+        while created < size:
+            rows = [self.product() for _ in range(min(self.batch_size, size - created))]
+            with transaction.atomic(using=self.using):
+                products = Product.objects.using(self.using).bulk_create(product for product, _ in rows)
+                specifications = []
+                for product, (_, specs) in zip(products, rows):
+                    for key, (value, normalized_key, numeric_value, unit) in specs:
+                        specifications.append(ProductSpecification(
+                            product=product, key=key, value=value,
+                            normalized_key=normalized_key, numeric_value=numeric_value, unit=unit,
+                        ))
+                ProductSpecification.objects.using(self.using).bulk_create(specifications)
+            created += len(products)
+            if progress:
+                progress(created)
+        return created
+
+
+def seed_benchmark_catalog(size, rng):
+    """
+    Crea `size` productos sintéticos sin imágenes.
+    Pensado para ejecutarse dentro de una transacción que luego se revierte.
+    """
+    return CatalogGenerator(rng).generate(size)
@@ -0,0 +1,328 @@
+# products/catalog.py
+"""
+Snapshot en memoria del catálogo de productos.
+
+Cada proceso (worker) mantiene una copia de solo lectura del catálogo con las
+estadísticas por categoría y marca, las filas de productos y sus
+especificaciones. El snapshot se etiqueta con una versión de catálogo que se
+guarda en la base de datos (una fila de `CatalogVersion`), así que todos los
+procesos la comparten; las señales de los modelos la incrementan al confirmar
+cada cambio y cada worker reconstruye su snapshot cuando detecta una versión
+nueva.
+
+Para no consultar la fila en cada uso, un proceso reutiliza su última lectura
+durante CATALOG_VERSION_CHECK_INTERVAL segundos: un cambio hecho en otro
+proceso tarda a lo sumo ese tiempo en verse. Quien necesite la versión exacta
+(por ejemplo, el GET condicional) la lee con `max_age=0`.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Category, Brand, CatalogVersion, Product, ProductSpecification
+
+logger = logging.getLogger(__name__)
+
+# La versión vive en una única fila
+CATALOG_VERSION_ID = 1
+
+# Campos que describen un producto en el contexto del chatbot
+PRODUCT_CONTEXT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'brand', 'category',
+                          'image_url', 'created_at', 'specs')
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+# Última lectura de la versión en este proceso: (instante de la lectura, versión, fecha del último cambio)
+_catalog_state = None
+
+
+def version_clock():
+    return time.time_ns() // 1000
+
+
+def get_catalog_state(max_age=None):
+    """
+    Devuelve (versión, fecha del último cambio) del catálogo, compartidos por
+    todos los procesos. Reutiliza la última lectura de este proceso si no es
+    más antigua que `max_age` segundos (por defecto CATALOG_VERSION_CHECK_INTERVAL).
+    """
+    if max_age is None:
+        max_age = settings.CATALOG_VERSION_CHECK_INTERVAL
+    state = _catalog_state
+    if state is not None and max_age > 0 and time.monotonic() - state[0] < max_age:
+        return state[1], state[2]
+
+    row = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).values_list('version', 'modified_at').first()
+    if row is None:
+        # Base de datos nueva o vaciada
+        created, _ = CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_ID, defaults={'version': version_clock()})
+        row = (created.version, created.modified_at)
+    remember_catalog_state(*row)
+    return row
+
+
+def remember_catalog_state(version, modified_at):
+    global _catalog_state
+    _catalog_state = (time.monotonic(), version, modified_at)
+
+
+def get_catalog_version(max_age=None):
+    """Devuelve la versión actual del catálogo compartida entre procesos"""
+    return get_catalog_state(max_age)[0]
+
+
+def bump_catalog_version():
+    """
+    Incrementa la versión del catálogo para invalidar los snapshots de todos
+    los procesos. Las versiones siguen al reloj (en microsegundos): si la
+    transacción que incrementó la versión se revierte, el número no vuelve a
+    usarse para otro catálogo.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        versions = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID)
+        values = {'version': Greatest(F('version') + 1, Value(version_clock())), 'modified_at': now}
+        if not versions.update(**values):
+            # La fila todavía no existe
+            get_catalog_state(max_age=0)
+            versions.update(**values)
+        version = versions.values_list('version', flat=True).get()
+    remember_catalog_state(version, now)
+    return version
+
+
+def get_catalog_last_modified(max_age=None):
+    """
+    Fecha del último cambio del catálogo. Se registra al incrementar la versión;
+    si todavía no se registró ninguno se toma el mayor `updated_at` de los
+    productos y se guarda en la fila. Devuelve None si el catálogo está vacío.
+    """
+    return fill_catalog_last_modified(*get_catalog_state(max_age))
+
+
+def fill_catalog_last_modified(version, modified_at):
+    """Completa una lectura de get_catalog_state que aún no tiene fecha del último cambio"""
+    if modified_at is not None:
+        return modified_at
+
+    last_modified = Product.objects.aggregate(last_modified=Max('updated_at'))['last_modified']
+    if last_modified is not None:
+        CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID, version=version, modified_at__isnull=True).update(
+            modified_at=last_modified
+        )
+        remember_catalog_state(version, last_modified)
+    return last_modified
+
+
+class CatalogSnapshot:
+    """
+    Copia de solo lectura del catálogo construida con un número fijo de consultas.
+    Los diccionarios que expone no deben modificarse; quien necesite alterarlos
+    debe copiarlos primero.
+    """
+
+    def __init__(self, version, categories, brands, products):
+        self.version = version
+        # id -> dict con la información de la categoría/marca/producto
+        self.categories = categories
+        self.brands = brands
+        # Sin lectura consistente, la categoría o la marca de un producto pudo
+        # borrarse entre consultas (y el producto con ella, en cascada)
+        self.products = {
+            product_id: product for product_id, product in products.items()
+            if product['category_id'] in categories and product['brand_id'] in brands
+        }
+
+        # category_id -> {nombre de marca -> estadísticas de precio}
+        self.brand_price_stats = {}
+
+        self.products_by_category = {category_id: [] for category_id in categories}
+        self.products_by_brand = {brand_id: [] for brand_id in brands}
+        for product in self.products.values():
+            self.products_by_category[product['category_id']].append(product)
+            self.products_by_brand[product['brand_id']].append(product)
+
+    @classmethod
+    def build(cls, version):
+        """
+        Carga el catálogo completo con un número fijo de consultas, todas en
+        una misma transacción de lectura consistente cuando el motor lo permite
+        """
+        outermost = not connection.in_atomic_block
+        with transaction.atomic():
+            if outermost:
+                use_repeatable_read()
+            categories = {
+                row['id']: row
+                for row in Category.objects.order_by('id').values('id', 'name', 'description')
+            }
+            brands = {
+                row['id']: row
+                for row in Brand.objects.order_by('id').values('id', 'name', 'description')
+            }
+            snapshot = cls(version, categories, brands, fetch_product_rows())
+            snapshot.brand_price_stats = fetch_brand_price_stats()
+        return snapshot
+
+    def category_product_count(self, category_id):
+        return len(self.products_by_category.get(category_id, ()))
+
+    def brand_product_count(self, brand_id):
+        return len(self.products_by_brand.get(brand_id, ()))
+
+    def category_brand_names(self, category_id):
+        """Nombres de las marcas con productos en la categoría, sin repetir"""
+        return list(dict.fromkeys(p['brand'] for p in self.products_by_category.get(category_id, ())))
+
+    def product_contexts(self, products, fields=PRODUCT_CONTEXT_FIELDS):
+        """
+        Proyecta productos del snapshot (ids o filas) a diccionarios nuevos con
+        los campos pedidos, listos para agregarse al contexto del chatbot
+        """
+        contexts = []
+        for product in products:
+            if not isinstance(product, dict):
+                product = self.products[product]
+            context = {field: product[field] for field in fields}
+            if 'specs' in context:
+                context['specs'] = dict(context['specs'])
+            contexts.append(context)
+        return contexts
+
+    def brand_stats(self, category_ids):
+        """
+        Estadísticas de precio por marca para una o varias categorías:
+        count, min_price, max_price, avg_price y total_price
+        """
+        merged = {}
+        for category_id in category_ids:
+            for brand_name, stats in self.brand_price_stats.get(category_id, {}).items():
+                current = merged.get(brand_name)
+                if current is None:
+                    merged[brand_name] = dict(stats)
+                    continue
+                current['count'] += stats['count']
+                current['total_price'] += stats['total_price']
+                current['min_price'] = min(current['min_price'], stats['min_price'])
+                current['max_price'] = max(current['max_price'], stats['max_price'])
+                current['avg_price'] = current['total_price'] / current['count']
+        return merged
+
+    def category_price_stats(self, category_id):
+        """Precio mínimo, máximo y promedio de una categoría derivados de las estadísticas por marca"""
+        by_brand = self.brand_price_stats.get(category_id)
+        if not by_brand:
+            return None
+        count = sum(stats['count'] for stats in by_brand.values())
+        total_price = sum(stats['total_price'] for stats in by_brand.values())
+        return {
+            'min_price': min(stats['min_price'] for stats in by_brand.values()),
+            'max_price': max(stats['max_price'] for stats in by_brand.values()),
+            'avg_price': total_price / count,
+            'count': count
+        }
+
+
+def use_repeatable_read():
+    """
+    En PostgreSQL, hace que todas las consultas de la transacción que empieza
+    vean el mismo estado de la base de datos (READ COMMITTED, el nivel por
+    defecto, toma uno nuevo en cada consulta). Debe llamarse antes de la
+    primera consulta de la transacción; SQLite ya lee de forma consistente.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+
+
+def fetch_product_rows():
+    """
+    Obtiene todo el catálogo como diccionarios planos con su marca, categoría,
+    URL de imagen y especificaciones. Usa siempre dos consultas.
+    """
+    image_storage = Product._meta.get_field('image').storage
+
+    products = {}
+    product_rows = Product.objects.order_by('id').values(
+        'id', 'name', 'description', 'price', 'stock', 'image', 'created_at', 'updated_at',
+        'brand_id', 'brand__name', 'category_id', 'category__name'
+    )
+    for row in product_rows:
+        products[row['id']] = {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'price': float(row['price']),
+            'stock': row['stock'],
+            'brand_id': row['brand_id'],
+            'brand': row['brand__name'],
+            'category_id': row['category_id'],
+            'category': row['category__name'],
+            'image_url': image_storage.url(row['image']) if row['image'] else None,
+            'created_at': row['created_at'].strftime('%Y-%m-%d'),
+            'updated_at': row['updated_at'].strftime('%Y-%m-%d'),
+            'specs': {}
+        }
+
+    specs = ProductSpecification.objects.order_by('id').values_list('product_id', 'key', 'value')
+    for product_id, key, value in specs:
+        if product_id in products:
+            products[product_id]['specs'][key] = value
+
+    return products
+
+
+def fetch_brand_price_stats():
+    """
+    Calcula en la base de datos las estadísticas de precio por categoría y marca.
+    Devuelve {category_id: {nombre de marca: {count, min_price, max_price, avg_price, total_price}}}
+    """
+    rows = Product.objects.values('category_id', 'brand__name').annotate(
+        count=Count('id'),
+        min_price=Min('price'),
+        max_price=Max('price'),
+        total_price=Sum('price')
+    ).order_by('category_id', 'brand_id')
+
+    stats = {}
+    for row in rows:
+        stats.setdefault(row['category_id'], {})[row['brand__name']] = {
+            'count': row['count'],
+            'min_price': float(row['min_price']),
+            'max_price': float(row['max_price']),
+            'avg_price': float(row['total_price']) / row['count'],
+            'total_price': float(row['total_price'])
+        }
+    return stats
+
+
+def get_catalog_snapshot():
+    """
+    Devuelve el snapshot del catálogo de este worker, reconstruyéndolo si la
+    versión compartida cambió desde la última construcción
+    """
+    global _snapshot
+
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        # Otro hilo pudo haberlo reconstruido mientras esperábamos el lock
+        if _snapshot is None or _snapshot.version != version:
+            start = time.monotonic()
+            # La versión se lee antes de construir: si cambia durante la carga,
+            # la siguiente consulta volverá a reconstruir el snapshot
+            _snapshot = CatalogSnapshot.build(version)
+            logger.info(
+                f"Snapshot del catálogo v{version} construido en "
+                f"{(time.monotonic() - start) * 1000:.1f} ms ({len(_snapshot.products)} productos)"
+            )
+        return _snapshot
@@ -0,0 +1,86 @@
+# products/facets.py
+"""
+Conteos por faceta (categoría, marca, rango de precio y estado de stock) para
+un conjunto de filtros del catálogo.
+
+Todas las facetas se calculan con tres consultas agregadas sin importar el
+número de categorías, marcas o rangos, y el resultado se guarda en el cache
+de Django con la versión del catálogo en la clave, de modo que cualquier
+cambio del inventario lo invalida.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+FACETS_CACHE_PREFIX = 'products:facets'
+
+# Parámetros que no cambian el conjunto de productos y no forman parte de la clave
+IGNORED_PARAMS = {'cursor', 'page_size', 'ordering', 'fields', 'expand', 'format'}
+
+
+def price_ranges():
+    """[(mínimo, máximo o None)] a partir de los límites de CATALOG_PRICE_BUCKETS"""
+    bounds = settings.CATALOG_PRICE_BUCKETS
+    return [(low, high) for low, high in zip(bounds, bounds[1:])] + [(bounds[-1], None)]
+
+
+def compute_facets(queryset):
+    """Calcula todas las facetas de los productos del queryset"""
+    queryset = queryset.order_by()
+    low_stock = settings.CATALOG_LOW_STOCK_THRESHOLD
+    ranges = price_ranges()
+
+    categories = queryset.values('category_id', 'category__name').annotate(count=Count('id'))
+    brands = queryset.values('brand_id', 'brand__name').annotate(count=Count('id'))
+
+    # Rangos de precio, estados de stock y total en una sola pasada
+    aggregates = {'total': Count('id')}
+    for index, (low, high) in enumerate(ranges):
+        condition = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f'price_{index}'] = Count('id', filter=condition)
+    aggregates['in_stock'] = Count('id', filter=Q(stock__gt=low_stock))
+    aggregates['low_stock'] = Count('id', filter=Q(stock__gt=0, stock__lte=low_stock))
+    aggregates['out_of_stock'] = Count('id', filter=Q(stock__lte=0))
+    totals = queryset.aggregate(**aggregates)
+
+    def by_count(rows, id_field, name_field):
+        items = [{'id': row[id_field], 'name': row[name_field], 'count': row['count']} for row in rows]
+        return sorted(items, key=lambda item: (-item['count'], item['name']))
+
+    return {
+        'total': totals['total'],
+        'categories': by_count(categories, 'category_id', 'category__name'),
+        'brands': by_count(brands, 'brand_id', 'brand__name'),
+        'price_ranges': [
+            {'min': low, 'max': high, 'count': totals[f'price_{index}']}
+            for index, (low, high) in enumerate(ranges)
+        ],
+        'stock': {
+            'in_stock': totals['in_stock'],
+            'low_stock': totals['low_stock'],
+            'out_of_stock': totals['out_of_stock'],
+        },
+    }
+
+
+def facets_cache_key(query_params, version):
+    """Clave del cache para un conjunto de filtros y una versión del catálogo"""
+    params = sorted(
+        (name, value)
+        for name, values in query_params.lists() if name not in IGNORED_PARAMS
+        for value in values
+    )
+    digest = hashlib.md5(repr(params).encode('utf-8')).hexdigest()
+    return f'{FACETS_CACHE_PREFIX}:{version}:{digest}'
+
+
+def get_facets(queryset, query_params, version):
+    """Facetas del queryset filtrado, reutilizando las calculadas para los mismos filtros"""
+    key = facets_cache_key(query_params, version)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, settings.CATALOG_FACETS_CACHE_TTL)
+    return facets
@@ -0,0 +1,65 @@
+# products/filters.py
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from .models import ProductSpecification
+from .search import get_search_backend
+from .specs import NUMERIC_LOOKUPS, TEXT_LOOKUPS, normalize_spec_key, parse_spec_value
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Búsqueda de productos sobre el índice de texto completo, ordenada por
+    relevancia. Si se pide un orden explícito (`ordering`) éste prevalece.
+    En motores sin índice se comporta como el `SearchFilter` de DRF.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        backend = get_search_backend(queryset.db)
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        return backend.filter(queryset, query)
+
+
+class SpecificationFilter(BaseFilterBackend):
+    """
+    Filtros por especificación: `?spec.RAM__gte=16`, `?spec.Storage__gte=1TB`,
+    `?spec.Color__contains=negro`. Sin búsqueda explícita se compara por
+    igualdad. Las comparaciones numéricas usan el valor en la unidad canónica
+    (ver products/specs.py); si el valor del filtro trae unidad, también debe
+    coincidir la unidad. Cada filtro es una subconsulta sobre el índice
+    (normalized_key, numeric_value, product) y todos deben cumplirse.
+    """
+
+    param_prefix = 'spec.'
+
+    def filter_queryset(self, request, queryset, view):
+        for param, values in request.query_params.lists():
+            if not param.startswith(self.param_prefix):
+                continue
+            key, _, lookup = param[len(self.param_prefix):].partition('__')
+            lookup = lookup or 'exact'
+            for value in values:
+                specs = self.matching_specifications(normalize_spec_key(key), lookup, value, param)
+                queryset = queryset.filter(id__in=specs.values('product_id'))
+        return queryset
+
+    def matching_specifications(self, key, lookup, value, param):
+        if not key:
+            raise ValidationError({param: 'Falta el nombre de la especificación'})
+        specs = ProductSpecification.objects.filter(normalized_key=key)
+        if lookup in TEXT_LOOKUPS:
+            return specs.filter(value__icontains=value)
+        if lookup not in NUMERIC_LOOKUPS:
+            raise ValidationError({param: f"Búsqueda no soportada: {lookup}"})
+
+        number, unit = parse_spec_value(value)
+        if number is None:
+            if lookup == 'exact':
+                return specs.filter(value__iexact=value)
+            raise ValidationError({param: 'Se esperaba un valor numérico'})
+        specs = specs.filter(**{f'numeric_value__{lookup}': number})
+        return specs.filter(unit=unit) if unit else specs
@@ -0,0 +1,19 @@
+# products/management/commands/backfill_spec_values.py
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from products.models import ProductSpecification
+from products.specs import backfill_spec_values
+
+
+class Command(BaseCommand):
+    help = ('Calcula la clave normalizada y el valor numérico de las especificaciones existentes '
+            '(necesario tras cargas masivas con bulk_create o update)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        updated = backfill_spec_values(ProductSpecification, options['batch_size'], options['database'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} especificaciones actualizadas'))
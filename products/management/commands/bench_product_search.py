@@ -0,0 +1,65 @@
+# products/management/commands/bench_product_search.py
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarks import seed_benchmark_catalog
+from products.filters import ProductSearchFilter
+from products.search import get_search_backend, rebuild_search_index
+from products.views import ProductViewSet
+
+QUERIES = ['laptop', 'teléfonos samsung', 'auriculares inalambricos', 'ryzen', 'consola nintendo',
+           'cancelación de ruido', 'monitor profesional', 'tableta apple', 'carga rapida', 'smartwatch huawei']
+
+
+class Command(BaseCommand):
+    help = ('Compara la búsqueda de productos sobre el índice de texto completo con el SearchFilter de DRF. '
+            'Los productos se crean dentro de una transacción que se revierte al terminar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones de cada consulta')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if get_search_backend() is None:
+            raise CommandError('El motor de base de datos no tiene índice de búsqueda')
+
+        for size in options['products']:
+            with transaction.atomic():
+                seed_benchmark_catalog(size, random.Random(options['seed']))
+                start = time.perf_counter()
+                rebuild_search_index()
+                self.stdout.write(
+                    f"\n{size} productos (índice construido en {time.perf_counter() - start:.1f} s)"
+                )
+                for label, backend in (('SearchFilter', SearchFilter), ('Texto completo', ProductSearchFilter)):
+                    latencies = self.measure(backend, options['repeat'], options['page_size'])
+                    quantiles = statistics.quantiles(latencies, n=100)
+                    self.stdout.write(
+                        f"  {label:<15} p50 {quantiles[49]:8.2f} ms  p95 {quantiles[94]:8.2f} ms  "
+                        f"({len(latencies)} búsquedas)"
+                    )
+                transaction.set_rollback(True)
+
+    def measure(self, filter_class, repeat, page_size):
+        """Latencia de una página de resultados más el total, como en un listado paginado"""
+        factory = APIRequestFactory()
+        latencies = []
+        for _ in range(repeat):
+            for query in QUERIES:
+                view = ProductViewSet(action='list', format_kwarg=None)
+                view.request = Request(factory.get('/api/products/', {'search': query}))
+                start = time.perf_counter()
+                queryset = filter_class().filter_queryset(view.request, view.get_queryset(), view)
+                list(queryset[:page_size])
+                queryset.count()
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
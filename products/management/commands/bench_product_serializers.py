@@ -0,0 +1,74 @@
+# products/management/commands/bench_product_serializers.py
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarks import seed_benchmark_catalog
+from products.models import Product
+from products.serializers import ProductSerializer
+from products.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = ('Compara el tiempo de consulta y serialización de una página de productos con la representación '
+            'completa y con la compacta del listado. Los datos se crean en una transacción que se revierte.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[20, 100])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    # Las peticiones simuladas usan el host 'testserver'
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            seed_benchmark_catalog(options['products'], random.Random(options['seed']))
+            Product.objects.update(image='products/benchmark.jpg')
+
+            for page_size in options['page_sizes']:
+                self.stdout.write(f"\nPágina de {page_size} productos ({options['products']} en el catálogo)")
+                cases = (
+                    ('Completa (antes)', self.full_page, {}),
+                    ('Listado', self.list_page, {}),
+                    ('Listado + specs', self.list_page, {'expand': 'specifications'}),
+                    ('fields=id,name', self.list_page, {'fields': 'id,name'}),
+                )
+                for label, page, params in cases:
+                    latencies, queries = self.measure(page, page_size, params, options['repeat'])
+                    self.stdout.write(
+                        f"  {label:<18} p50 {statistics.median(latencies):7.2f} ms  "
+                        f"max {max(latencies):7.2f} ms  {queries} consultas"
+                    )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def full_page(request, page_size):
+        """Representación anterior: detalle completo sin select_related"""
+        queryset = Product.objects.prefetch_related('specifications').order_by('id')[:page_size]
+        return ProductSerializer(queryset, many=True, context={'request': request}).data
+
+    @staticmethod
+    def list_page(request, page_size):
+        view = ProductViewSet(action='list', format_kwarg=None, request=request)
+        queryset = view.filter_queryset(view.get_queryset()).order_by('id')[:page_size]
+        return view.get_serializer(queryset, many=True).data
+
+    def measure(self, page, page_size, params, repeat):
+        factory = APIRequestFactory()
+        latencies = []
+        queries = 0
+        for _ in range(repeat):
+            request = Request(factory.get('/api/products/products/', params))
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                page(request, page_size)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries = len(captured)
+        return latencies, queries
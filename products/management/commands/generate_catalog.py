@@ -0,0 +1,82 @@
+# products/management/commands/generate_catalog.py
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from chatbot.benchmarks import generate_conversations
+from chatbot.models import Conversation, Message
+from products.benchmarks import CatalogGenerator, placeholder_images
+from products.catalog import bump_catalog_version
+from products.models import Category, Brand, Product, ProductSpecification
+from products.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = ('Genera un catálogo sintético determinista (de miles a millones de productos) con especificaciones, '
+            'imágenes de relleno locales y, opcionalmente, conversaciones. No requiere acceso a la red.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--conversations', type=int, default=0)
+        parser.add_argument('--turns', type=float, default=4, help='Turnos promedio por conversación')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por transacción')
+        parser.add_argument('--no-images', action='store_true', help='No asignar imágenes a los productos')
+        parser.add_argument('--clear', action='store_true',
+                            help='Borra el catálogo y las conversaciones existentes antes de generar')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['products'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--products y --batch-size deben ser positivos')
+        using = options['database']
+        rng = random.Random(options['seed'])
+
+        if options['clear']:
+            self.clear(using)
+
+        start = time.perf_counter()
+        images = None if options['no_images'] else placeholder_images()
+        generator = CatalogGenerator(rng, images, options['batch_size'], using)
+        created = generator.generate(options['products'], self.progress('productos', options['products']))
+        self.stdout.write(f"{created} productos en {time.perf_counter() - start:.1f} s")
+
+        if options['conversations']:
+            start = time.perf_counter()
+            # Nombres en un orden estable para que la semilla determine las conversaciones
+            names = Product.objects.using(using).order_by('id').values_list('name', flat=True)[:1000]
+            conversations, messages = generate_conversations(
+                options['conversations'], rng, names, options['turns'], options['batch_size'], using,
+                self.progress('conversaciones', options['conversations'])
+            )
+            self.stdout.write(f"{conversations} conversaciones y {messages} mensajes "
+                              f"en {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        rebuild_search_index(using)
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Índice de búsqueda reconstruido en {time.perf_counter() - start:.1f} s"))
+
+    def progress(self, label, total):
+        """Informa el avance cada 10% aproximadamente"""
+        step = max(total // 10, 1)
+        reported = [0]
+
+        def report(done):
+            if done - reported[0] >= step or done == total:
+                reported[0] = done
+                self.stdout.write(f"  {done}/{total} {label}")
+        return report
+
+    def clear(self, using):
+        """
+        Borra con DELETE directo, sin cargar las filas ni disparar señales por
+        cada una: el índice de búsqueda y la versión del catálogo se actualizan
+        al terminar la generación.
+        """
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            for model in (Message, Conversation, ProductSpecification, Product, Brand, Category):
+                cursor.execute(f'DELETE FROM {connections[using].ops.quote_name(model._meta.db_table)}')
+        self.stdout.write('Catálogo y conversaciones anteriores borrados')
@@ -0,0 +1,79 @@
+# products/management/commands/generate_image_renditions.py
+import os
+import posixpath
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from products.renditions import has_renditions, render_renditions, save_renditions
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+
+
+def list_images(storage, directory):
+    """Nombres de las imágenes bajo `directory`, recorriendo los subdirectorios"""
+    directories, files = storage.listdir(directory)
+    for file_name in sorted(files):
+        if posixpath.splitext(file_name)[1].lower() in IMAGE_EXTENSIONS:
+            yield posixpath.join(directory, file_name)
+    for subdirectory in sorted(directories):
+        yield from list_images(storage, posixpath.join(directory, subdirectory))
+
+
+def render(item):
+    """Tarea del pool: (nombre, bytes) -> (nombre, versiones o mensaje de error)"""
+    name, data = item
+    try:
+        return name, render_renditions(data), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+class Command(BaseCommand):
+    help = ('Genera las versiones redimensionadas (miniatura, tarjeta y completa, en JPEG y WebP) de las '
+            'imágenes existentes de los productos, en paralelo con un pool de procesos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default='products', help='Directorio del almacenamiento a procesar')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Procesos del pool')
+        parser.add_argument('--force', action='store_true', help='Regenera también las que ya tienen versiones')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        start = time.perf_counter()
+        if not storage.exists(options['directory']):
+            self.stdout.write(self.style.WARNING(f"No existe el directorio {options['directory']}"))
+            return
+        names = [
+            name for name in list_images(storage, options['directory'])
+            if options['force'] or not has_renditions(name, storage)
+        ]
+        self.stdout.write(f"{len(names)} imágenes por procesar")
+
+        workers = max(options['workers'] or 1, 1)
+        # Ventanas acotadas: Executor.map envía todas las tareas de inmediato y leería todos los originales a memoria
+        window = workers * 16
+        generated = failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for offset in range(0, len(names), window):
+                # El proceso principal lee y guarda (el almacenamiento puede no ser local); el pool sólo redimensiona
+                items = [(name, self.read(storage, name)) for name in names[offset:offset + window]]
+                for name, rendered, error in pool.map(render, items):
+                    if error:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f"  {name}: {error}"))
+                        continue
+                    save_renditions(name, rendered, storage)
+                    generated += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Versiones de {generated} imágenes generadas en {time.perf_counter() - start:.1f} s"
+            + (f" ({failed} con errores)" if failed else '')
+        ))
+
+    @staticmethod
+    def read(storage, name):
+        with storage.open(name, 'rb') as original:
+            return original.read()
@@ -0,0 +1,19 @@
+# products/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from products.search import get_search_backend, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos (necesario tras cargas masivas con bulk_create o update)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if get_search_backend(options['database']) is None:
+            self.stdout.write('El motor de base de datos no tiene índice de búsqueda; se usa SearchFilter')
+            return
+        count = rebuild_search_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda reconstruido con {count} productos'))
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from products.search import SEARCH_BACKENDS
+
+
+def create_search_index(apps, schema_editor):
+    backend_class = SEARCH_BACKENDS.get(schema_editor.connection.vendor)
+    if backend_class is None:
+        return
+    backend = backend_class(schema_editor.connection)
+    backend.create_index(schema_editor)
+    backend.index_products(apps.get_model('products', 'Product'), apps.get_model('products', 'ProductSpecification'))
+
+
+def drop_search_index(apps, schema_editor):
+    backend_class = SEARCH_BACKENDS.get(schema_editor.connection.vendor)
+    if backend_class is not None:
+        backend_class(schema_editor.connection).drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
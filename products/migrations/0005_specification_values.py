@@ -0,0 +1,39 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:41
+
+from django.db import migrations, models
+
+from products.specs import backfill_spec_values
+
+
+def parse_existing_values(apps, schema_editor):
+    backfill_spec_values(apps.get_model('products', 'ProductSpecification'), using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productspecification',
+            name='normalized_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='productspecification',
+            name='numeric_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productspecification',
+            name='unit',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='productspecification',
+            index=models.Index(fields=['normalized_key', 'numeric_value', 'product'], name='spec_key_numeric_idx'),
+        ),
+        migrations.RunPython(parse_existing_values, migrations.RunPython.noop),
+    ]
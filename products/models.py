@@ -2,6 +2,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .specs import normalize_spec_key, parse_spec_value
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -36,11 +38,61 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # Filtros de ProductViewSet y del chatbot: categoría o marca con rango de precio, precio y stock
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['brand', 'price'], name='product_brand_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['stock'], name='product_stock_idx'),
+            # Paginación por cursor ordenada por nombre o fecha de creación, con id como desempate
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_at_id_idx'),
+        ]
+
 
 class ProductSpecification(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='specifications')
     key = models.CharField(max_length=100)  # Ej: "RAM", "Processor"
     value = models.CharField(max_length=255)  # Ej: "8GB", "Intel Core i5"
+    # Derivados de key y value al guardar (ver products/specs.py) para filtrar por especificación
+    normalized_key = models.CharField(max_length=100, blank=True, default='')  # Ej: "ram"
+    numeric_value = models.FloatField(null=True, blank=True)  # Ej: 8.0
+    unit = models.CharField(max_length=20, blank=True, default='')  # Ej: "gb"
+
+    def __str__(self):
+        return f"{self.product.name} - {self.key}"
+
+    class Meta:
+        indexes = [
+            # Filtros spec.<clave>__gte=...: rango sobre el valor numérico de una clave
+            models.Index(fields=['normalized_key', 'numeric_value', 'product'], name='spec_key_numeric_idx'),
+        ]
+
+    def parse_value(self):
+        """
+        Actualiza la clave normalizada y el valor numérico. save() la llama
+        automáticamente; las cargas con bulk_create deben llamarla antes.
+        """
+        self.normalized_key = normalize_spec_key(self.key)
+        self.numeric_value, self.unit = parse_spec_value(self.value)
+
+    def save(self, *args, **kwargs):
+        self.parse_value()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_key', 'numeric_value', 'unit'}
+        super().save(*args, **kwargs)
+
+
+class CatalogVersion(models.Model):
+    """
+    Versión del catálogo compartida por todos los procesos (una sola fila, ver
+    products/catalog.py). Las señales la incrementan al confirmar cualquier
+    cambio del inventario.
+    """
+    version = models.BigIntegerField()
+    modified_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"{self.product.name} - {self.key}"
\ No newline at end of file
+        return f"Catálogo v{self.version}"
@@ -0,0 +1,193 @@
+# products/pagination.py
+"""
+Paginación por cursor (keyset) para los endpoints del catálogo.
+
+Cada página se pide a partir de los valores de orden del último (o primer)
+elemento de la anterior: `WHERE (price, id) > (x, y) ORDER BY price, id LIMIT n`.
+Con un índice sobre el campo de orden, la página N cuesta lo mismo que la
+primera. `id` se agrega siempre como desempate para que el orden sea total.
+
+Cuando el queryset ya trae un orden propio que no viene de `ordering` (por
+ejemplo, la relevancia de una búsqueda), se conserva ese orden y el cursor
+guarda un desplazamiento.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = settings.CATALOG_PAGE_SIZE
+    max_page_size = settings.CATALOG_MAX_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        cursor = self.decode_cursor(request)
+
+        if self.ordering is None:
+            return self.paginate_by_offset(queryset, cursor)
+        return self.paginate_by_keyset(queryset, cursor)
+
+    def paginate_by_keyset(self, queryset, cursor):
+        reverse = bool(cursor and cursor['r'])
+        ordering = [(field, descending != reverse) for field, descending in self.ordering]
+        try:
+            queryset = self.keyset_queryset(queryset, ordering, cursor['k'] if cursor else None)
+        except (ValidationError, ValueError, TypeError):
+            # Valores del cursor que no corresponden al tipo de los campos
+            raise NotFound(self.invalid_cursor_message)
+
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        # Al retroceder, la página siguiente siempre existe (es de donde venimos)
+        has_next = has_more if not reverse else True
+        has_previous = cursor is not None if not reverse else has_more
+        self.next_cursor = self.keyset_cursor(page[-1], reverse=False) if page and has_next else None
+        self.previous_cursor = self.keyset_cursor(page[0], reverse=True) if page and has_previous else None
+        return page
+
+    def paginate_by_offset(self, queryset, cursor):
+        offset = cursor['p'] if cursor is not None else 0
+        page = list(queryset[offset:offset + self.page_size + 1])
+        has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = {'p': offset + self.page_size} if has_next else None
+        self.previous_cursor = {'p': max(offset - self.page_size, 0)} if offset > 0 else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.next_cursor),
+            'previous': self.get_link(self.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Lista de (campo, descendente) según el parámetro `ordering` o el orden
+        por defecto de la vista, con `id` como desempate. Devuelve None si el
+        queryset ya viene ordenado por otro criterio y no se pidió un orden.
+        """
+        ordering = None
+        for backend in getattr(view, 'filter_backends', ()):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            if queryset.ordered:
+                return None
+            ordering = ['id']
+
+        keyset = []
+        for field in ordering:
+            name = field.lstrip('-')
+            try:
+                queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Sólo se admiten campos propios del modelo, que pueden compararse en la base de datos
+                continue
+            keyset.append((name, field.startswith('-')))
+            if name == 'id':
+                break
+        if not keyset or keyset[-1][0] != 'id':
+            # El desempate sigue la dirección del primer campo para recorrer un único índice
+            keyset.append(('id', keyset[0][1] if keyset else False))
+        return keyset
+
+    @classmethod
+    def keyset_queryset(cls, queryset, ordering, values=None):
+        """Ordena el queryset según `ordering` y, si hay cursor, lo filtra a partir de `values`"""
+        queryset = queryset.order_by(*[f'-{field}' if descending else field for field, descending in ordering])
+        if values is not None:
+            queryset = queryset.filter(cls.keyset_filter(ordering, values))
+        return queryset
+
+    @staticmethod
+    def keyset_filter(ordering, values):
+        """
+        Filas posteriores a `values` en el orden dado:
+        (a > x) OR (a = x AND b > y) OR ..., precedido por a >= x para que la
+        base de datos pueda recorrer el índice del primer campo como un rango.
+        """
+        condition = Q()
+        for index, (field, descending) in enumerate(ordering):
+            step = Q(**{f'{field}__{"lt" if descending else "gt"}': values[index]})
+            for previous_index, (previous_field, _) in enumerate(ordering[:index]):
+                step &= Q(**{previous_field: values[previous_index]})
+            condition |= step
+        first_field, first_descending = ordering[0]
+        return Q(**{f'{first_field}__{"lte" if first_descending else "gte"}': values[0]}) & condition
+
+    def keyset_cursor(self, instance, reverse):
+        return {
+            'o': [f'-{field}' if descending else field for field, descending in self.ordering],
+            'k': [getattr(instance, field) for field, _ in self.ordering],
+            'r': int(reverse),
+        }
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # El cursor sólo es válido para el orden con el que se generó
+        if self.ordering is None:
+            valid = isinstance(cursor, dict) and isinstance(cursor.get('p'), int) and cursor['p'] >= 0
+        else:
+            expected = [f'-{field}' if descending else field for field, descending in self.ordering]
+            valid = (isinstance(cursor, dict) and cursor.get('o') == expected and cursor.get('r') in (0, 1)
+                     and isinstance(cursor.get('k'), list) and len(cursor['k']) == len(expected))
+        if not valid:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, cursor):
+        # str() conserva los microsegundos de las fechas y la precisión de los Decimal
+        return urlsafe_b64encode(json.dumps(cursor, default=str).encode('utf-8')).decode('ascii')
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        if cursor == {'p': 0}:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(cursor))
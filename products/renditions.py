@@ -0,0 +1,126 @@
+# products/renditions.py
+"""
+Versiones redimensionadas (renditions) de las imágenes de los productos.
+
+De cada imagen original se generan tamaños fijos (miniatura, tarjeta y
+completa) en JPEG y WebP. El nombre de cada versión se deriva del nombre del
+original ("products/ipad.jpg" -> "renditions/products/ipad/card.webp"), así
+que los serializers construyen sus URLs sin consultas. Sólo la miniatura del
+listado comprueba que su versión exista, para usar el original mientras no se
+haya generado; las que existen se recuerdan en el proceso.
+
+`render_renditions` sólo usa Pillow y trabaja sobre bytes, de modo que el
+comando generate_image_renditions puede ejecutarla en un pool de procesos.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_PREFIX = 'renditions'
+
+# nombre -> (ancho, alto); la imagen se recorta centrada para llenar el tamaño
+RENDITIONS = {
+    'thumbnail': (150, 100),
+    'card': (300, 200),
+    'full': (600, 400),
+}
+
+# formato -> (extensión, formato de Pillow, opciones de guardado)
+FORMATS = {
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+}
+
+
+def rendition_name(name, rendition, image_format):
+    """Nombre en el almacenamiento de una versión de la imagen `name`"""
+    base, _ = posixpath.splitext(name)
+    return f'{RENDITIONS_PREFIX}/{base}/{rendition}.{FORMATS[image_format][0]}'
+
+
+# Versiones que ya se vio que existen; las ausentes se vuelven a comprobar
+_existing = set()
+
+
+def rendition_exists(name, rendition, storage, image_format='jpeg'):
+    """Indica si existe una versión de la imagen, recordando las encontradas"""
+    target = rendition_name(name, rendition, image_format)
+    if target in _existing:
+        return True
+    if not storage.exists(target):
+        return False
+    _existing.add(target)
+    return True
+
+
+@receiver(setting_changed)
+def reset_existing_renditions(setting, **kwargs):
+    if setting in ('MEDIA_ROOT', 'STORAGES'):
+        _existing.clear()
+
+
+def render_renditions(data):
+    """
+    Genera todas las versiones de una imagen. Recibe los bytes del original y
+    devuelve {(versión, formato): bytes}.
+    """
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(data))
+    # Con JPEG, decodifica directamente a una escala reducida cercana al tamaño mayor
+    largest = max(RENDITIONS.values())
+    image.draft('RGB', largest)
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    rendered = {}
+    for rendition, size in RENDITIONS.items():
+        resized = ImageOps.fit(image, size, Image.LANCZOS)
+        for image_format, (_, pillow_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, format=pillow_format, **options)
+            rendered[rendition, image_format] = buffer.getvalue()
+    return rendered
+
+
+def has_renditions(name, storage):
+    """Indica si ya existen todas las versiones de la imagen"""
+    return all(
+        storage.exists(rendition_name(name, rendition, image_format))
+        for rendition in RENDITIONS for image_format in FORMATS
+    )
+
+
+def save_renditions(name, rendered, storage):
+    """Guarda (reemplazando) las versiones generadas por render_renditions"""
+    for (rendition, image_format), content in rendered.items():
+        target = rendition_name(name, rendition, image_format)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(content))
+        _existing.add(target)
+
+
+def generate_renditions(name, storage, force=False):
+    """
+    Genera y guarda las versiones de la imagen `name` si faltan (o siempre con
+    `force`). Devuelve True si se generaron.
+    """
+    if not force and has_renditions(name, storage):
+        return False
+    with storage.open(name, 'rb') as original:
+        data = original.read()
+    save_renditions(name, render_renditions(data), storage)
+    return True
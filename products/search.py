@@ -0,0 +1,311 @@
+# products/search.py
+"""
+Índice de búsqueda de texto completo del catálogo.
+
+Cada producto se indexa con su nombre, marca, categoría, descripción y
+especificaciones. El texto se normaliza en Python (minúsculas, sin acentos ni
+puntuación) antes de indexarse y antes de buscar, de modo que "teléfono" y
+"telefono" son equivalentes en todos los motores:
+
+- PostgreSQL: tabla `products_product_search` con una columna `tsvector`
+  ponderada (configuración `spanish`, que aplica el stemmer Snowball) y un
+  índice GIN. El orden usa `ts_rank_cd`.
+- SQLite: tabla virtual FTS5 `products_product_fts`. FTS5 no incluye un
+  stemmer para español, así que los términos se reducen con un stemmer ligero
+  antes de indexarlos y de buscarlos. El orden usa `bm25`.
+
+En otros motores no hay índice y la búsqueda vuelve al `SearchFilter` de DRF.
+Las señales de los modelos mantienen el índice sincronizado; las cargas
+masivas (`bulk_create`, `update`) deben llamar a `rebuild_search_index`.
+"""
+import logging
+import re
+
+from django.db import connections, transaction
+
+from buynlarge.text import fold_text
+
+logger = logging.getLogger(__name__)
+
+# Productos que se indexan por sentencia
+INDEX_BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Palabras vacías que se descartan en SQLite (PostgreSQL usa su propio diccionario)
+SPANISH_STOP_WORDS = frozenset([
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'es', 'la', 'las', 'lo', 'los', 'o', 'para', 'por',
+    'que', 'se', 'sin', 'su', 'sus', 'un', 'una', 'unas', 'unos', 'y',
+])
+
+
+def tokenize(text):
+    """Términos normalizados de un texto, sin acentos ni puntuación"""
+    return _TOKEN_RE.findall(fold_text(text or ''))
+
+
+def stem(token):
+    """
+    Stemmer ligero para español: elimina plurales y la vocal de género
+    ("computadoras" -> "computador", "telefonos" -> "telefon").
+    Los términos cortos y los que contienen dígitos se conservan.
+    """
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith('ces') and len(token) > 4 and token[-4] in 'aeiou':
+        token = token[:-3] + 'z'
+    elif token.endswith('es') and len(token) > 4 and token[-3] not in 'aeiou':
+        token = token[:-2]
+    elif token.endswith('s'):
+        token = token[:-1]
+    if token[-1] in 'aeo' and len(token) > 3:
+        token = token[:-1]
+    return token
+
+
+def search_terms(text):
+    """Términos de búsqueda de SQLite: normalizados, sin palabras vacías y reducidos a su raíz"""
+    return [stem(token) for token in tokenize(text) if token not in SPANISH_STOP_WORDS]
+
+
+def fetch_search_documents(product_model, specification_model, product_ids=None, using='default'):
+    """
+    Texto indexable de los productos indicados (o de todo el catálogo):
+    {product_id: {'name', 'brand', 'category', 'description', 'specs'}}.
+    Recibe los modelos para poder usarse desde las migraciones.
+    """
+    queryset = product_model.objects.using(using).order_by('id')
+    specs_queryset = specification_model.objects.using(using).order_by('id')
+    if product_ids is not None:
+        queryset = queryset.filter(id__in=product_ids)
+        specs_queryset = specs_queryset.filter(product_id__in=product_ids)
+
+    documents = {
+        row['id']: {
+            'name': row['name'],
+            'brand': row['brand__name'],
+            'category': row['category__name'],
+            'description': row['description'],
+            'specs': [],
+        }
+        for row in queryset.values('id', 'name', 'description', 'brand__name', 'category__name')
+    }
+    for product_id, key, value in specs_queryset.values_list('product_id', 'key', 'value'):
+        if product_id in documents:
+            documents[product_id]['specs'].append(f'{key} {value}')
+
+    for document in documents.values():
+        document['specs'] = ' '.join(document['specs'])
+    return documents
+
+
+class ProductSearchBackend:
+    """Operaciones comunes de los índices de búsqueda; cada motor implementa el SQL"""
+
+    vendor = None
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self, schema_editor):
+        raise NotImplementedError
+
+    def drop_index(self, schema_editor):
+        raise NotImplementedError
+
+    def write_documents(self, cursor, documents):
+        raise NotImplementedError
+
+    def delete_documents(self, cursor, product_ids):
+        raise NotImplementedError
+
+    def clear(self, cursor):
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """Filtra el queryset de productos por la búsqueda y lo ordena por relevancia"""
+        raise NotImplementedError
+
+    def index_products(self, product_model, specification_model, product_ids=None):
+        """
+        Reindexa los productos indicados (o todo el catálogo). Los ids que ya
+        no existen se eliminan del índice.
+        """
+        alias = self.connection.alias
+        with transaction.atomic(using=alias), self.connection.cursor() as cursor:
+            if product_ids is None:
+                self.clear(cursor)
+                documents = fetch_search_documents(product_model, specification_model, using=alias)
+                self._write_batches(cursor, list(documents.items()))
+                return len(documents)
+
+            product_ids = sorted(set(product_ids))
+            count = 0
+            for start in range(0, len(product_ids), INDEX_BATCH_SIZE):
+                batch = product_ids[start:start + INDEX_BATCH_SIZE]
+                documents = fetch_search_documents(product_model, specification_model, batch, using=alias)
+                self.delete_documents(cursor, batch)
+                self._write_batches(cursor, list(documents.items()))
+                count += len(documents)
+            return count
+
+    def _write_batches(self, cursor, items):
+        for start in range(0, len(items), INDEX_BATCH_SIZE):
+            self.write_documents(cursor, items[start:start + INDEX_BATCH_SIZE])
+
+
+class PostgresSearchBackend(ProductSearchBackend):
+    vendor = 'postgresql'
+    table = 'products_product_search'
+    config = 'spanish'
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE TABLE {self.table} ("
+            f"product_id bigint PRIMARY KEY REFERENCES products_product (id) "
+            f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX {self.table}_document_idx ON {self.table} USING GIN (document)")
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def write_documents(self, cursor, documents):
+        # Nombre (A) > marca y categoría (B) > especificaciones (C) > descripción (D)
+        cursor.executemany(
+            f"INSERT INTO {self.table} (product_id, document) VALUES (%s, "
+            f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+            f"setweight(to_tsvector('{self.config}', %s), 'B') || "
+            f"setweight(to_tsvector('{self.config}', %s), 'C') || "
+            f"setweight(to_tsvector('{self.config}', %s), 'D')) "
+            f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+            [
+                (
+                    product_id,
+                    fold_text(document['name']),
+                    fold_text(f"{document['brand']} {document['category']}"),
+                    fold_text(document['specs']),
+                    fold_text(document['description']),
+                )
+                for product_id, document in documents
+            ]
+        )
+
+    def delete_documents(self, cursor, product_ids):
+        cursor.execute(f"DELETE FROM {self.table} WHERE product_id = ANY(%s)", [list(product_ids)])
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+
+    def filter(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        # Todos los términos deben aparecer; el último admite prefijos para búsquedas incompletas
+        tsquery = ' & '.join(tokens) + ':*'
+        product_table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f"{self.table}.product_id = {product_table}.id",
+                f"{self.table}.document @@ to_tsquery('{self.config}', %s)",
+            ],
+            params=[tsquery],
+            select={'search_rank': f"ts_rank_cd({self.table}.document, to_tsquery('{self.config}', %s))"},
+            select_params=[tsquery],
+        ).order_by('-search_rank', 'id')
+
+
+class SQLiteSearchBackend(ProductSearchBackend):
+    vendor = 'sqlite'
+    table = 'products_product_fts'
+    # Pesos de bm25 por columna: name, brand, category, specs, description
+    column_weights = (10.0, 5.0, 5.0, 2.0, 1.0)
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+            f"name, brand, category, specs, description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    @staticmethod
+    def _index_text(text):
+        return ' '.join(stem(token) for token in tokenize(text))
+
+    def write_documents(self, cursor, documents):
+        cursor.executemany(
+            f"INSERT INTO {self.table} (rowid, name, brand, category, specs, description) "
+            f"VALUES (%s, %s, %s, %s, %s, %s)",
+            [
+                (
+                    product_id,
+                    self._index_text(document['name']),
+                    self._index_text(document['brand']),
+                    self._index_text(document['category']),
+                    self._index_text(document['specs']),
+                    self._index_text(document['description']),
+                )
+                for product_id, document in documents
+            ]
+        )
+
+    def delete_documents(self, cursor, product_ids):
+        product_ids = list(product_ids)
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", product_ids)
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+
+    def filter(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        # Los términos son alfanuméricos, así que pueden citarse sin escapar; todos deben aparecer
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in self.column_weights)
+        product_table = queryset.model._meta.db_table
+        # Un join con la tabla FTS5: bm25 sólo puede calcularse en la consulta que hace el MATCH
+        return queryset.extra(
+            tables=[self.table],
+            where=[f"{self.table}.rowid = {product_table}.id", f"{self.table} MATCH %s"],
+            params=[match],
+            # bm25 es menor cuanto más relevante es el documento
+            select={'search_rank': f"bm25({self.table}, {weights})"},
+        ).order_by('search_rank', 'id')
+
+
+SEARCH_BACKENDS = {backend.vendor: backend for backend in (PostgresSearchBackend, SQLiteSearchBackend)}
+
+
+def get_search_backend(using='default'):
+    """Backend de búsqueda de la conexión indicada o None si el motor no tiene índice"""
+    connection = connections[using]
+    backend_class = SEARCH_BACKENDS.get(connection.vendor)
+    return backend_class(connection) if backend_class else None
+
+
+def reindex_products(product_ids, using='default'):
+    """Actualiza en el índice los productos indicados (los eliminados se quitan del índice)"""
+    from .models import Product, ProductSpecification
+
+    backend = get_search_backend(using)
+    if backend is None or not product_ids:
+        return 0
+    return backend.index_products(Product, ProductSpecification, product_ids)
+
+
+def rebuild_search_index(using='default'):
+    """Reconstruye el índice completo, por ejemplo tras una carga masiva"""
+    from .models import Product, ProductSpecification
+
+    backend = get_search_backend(using)
+    if backend is None:
+        return 0
+    count = backend.index_products(Product, ProductSpecification)
+    logger.info(f"Índice de búsqueda reconstruido con {count} productos")
+    return count
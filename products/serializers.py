@@ -1,6 +1,7 @@
 # products/serializers.py
 from rest_framework import serializers
 from .models import Category, Brand, Product, ProductSpecification
+from .renditions import FORMATS, RENDITIONS, rendition_exists, rendition_name
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -21,23 +22,145 @@ class ProductSpecificationSerializer(serializers.ModelSerializer):
         fields = ['id', 'key', 'value']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Permite al cliente elegir los campos de la respuesta:
+    `?fields=id,name,price` limita los campos y `?expand=specifications`
+    agrega los campos opcionales listados en `Meta.expandable_fields`.
+    Los nombres desconocidos se ignoran.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        expandable = getattr(self.Meta, 'expandable_fields', ())
+        expand = set(query_param_list(request, 'expand'))
+        for field_name in expandable:
+            if field_name not in expand:
+                self.fields.pop(field_name, None)
+
+        requested = query_param_list(request, 'fields')
+        if requested:
+            allowed = set(requested) | (expand & set(expandable))
+            for field_name in list(self.fields):
+                if field_name not in allowed:
+                    self.fields.pop(field_name)
+
+
+def query_param_list(request, name):
+    """Valores separados por comas de un parámetro de consulta"""
+    value = request.query_params.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class ImageURLMixin:
+    """
+    Genera la URL absoluta de las imágenes calculando el prefijo del host una
+    sola vez por serializer en lugar de llamar a build_absolute_uri por imagen.
+    En un listado todos los elementos comparten la misma instancia.
+    """
+
+    _base_url = None
+
+    def image_url(self, image):
+        if not image:
+            return None
+        return self.absolute_url(image.url)
+
+    def absolute_url(self, url):
+        if url.startswith(('http://', 'https://')):
+            return url
+        if self._base_url is None:
+            request = self.context.get('request')
+            self._base_url = request.build_absolute_uri('/').rstrip('/') if request else ''
+        return self._base_url + url
+
+    def rendition_url(self, image, rendition, image_format='jpeg'):
+        if not image:
+            return None
+        return self.absolute_url(image.storage.url(rendition_name(image.name, rendition, image_format)))
+
+    def renditions(self, image):
+        """{versión: {'jpeg': url, 'webp': url, 'width': ancho, 'height': alto}} (ver products/renditions.py)"""
+        if not image:
+            return None
+        return {
+            rendition: {
+                **{image_format: self.rendition_url(image, rendition, image_format) for image_format in FORMATS},
+                'width': width,
+                'height': height,
+            }
+            for rendition, (width, height) in RENDITIONS.items()
+        }
+
+    def srcset(self, image):
+        """Atributo srcset de <img> (JPEG) y de <source type="image/webp"> con todas las versiones"""
+        if not image:
+            return None
+        return {
+            image_format: ', '.join(
+                f'{self.rendition_url(image, rendition, image_format)} {width}w'
+                for rendition, (width, _) in RENDITIONS.items()
+            )
+            for image_format in FORMATS
+        }
+
+
+class ProductSerializer(SparseFieldsetMixin, ImageURLMixin, serializers.ModelSerializer):
+    """Representación completa de un producto, usada en el detalle"""
     category_name = serializers.ReadOnlyField(source='category.name')
     brand_name = serializers.ReadOnlyField(source='brand.name')
     specifications = ProductSpecificationSerializer(many=True, read_only=True)
     image = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'image',
+        fields = ['id', 'name', 'description', 'price', 'stock', 'image', 'renditions', 'srcset',
                   'category', 'category_name', 'brand', 'brand_name',
                   'specifications', 'created_at', 'updated_at']
 
     def get_image(self, obj):
         """Devuelve la URL completa de la imagen si existe"""
-        if obj.image and hasattr(obj.image, 'url'):
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url
-        return None
\ No newline at end of file
+        return self.image_url(obj.image)
+
+    def get_renditions(self, obj):
+        return self.renditions(obj.image)
+
+    def get_srcset(self, obj):
+        return self.srcset(obj.image)
+
+
+class ProductListSerializer(SparseFieldsetMixin, ImageURLMixin, serializers.ModelSerializer):
+    """
+    Representación compacta para los listados. `thumbnail` es la miniatura
+    JPEG o, si todavía no se generó, la imagen original; las especificaciones y las demás versiones de la imagen sólo se
+    incluyen con `?expand=specifications,renditions,srcset`.
+    """
+    category_name = serializers.ReadOnlyField(source='category.name')
+    brand_name = serializers.ReadOnlyField(source='brand.name')
+    thumbnail = serializers.SerializerMethodField()
+    specifications = ProductSpecificationSerializer(many=True, read_only=True)
+    renditions = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'stock', 'thumbnail', 'category_name', 'brand_name', 'specifications',
+                  'renditions', 'srcset']
+        expandable_fields = ['specifications', 'renditions', 'srcset']
+
+    def get_thumbnail(self, obj):
+        if obj.image and not rendition_exists(obj.image.name, 'thumbnail', obj.image.storage):
+            return self.image_url(obj.image)
+        return self.rendition_url(obj.image, 'thumbnail')
+
+    def get_renditions(self, obj):
+        return self.renditions(obj.image)
+
+    def get_srcset(self, obj):
+        return self.srcset(obj.image)
@@ -0,0 +1,86 @@
+# products/signals.py
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .models import Category, Brand, Product, ProductSpecification
+from .renditions import generate_renditions
+from .search import reindex_products
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductSpecification)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductSpecification)
+def invalidate_catalog_snapshot(sender, **kwargs):
+    """
+    Incrementa la versión del catálogo cuando cambia cualquier dato del inventario.
+    Se espera al commit para que ningún worker reconstruya el snapshot con datos
+    que todavía no son visibles (o que se revierten).
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+def schedule_reindex(product_ids, using):
+    """Reindexa los productos al confirmar la transacción, cuando sus datos ya son visibles"""
+    transaction.on_commit(partial(reindex_products, product_ids, using), using=using)
+
+
+# Campos del producto que forman parte de su documento de búsqueda
+PRODUCT_SEARCH_FIELDS = {'name', 'description', 'brand', 'category'}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def sync_product_search_index(sender, instance, using, update_fields=None, **kwargs):
+    # Guardar sólo el stock o el precio no cambia el documento
+    if update_fields and not PRODUCT_SEARCH_FIELDS.intersection(update_fields):
+        return
+    schedule_reindex([instance.pk], using)
+
+
+@receiver(post_save, sender=ProductSpecification)
+@receiver(post_delete, sender=ProductSpecification)
+def sync_specification_search_index(sender, instance, using, **kwargs):
+    schedule_reindex([instance.product_id], using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def sync_related_search_index(sender, instance, using, created, **kwargs):
+    """El nombre de la marca y de la categoría forma parte del documento de cada producto"""
+    if created:
+        return
+    field = 'category' if sender is Category else 'brand'
+    product_ids = list(Product.objects.using(using).filter(**{field: instance}).values_list('id', flat=True))
+    if product_ids:
+        schedule_reindex(product_ids, using)
+
+
+def generate_image_renditions(storage, name):
+    try:
+        generate_renditions(name, storage)
+    except Exception as e:
+        # Una imagen ausente o corrupta no debe romper el guardado del producto
+        logger.warning(f"No se pudieron generar las versiones de {name}: {e}")
+
+
+@receiver(post_save, sender=Product)
+def schedule_image_renditions(sender, instance, using, update_fields=None, **kwargs):
+    """Genera las versiones de la imagen al confirmar la transacción (sólo las que faltan)"""
+    if not settings.PRODUCT_IMAGE_RENDITIONS_ON_SAVE or not instance.image:
+        return
+    if update_fields and 'image' not in update_fields:
+        return
+    transaction.on_commit(partial(generate_image_renditions, instance.image.storage, instance.image.name), using=using)
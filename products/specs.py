@@ -0,0 +1,89 @@
+# products/specs.py
+"""
+Valores tipados de las especificaciones de los productos.
+
+Las especificaciones son texto libre ("16GB DDR4", "15.6 pulgadas FHD",
+"6 horas"). Al guardarse se extrae el número inicial y su unidad, convertido a
+una unidad canónica por magnitud ("1TB" -> 1024 gb, "500 g" -> 0.5 kg), y la
+clave se normaliza ("Form Factor" -> "form factor") para poder filtrar con
+índices: `?spec.RAM__gte=16`, `?spec.Storage__gte=1TB`, `?spec.Color__contains=negro`.
+"""
+import re
+
+from buynlarge.text import fold_text
+
+# unidad escrita -> (unidad canónica, factor de conversión)
+UNIT_CONVERSIONS = {
+    'kb': ('gb', 1 / 1024 ** 2),
+    'mb': ('gb', 1 / 1024),
+    'gb': ('gb', 1),
+    'tb': ('gb', 1024),
+    'mhz': ('ghz', 1 / 1000),
+    'ghz': ('ghz', 1),
+    'g': ('kg', 1 / 1000),
+    'gr': ('kg', 1 / 1000),
+    'kg': ('kg', 1),
+    'lb': ('kg', 0.4536),
+    'lbs': ('kg', 0.4536),
+    'min': ('h', 1 / 60),
+    'minutos': ('h', 1 / 60),
+    'h': ('h', 1),
+    'hr': ('h', 1),
+    'hrs': ('h', 1),
+    'hora': ('h', 1),
+    'horas': ('h', 1),
+    'hours': ('h', 1),
+    '"': ('in', 1),
+    'in': ('in', 1),
+    'pulgada': ('in', 1),
+    'pulgadas': ('in', 1),
+    'mm': ('cm', 1 / 10),
+    'cm': ('cm', 1),
+}
+
+_VALUE_RE = re.compile(r'^\s*(\d+(?:[.,]\d+)?)\s*([a-z]+|")?')
+
+# Búsquedas admitidas en los filtros `spec.<clave>__<búsqueda>`
+NUMERIC_LOOKUPS = {'gt', 'gte', 'lt', 'lte', 'exact'}
+TEXT_LOOKUPS = {'contains'}
+
+
+def normalize_spec_key(key):
+    """Clave comparable: minúsculas, sin acentos y con '_' como espacio ("Form_Factor" -> "form factor")"""
+    return ' '.join(fold_text(key).replace('_', ' ').split())
+
+
+def parse_spec_value(value):
+    """
+    (número en la unidad canónica, unidad canónica) del valor de una
+    especificación, o (None, '') si no empieza con un número.
+    Las unidades desconocidas se conservan tal cual ("4000 mAh" -> (4000.0, 'mah')).
+    """
+    match = _VALUE_RE.match(fold_text(value or ''))
+    if match is None:
+        return None, ''
+    number = float(match.group(1).replace(',', '.'))
+    unit = match.group(2) or ''
+    canonical, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+    return number * factor, canonical
+
+
+def backfill_spec_values(specification_model, batch_size=1000, using='default'):
+    """
+    Calcula la clave normalizada y el valor numérico de las especificaciones
+    existentes por lotes. Recibe el modelo para poder usarse desde las migraciones.
+    Devuelve el número de especificaciones actualizadas.
+    """
+    queryset = specification_model.objects.using(using).order_by('id')
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).only('id', 'key', 'value')[:batch_size])
+        if not batch:
+            return updated
+        for specification in batch:
+            specification.normalized_key = normalize_spec_key(specification.key)
+            specification.numeric_value, specification.unit = parse_spec_value(specification.value)
+        specification_model.objects.using(using).bulk_update(batch, ['normalized_key', 'numeric_value', 'unit'])
+        updated += len(batch)
+        last_id = batch[-1].id
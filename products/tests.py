@@ -1,3 +1,773 @@
-from django.test import TestCase
+import os
+import random
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from decimal import Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from buynlarge.queries import track_queries
+from buynlarge.testing import QueryBudgetMixin, QueryPlanMixin
+from .catalog import (CatalogSnapshot, bump_catalog_version, get_catalog_last_modified, get_catalog_snapshot,
+                      get_catalog_version)
+from .filters import ProductSearchFilter
+from .models import Category, Brand, CatalogVersion, Product, ProductSpecification
+from .pagination import KeysetPagination
+from .renditions import RENDITIONS, has_renditions, rendition_name
+from .search import get_search_backend, rebuild_search_index
+from .specs import parse_spec_value
+from .views import ProductViewSet
+
+
+class ProductQueryPlanTests(QueryPlanMixin, TestCase):
+    """Las consultas de ProductViewSet deben resolverse con índices sobre un catálogo sembrado"""
+
+    watched_tables = ('products_product', 'products_productspecification')
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(10)
+        categories = Category.objects.bulk_create(
+            Category(name=name) for name in ['Computadoras', 'Teléfonos', 'Tablets', 'Accesorios', 'Audio', 'Gaming']
+        )
+        brands = Brand.objects.bulk_create(Brand(name=f'Marca {index}') for index in range(40))
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'Producto {index}',
+                description='Producto de prueba',
+                price=Decimal(rng.randint(1000, 300000)) / 100,
+                stock=rng.choice([0] + [rng.randint(1, 50)] * 9),
+                category=rng.choice(categories),
+                brand=rng.choice(brands),
+            )
+            for index in range(5000)
+        )
+        specifications = [
+            ProductSpecification(product=product, key=key, value=rng.choice(values))
+            for product in products
+            for key, values in (('RAM', ['4GB', '8GB', '16GB', '32GB']), ('Color', ['Negro', 'Azul', 'Blanco']))
+        ]
+        for specification in specifications:
+            specification.parse_value()
+        ProductSpecification.objects.bulk_create(specifications)
+        cls.category = categories[0]
+        cls.brand = brands[0]
+        cls.analyze_database()
+
+    def product_list_queryset(self, params):
+        view = ProductViewSet(action='list', format_kwarg=None)
+        view.request = Request(APIRequestFactory().get('/api/products/', params))
+        return view.filter_queryset(view.get_queryset())
+
+    def test_product_list_filters_use_indexes(self):
+        cases = {
+            'category_name': {'category_name': 'Computadoras'},
+            'brand_name': {'brand_name': 'Marca 0'},
+            'category': {'category': self.category.id},
+            'brand': {'brand': self.brand.id},
+            'price_range': {'min_price': '100', 'max_price': '120'},
+            'category_price_range': {'category': self.category.id, 'min_price': '100', 'max_price': '500'},
+            'brand_price_range': {'brand_name': 'Marca 0', 'min_price': '100', 'max_price': '500'},
+            'stock': {'stock': 0},
+            'spec_range': {'spec.RAM__gte': '16GB'},
+            'spec_multiple': {'spec.RAM__gte': '16', 'spec.Color': 'negro'},
+            'spec_category': {'category': self.category.id, 'spec.RAM__lt': '8'},
+        }
+        for label, params in cases.items():
+            with self.subTest(label):
+                self.assertNoFullTableScan(self.product_list_queryset(params), label)
+
+    def test_deep_keyset_pages_use_indexes(self):
+        middle = Product.objects.order_by('id')[2500]
+        for field in ('price', '-price', 'name', 'created_at', '-created_at', 'stock'):
+            with self.subTest(field):
+                ordering = [(field.lstrip('-'), field.startswith('-')), ('id', field.startswith('-'))]
+                values = [getattr(middle, field.lstrip('-')), middle.id]
+                queryset = KeysetPagination.keyset_queryset(Product.objects.all(), ordering, values)
+                self.assertNoFullTableScan(queryset[:21], f'página por cursor ordenada por {field}')
+
+    def test_product_search_uses_index(self):
+        if get_search_backend() is None:
+            self.skipTest('El motor no tiene índice de búsqueda')
+        rebuild_search_index()
+        self.assertNoFullTableScan(self.product_list_queryset({'search': 'producto 42'}), 'search')
+
+
+class ProductSearchTests(TestCase):
+    """Búsqueda de texto completo: raíces en español, acentos, relevancia y sincronización del índice"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.computers = Category.objects.create(name='Computadoras')
+        cls.phones = Category.objects.create(name='Teléfonos')
+        cls.samsung = Brand.objects.create(name='Samsung')
+        cls.lenovo = Brand.objects.create(name='Lenovo')
+        cls.laptop = Product.objects.create(
+            name='ThinkPad X1 Carbon', description='Portátil ultraligera para profesionales',
+            price=Decimal('1500.00'), stock=5, category=cls.computers, brand=cls.lenovo
+        )
+        cls.phone = Product.objects.create(
+            name='Galaxy S23', description='Teléfono con cámara de alta resolución',
+            price=Decimal('900.00'), stock=10, category=cls.phones, brand=cls.samsung
+        )
+        cls.case = Product.objects.create(
+            name='Funda protectora', description='Accesorio compatible con el Galaxy S23',
+            price=Decimal('20.00'), stock=50, category=cls.phones, brand=cls.samsung
+        )
+        ProductSpecification.objects.create(product=cls.laptop, key='Procesador', value='Intel Core i7')
+
+    def setUp(self):
+        if get_search_backend() is None:
+            self.skipTest('El motor no tiene índice de búsqueda')
+        rebuild_search_index()
+
+    def search(self, query, **params):
+        view = ProductViewSet(action='list', format_kwarg=None)
+        view.request = Request(APIRequestFactory().get('/api/products/', {'search': query, **params}))
+        return list(view.filter_queryset(view.get_queryset()))
+
+    def test_plurals_and_accents_match(self):
+        self.assertEqual(self.search('computadora'), [self.laptop])
+        self.assertEqual(self.search('telefonos'), [self.phone, self.case])
+        self.assertEqual(self.search('ULTRALIGERAS portatiles'), [self.laptop])
+
+    def test_brand_category_and_specs_are_indexed(self):
+        self.assertEqual(self.search('lenovo i7'), [self.laptop])
+        self.assertEqual(set(self.search('samsung')), {self.phone, self.case})
+
+    def test_results_are_ordered_by_relevance(self):
+        # El nombre pesa más que la descripción
+        self.assertEqual(self.search('galaxy'), [self.phone, self.case])
+
+    def test_explicit_ordering_overrides_relevance(self):
+        self.assertEqual(self.search('galaxy', ordering='price'), [self.case, self.phone])
+
+    def test_prefix_and_unmatched_queries(self):
+        self.assertEqual(self.search('think'), [self.laptop])
+        self.assertEqual(self.search('refrigerador'), [])
+        self.assertEqual(self.search('de la'), [])
+
+    def test_index_follows_model_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.laptop.name = 'IdeaPad Slim'
+            self.laptop.save()
+        self.assertEqual(self.search('thinkpad'), [])
+        self.assertEqual(self.search('ideapad'), [self.laptop])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductSpecification.objects.create(product=self.phone, key='Batería', value='Carga rápida')
+        self.assertEqual(self.search('carga rapida'), [self.phone])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lenovo.name = 'Lenovo Group'
+            self.lenovo.save()
+        self.assertEqual(self.search('group'), [self.laptop])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case.delete()
+        self.assertEqual(self.search('funda'), [])
+
+    def test_falls_back_to_search_filter_without_index(self):
+        view = ProductViewSet(action='list', format_kwarg=None)
+        view.request = Request(APIRequestFactory().get('/api/products/', {'search': 'Galaxy'}))
+        with patch('products.filters.get_search_backend', return_value=None):
+            queryset = ProductSearchFilter().filter_queryset(view.request, view.get_queryset(), view)
+        self.assertEqual(set(queryset), {self.phone, self.case})
+
+
+class KeysetPaginationTests(TestCase):
+    """Recorrido de los endpoints del catálogo con cursores, incluidos empates en el campo de orden"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Audio')
+        brand = Brand.objects.create(name='JBL')
+        Product.objects.bulk_create(
+            Product(name=f'Parlante {index:02d}', description='Parlante', price=Decimal(100 + index % 4),
+                    stock=index, category=category, brand=brand)
+            for index in range(11)
+        )
+        rebuild_search_index()
+
+    def walk(self, url, params, link='next'):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            if not response.data[link]:
+                return pages, response
+            response = self.client.get(response.data[link])
+
+    def test_pages_follow_ordering_with_id_tie_breaker(self):
+        for ordering in ('price', '-price', 'name', '-stock'):
+            with self.subTest(ordering):
+                tie_breaker = '-id' if ordering.startswith('-') else 'id'
+                expected = list(Product.objects.order_by(ordering, tie_breaker).values_list('id', flat=True))
+                pages, last = self.walk('/api/products/products/', {'ordering': ordering, 'page_size': 3})
+                self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+                self.assertEqual(sum(pages, []), expected)
+
+                # Volver hacia atrás desde la última página reproduce las mismas páginas
+                back, _ = self.walk(last.data['previous'], {}, link='previous')
+                self.assertEqual(back, pages[-2::-1])
+
+    def test_first_page_has_no_previous(self):
+        response = self.client.get('/api/products/brands/')
+        self.assertIsNone(response.data['previous'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_search_pages_keep_relevance_order(self):
+        pages, _ = self.walk('/api/products/products/', {'search': 'parlante', 'page_size': 4})
+        self.assertEqual([len(page) for page in pages], [4, 4, 3])
+        self.assertEqual(len(set(sum(pages, []))), 11)
+
+    def test_invalid_cursors_are_rejected(self):
+        response = self.client.get('/api/products/products/', {'ordering': 'price', 'page_size': 3})
+        cursor = response.data['next'].split('cursor=')[1].split('&')[0]
+        self.assertEqual(self.client.get('/api/products/products/', {'cursor': 'basura'}).status_code, 404)
+        # Un cursor sólo sirve para el orden con el que se generó
+        self.assertEqual(
+            self.client.get('/api/products/products/', {'cursor': cursor, 'ordering': 'name'}).status_code, 404
+        )
+
+
+class CatalogSnapshotTests(TestCase):
+    """El snapshot sigue a los cambios confirmados del catálogo, hechos en este proceso o en otro"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Audio')
+        cls.brand = Brand.objects.create(name='Sony')
+        cls.product = Product.objects.create(name='WH-1000XM5', description='Audífonos', price=Decimal('350.00'),
+                                             stock=4, category=cls.category, brand=cls.brand)
+
+    def setUp(self):
+        bump_catalog_version()
+
+    def test_product_save_invalidates_on_commit(self):
+        snapshot = get_catalog_snapshot()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.price = Decimal('300.00')
+            self.product.save()
+        # Hasta el commit, los workers siguen usando el snapshot anterior
+        self.assertIs(get_catalog_snapshot(), snapshot)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_catalog_snapshot().products[self.product.id]['price'], 300.0)
+
+    def test_delete_and_related_changes_invalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductSpecification.objects.create(product=self.product, key='Batería', value='30 h')
+        self.assertEqual(get_catalog_snapshot().products[self.product.id]['specs'], {'Batería': '30 h'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.name = 'Sony Audio'
+            self.brand.save()
+        self.assertEqual(get_catalog_snapshot().products[self.product.id]['brand'], 'Sony Audio')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        snapshot = get_catalog_snapshot()
+        self.assertNotIn(self.product.id, snapshot.products)
+        self.assertEqual(snapshot.category_product_count(self.category.id), 0)
+
+    def test_bulk_builder_matches_per_row_objects(self):
+        phones = Category.objects.create(name='Teléfonos')
+        samsung = Brand.objects.create(name='Samsung')
+        for name, price, category, brand in (('Galaxy S23', '900.00', phones, samsung),
+                                             ('Galaxy A14', '150.50', phones, samsung),
+                                             ('Xperia 1', '1100.00', phones, self.brand),
+                                             ('Galaxy Buds', '120.00', self.category, samsung)):
+            product = Product.objects.create(name=name, description=name, price=Decimal(price), stock=2,
+                                             category=category, brand=brand, image='products/foto.jpg')
+            ProductSpecification.objects.create(product=product, key='Color', value='Negro')
+        bump_catalog_version()
+        snapshot = get_catalog_snapshot()
+
+        # Referencia: lo que el chatbot armaba producto por producto con el ORM
+        for product in Product.objects.select_related('brand', 'category').prefetch_related('specifications'):
+            with self.subTest(product=product.name):
+                self.assertEqual(snapshot.product_contexts([product.id])[0], {
+                    'id': product.id,
+                    'name': product.name,
+                    'description': product.description,
+                    'price': float(product.price),
+                    'stock': product.stock,
+                    'brand': product.brand.name,
+                    'category': product.category.name,
+                    'image_url': product.image.url if product.image else None,
+                    'created_at': product.created_at.strftime('%Y-%m-%d'),
+                    'specs': {spec.key: spec.value for spec in product.specifications.all()},
+                })
+
+        for category in Category.objects.all():
+            by_brand = {}
+            for product in category.product_set.select_related('brand'):
+                stats = by_brand.setdefault(product.brand.name, {'count': 0, 'min_price': float('inf'),
+                                                                 'max_price': 0, 'total_price': 0})
+                stats['count'] += 1
+                stats['total_price'] += float(product.price)
+                stats['min_price'] = min(stats['min_price'], float(product.price))
+                stats['max_price'] = max(stats['max_price'], float(product.price))
+            for stats in by_brand.values():
+                stats['avg_price'] = stats['total_price'] / stats['count']
+            with self.subTest(category=category.name):
+                self.assertEqual(snapshot.brand_stats([category.id]), by_brand)
+                self.assertEqual(snapshot.category_product_count(category.id), category.product_set.count())
+
+    def test_rows_deleted_between_queries_are_skipped(self):
+        snapshot = get_catalog_snapshot()
+        rows = {self.product.id: snapshot.products[self.product.id]}
+        rebuilt = CatalogSnapshot(snapshot.version, {}, snapshot.brands, rows)
+        self.assertEqual(rebuilt.products, {})
+        self.assertEqual(rebuilt.brand_product_count(self.brand.id), 0)
+
+    def test_version_bumped_by_another_process(self):
+        snapshot = get_catalog_snapshot()
+        # Otro proceso confirma un cambio: sólo la fila compartida cambia
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+        CatalogVersion.objects.update(version=snapshot.version + 1)
+
+        with override_settings(CATALOG_VERSION_CHECK_INTERVAL=60):
+            self.assertIs(get_catalog_snapshot(), snapshot)
+        self.assertEqual(get_catalog_version(max_age=0), snapshot.version + 1)
+        self.assertEqual(get_catalog_snapshot().products[self.product.id]['stock'], 0)
+
+    def test_versions_never_go_back(self):
+        version = get_catalog_version()
+        self.assertGreater(bump_catalog_version(), version)
+        CatalogVersion.objects.all().delete()
+        self.assertGreater(get_catalog_version(max_age=0), version)
+
+
+class ProductRepresentationTests(TestCase):
+    """Representación compacta del listado, campos a pedido y detalle completo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tablets')
+        brand = Brand.objects.create(name='Apple')
+        cls.products = Product.objects.bulk_create(
+            Product(name=f'iPad {index}', description='Tableta', price=Decimal('500.00'), stock=index,
+                    image='products/ipad.jpg', category=category, brand=brand)
+            for index in range(5)
+        )
+        ProductSpecification.objects.bulk_create(
+            ProductSpecification(product=product, key='Almacenamiento', value='256GB') for product in cls.products
+        )
+
+    def setUp(self):
+        # Con la fecha del último cambio registrada, el GET condicional sólo lee la versión del catálogo
+        bump_catalog_version()
+
+    def test_list_is_compact_and_uses_one_query(self):
+        # La lista y la versión del catálogo
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/products/products/')
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'price', 'stock', 'thumbnail', 'category_name', 'brand_name'})
+        # Sin versiones generadas, la miniatura es la imagen original
+        self.assertEqual(item['thumbnail'], 'http://testserver/media/products/ipad.jpg')
+        self.assertEqual((item['brand_name'], item['category_name']), ('Apple', 'Tablets'))
+
+    def test_expand_specifications(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/products/products/', {'expand': 'specifications'})
+        self.assertEqual(response.data['results'][0]['specifications'][0]['value'], '256GB')
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/api/products/products/', {'fields': 'id,name,unknown'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+        response = self.client.get('/api/products/products/', {'fields': 'id', 'expand': 'specifications'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'specifications'})
+
+        response = self.client.get(f'/api/products/products/{self.products[0].id}/', {'fields': 'id,description'})
+        self.assertEqual(response.data, {'id': self.products[0].id, 'description': 'Tableta'})
+
+    def test_detail_keeps_full_representation(self):
+        response = self.client.get(f'/api/products/products/{self.products[0].id}/')
+        self.assertEqual(response.data['description'], 'Tableta')
+        self.assertEqual(response.data['image'], 'http://testserver/media/products/ipad.jpg')
+        self.assertEqual(len(response.data['specifications']), 1)
+
+
+class ConditionalGetTests(TestCase):
+    """Los endpoints del catálogo responden 304 consultando sólo la versión del catálogo si nada cambió"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Gaming')
+        brand = Brand.objects.create(name='Nintendo')
+        cls.product = Product.objects.create(name='Switch', description='Consola', price=Decimal('300.00'),
+                                             stock=3, category=category, brand=brand)
+
+    def setUp(self):
+        bump_catalog_version()
+
+    def test_if_none_match_returns_not_modified_with_one_query(self):
+        for url in ('/api/products/products/', f'/api/products/products/{self.product.id}/',
+                    '/api/products/categories/', '/api/products/brands/'):
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_returns_not_modified_with_one_query(self):
+        response = self.client.get('/api/products/products/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_query_and_catalog_version(self):
+        first = self.client.get('/api/products/products/')['ETag']
+        self.assertNotEqual(self.client.get('/api/products/products/', {'ordering': 'price'})['ETag'], first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 2
+            self.product.save()
+        response = self.client.get('/api/products/products/', HTTP_IF_NONE_MATCH=first)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first)
+        self.assertEqual(response.data['results'][0]['stock'], 2)
+
+    def test_version_bumped_by_another_process_is_seen_at_once(self):
+        response = self.client.get('/api/products/products/')
+        # Otro proceso confirma un cambio; la última lectura de este proceso sigue vigente
+        CatalogVersion.objects.update(version=F('version') + 1, modified_at=timezone.now() + timedelta(seconds=5))
+        with override_settings(CATALOG_VERSION_CHECK_INTERVAL=3600):
+            stale = self.client.get('/api/products/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(stale.status_code, 200)
+            self.assertNotEqual(stale['ETag'], response['ETag'])
+            stale = self.client.get('/api/products/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(stale.status_code, 200)
+
+    def test_last_modified_falls_back_to_product_updated_at(self):
+        CatalogVersion.objects.update(modified_at=None)
+        self.product.refresh_from_db()
+        self.assertEqual(get_catalog_last_modified(max_age=0), self.product.updated_at)
+        self.assertEqual(CatalogVersion.objects.get().modified_at, self.product.updated_at)
+
+
+class ProductQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Presupuesto de consultas de los endpoints del catálogo, independiente del tamaño de la página"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create(Category(name=f'Categoría {index}') for index in range(5))
+        brands = Brand.objects.bulk_create(Brand(name=f'Marca {index}') for index in range(5))
+        cls.products = Product.objects.bulk_create(
+            Product(name=f'Producto {index}', description='Producto', price=Decimal(index + 1), stock=index,
+                    category=categories[index % 5], brand=brands[index % 3])
+            for index in range(40)
+        )
+        ProductSpecification.objects.bulk_create(
+            ProductSpecification(product=product, key='Color', value='Negro') for product in cls.products
+        )
+
+    def setUp(self):
+        bump_catalog_version()
+
+    def test_catalog_endpoints_stay_within_budget(self):
+        cases = [
+            # Una consulta más en cada caso para la versión del catálogo
+            ('/api/products/products/', {'page_size': 40}, 2),
+            ('/api/products/products/', {'page_size': 40, 'expand': 'specifications'}, 3),
+            (f'/api/products/products/{self.products[0].id}/', {}, 3),
+            ('/api/products/categories/', {}, 2),
+            ('/api/products/brands/', {}, 2),
+        ]
+        for url, params, budget in cases:
+            with self.subTest(url=url, params=params):
+                with self.assertQueryBudget(budget, url):
+                    response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+
+    @override_settings(QUERY_INSTRUMENTATION_HEADERS=True)
+    def test_middleware_reports_queries_in_headers(self):
+        response = self.client.get('/api/products/products/', {'expand': 'specifications'})
+        self.assertEqual(response['X-DB-Query-Count'], '3')
+        self.assertEqual(response['X-DB-Duplicate-Queries'], '0')
+        self.assertTrue(response['X-DB-Query-Time'].endswith('ms'))
+
+    def test_duplicate_query_shapes_are_grouped(self):
+        with track_queries() as stats:
+            for product in Product.objects.order_by('id')[:3]:
+                product.brand.name
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(len(stats.duplicates()), 1)
+        self.assertEqual(stats.duplicates()[0][1], 3)
+
+
+class ProductFacetsTests(QueryBudgetMixin, TestCase):
+    """Facetas del catálogo con un número fijo de consultas y cache por filtros y versión"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = Category.objects.create(name='Teléfonos')
+        cls.tablets = Category.objects.create(name='Tablets')
+        cls.samsung = Brand.objects.create(name='Samsung')
+        cls.apple = Brand.objects.create(name='Apple')
+        rows = [
+            ('Galaxy A14', cls.phones, cls.samsung, '80.00', 0),
+            ('Galaxy S23', cls.phones, cls.samsung, '900.00', 12),
+            ('iPhone 15', cls.phones, cls.apple, '1200.00', 3),
+            ('Galaxy Tab', cls.tablets, cls.samsung, '450.00', 8),
+            ('iPad Pro', cls.tablets, cls.apple, '2500.00', 1),
+        ]
+        cls.products = Product.objects.bulk_create(
+            Product(name=name, description=name, category=category, brand=brand, price=Decimal(price), stock=stock)
+            for name, category, brand, price, stock in rows
+        )
+        rebuild_search_index()
+
+    def setUp(self):
+        bump_catalog_version()
+
+    def facets(self, **params):
+        response = self.client.get('/api/products/products/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_counts_for_whole_catalog(self):
+        facets = self.facets()
+        self.assertEqual(facets['total'], 5)
+        self.assertEqual(
+            [(item['name'], item['count']) for item in facets['categories']], [('Teléfonos', 3), ('Tablets', 2)]
+        )
+        self.assertEqual([(item['name'], item['count']) for item in facets['brands']], [('Samsung', 3), ('Apple', 2)])
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in facets['price_ranges']],
+            [(0, 100, 1), (100, 500, 1), (500, 1000, 1), (1000, 2000, 1), (2000, None, 1)]
+        )
+        self.assertEqual(facets['stock'], {'in_stock': 2, 'low_stock': 2, 'out_of_stock': 1})
+
+    def test_counts_follow_filters(self):
+        facets = self.facets(brand_name='samsung', min_price='100')
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual([(item['name'], item['count']) for item in facets['categories']],
+                         [('Tablets', 1), ('Teléfonos', 1)])
+        self.assertEqual(facets['stock'], {'in_stock': 2, 'low_stock': 0, 'out_of_stock': 0})
+
+        facets = self.facets(search='galaxy', category=self.phones.id)
+        self.assertEqual(facets['total'], 2)
+
+    def test_constant_queries_and_cache(self):
+        # Las facetas más la versión del catálogo, que se lee en cada petición
+        with self.assertQueryBudget(4, 'facetas'):
+            self.facets(category_name='tel')
+        with self.assertQueryBudget(1, 'facetas en cache'):
+            self.facets(category_name='tel', ordering='price')
+
+    def test_catalog_change_invalidates_cached_facets(self):
+        self.assertEqual(self.facets()['stock']['out_of_stock'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].stock = 20
+            self.products[0].save()
+        self.assertEqual(self.facets()['stock']['out_of_stock'], 0)
+
+
+class SpecificationFilterTests(TestCase):
+    """Filtros spec.<clave>__<búsqueda> sobre los valores tipados de las especificaciones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        computers = Category.objects.create(name='Computadoras')
+        lenovo = Brand.objects.create(name='Lenovo')
+        specs = {
+            'ThinkPad X1': {'RAM': '16GB', 'Almacenamiento': '1TB SSD', 'Pantalla': '14 pulgadas', 'Color': 'Negro'},
+            'IdeaPad 3': {'RAM': '8 GB', 'Almacenamiento': '512GB', 'Pantalla': '15.6"', 'Color': 'Gris'},
+            'Legion 5': {'RAM': '32GB', 'Almacenamiento': '1 TB', 'Pantalla': '15,6 pulgadas', 'Color': 'Negro mate'},
+            'Chromebook': {'RAM': '4096MB', 'Almacenamiento': '64GB eMMC', 'Color': 'Azul'},
+        }
+        cls.products = {}
+        for name, values in specs.items():
+            product = Product.objects.create(
+                name=name, description=name, price=Decimal('500.00'), stock=5, category=computers, brand=lenovo
+            )
+            for key, value in values.items():
+                ProductSpecification.objects.create(product=product, key=key, value=value)
+            cls.products[name] = product
+        rebuild_search_index()
+
+    def names(self, **params):
+        response = self.client.get('/api/products/products/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(product['name'] for product in response.data['results'])
+
+    def test_parse_spec_value(self):
+        self.assertEqual(parse_spec_value('16GB DDR4'), (16.0, 'gb'))
+        self.assertEqual(parse_spec_value('1TB SSD'), (1024.0, 'gb'))
+        self.assertEqual(parse_spec_value('15,6 pulgadas'), (15.6, 'in'))
+        self.assertEqual(parse_spec_value('500 g'), (0.5, 'kg'))
+        self.assertEqual(parse_spec_value('4000 mAh'), (4000.0, 'mah'))
+        self.assertEqual(parse_spec_value('Intel Core i7'), (None, ''))
+
+    def test_save_populates_typed_values(self):
+        specification = self.products['Chromebook'].specifications.get(key='RAM')
+        self.assertEqual((specification.normalized_key, specification.numeric_value, specification.unit),
+                         ('ram', 4.0, 'gb'))
+        specification.value = '8GB'
+        specification.save(update_fields=['value'])
+        specification.refresh_from_db()
+        self.assertEqual(specification.numeric_value, 8.0)
+
+    def test_numeric_ranges_convert_units(self):
+        self.assertEqual(self.names(**{'spec.RAM__gte': '16'}), ['Legion 5', 'ThinkPad X1'])
+        self.assertEqual(self.names(**{'spec.ram__lte': '8GB'}), ['Chromebook', 'IdeaPad 3'])
+        self.assertEqual(self.names(**{'spec.Almacenamiento__gte': '1TB'}), ['Legion 5', 'ThinkPad X1'])
+        self.assertEqual(self.names(**{'spec.Pantalla': '15.6'}), ['IdeaPad 3', 'Legion 5'])
+
+    def test_multiple_specs_and_text_lookups(self):
+        params = {'spec.RAM__gte': '16', 'spec.Color__contains': 'negro', 'spec.Pantalla__lt': '15'}
+        self.assertEqual(self.names(**params), ['ThinkPad X1'])
+        self.assertEqual(self.names(**{'spec.Color': 'azul'}), ['Chromebook'])
+        self.assertEqual(self.names(**{'spec.RAM__gte': '16', 'search': 'legion'}), ['Legion 5'])
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({'spec.RAM__regex': '.*'}, {'spec.RAM__gte': 'mucha'}, {'spec.__gte': '1'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get('/api/products/products/', params).status_code, 400)
+
+    def test_facets_follow_spec_filters(self):
+        response = self.client.get('/api/products/products/facets/', {'spec.RAM__gte': '16'})
+        self.assertEqual(response.data['total'], 2)
+
+    def test_backfill_command(self):
+        ProductSpecification.objects.update(normalized_key='', numeric_value=None, unit='')
+        call_command('backfill_spec_values', batch_size=3, stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.names(**{'spec.Almacenamiento__gte': '1TB'}), ['Legion 5', 'ThinkPad X1'])
+
+
+class GenerateCatalogTests(TestCase):
+    """Catálogo sintético: determinista por semilla, con valores tipados, imágenes locales e índice de búsqueda"""
+
+    def generate(self, **options):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('generate_catalog', clear=True, stdout=open(os.devnull, 'w'), **options)
+            self.assertTrue(os.path.exists(os.path.join(media_root, Product.objects.first().image.name)))
+        return list(
+            Product.objects.order_by('id').values_list('name', 'price', 'stock', 'category__name', 'brand__name')
+        )
+
+    def test_same_seed_same_catalog(self):
+        first = self.generate(products=300, seed=7, batch_size=64)
+        self.assertEqual(len(first), 300)
+        self.assertEqual(self.generate(products=300, seed=7, batch_size=64), first)
+        self.assertNotEqual(self.generate(products=300, seed=8), first)
+
+    def test_specs_conversations_and_search_index(self):
+        from chatbot.models import Conversation, Message
+
+        self.generate(products=500, conversations=20, turns=3)
+        self.assertEqual(Conversation.objects.count(), 20)
+        self.assertGreaterEqual(Message.objects.count(), 40)
+        self.assertFalse(ProductSpecification.objects.filter(normalized_key='').exists())
+        self.assertTrue(ProductSpecification.objects.filter(normalized_key='ram', unit='gb').exists())
+
+        # Las marcas más populares concentran más productos
+        counts = dict(Product.objects.filter(category__name='Computadoras')
+                      .values_list('brand__name').annotate(count=Count('id')))
+        self.assertGreater(counts['Lenovo'], counts.get('Razer', 0))
+
+        if get_search_backend() is not None:
+            response = self.client.get('/api/products/products/', {'search': 'laptop', 'spec.RAM__gte': '16'})
+            self.assertTrue(response.data['results'])
+
+
+def jpeg_bytes(size=(640, 480), color=(0, 120, 200)):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class ImageRenditionTests(TestCase):
+    """Versiones redimensionadas de las imágenes: al guardar, por comando y en la representación"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Tablets')
+        self.brand = Brand.objects.create(name='Apple')
+
+    def create_product(self, **kwargs):
+        return Product.objects.create(name='iPad Air', description='Tableta', price=Decimal('600.00'), stock=3,
+                                      category=self.category, brand=self.brand, **kwargs)
+
+    def test_renditions_are_generated_on_save(self):
+        from PIL import Image
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.create_product(image=SimpleUploadedFile('ipad.jpg', jpeg_bytes()))
+        for rendition, size in RENDITIONS.items():
+            for image_format, pillow_format in (('jpeg', 'JPEG'), ('webp', 'WEBP')):
+                with default_storage.open(rendition_name(product.image.name, rendition, image_format)) as file:
+                    image = Image.open(file)
+                    self.assertEqual((image.format, image.size), (pillow_format, size))
+
+    def test_missing_image_does_not_break_save(self):
+        with self.assertLogs('products.signals', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            self.create_product(image='products/no-existe.jpg')
+
+    def test_serializers_expose_rendition_urls(self):
+        product = self.create_product(image='products/ipad.jpg')
+        bump_catalog_version()
+        detail = self.client.get(f'/api/products/products/{product.id}/').data
+        self.assertEqual(detail['image'], 'http://testserver/media/products/ipad.jpg')
+        self.assertEqual(detail['renditions']['card'], {
+            'jpeg': 'http://testserver/media/renditions/products/ipad/card.jpg',
+            'webp': 'http://testserver/media/renditions/products/ipad/card.webp',
+            'width': 300, 'height': 200,
+        })
+        self.assertEqual(detail['srcset']['webp'].split(', ')[0],
+                         'http://testserver/media/renditions/products/ipad/thumbnail.webp 150w')
+
+        item = self.client.get('/api/products/products/').data['results'][0]
+        self.assertNotIn('srcset', item)
+        item = self.client.get('/api/products/products/', {'expand': 'renditions,srcset'}).data['results'][0]
+        self.assertEqual(set(item['renditions']), set(RENDITIONS))
+        self.assertEqual(item['srcset'], detail['srcset'])
+
+    def test_thumbnail_falls_back_to_original(self):
+        default_storage.save('products/ipad.jpg', ContentFile(jpeg_bytes()))
+        self.create_product(image='products/ipad.jpg')
+        bump_catalog_version()
+        item = self.client.get('/api/products/products/').data['results'][0]
+        self.assertEqual(item['thumbnail'], 'http://testserver/media/products/ipad.jpg')
+
+        with open(os.devnull, 'w') as devnull:
+            call_command('generate_image_renditions', workers=1, stdout=devnull)
+        bump_catalog_version()
+        item = self.client.get('/api/products/products/').data['results'][0]
+        self.assertEqual(item['thumbnail'], 'http://testserver/media/renditions/products/ipad/thumbnail.jpg')
+
+    def test_backfill_command(self):
+        default_storage.save('products/a.jpg', ContentFile(jpeg_bytes()))
+        default_storage.save('products/synthetic/b.jpg', ContentFile(jpeg_bytes((300, 300))))
+        default_storage.save('products/roto.jpg', ContentFile(b'no es una imagen'))
+        with open(os.devnull, 'w') as devnull:
+            call_command('generate_image_renditions', workers=2, stdout=devnull)
+        self.assertTrue(has_renditions('products/a.jpg', default_storage))
+        self.assertTrue(has_renditions('products/synthetic/b.jpg', default_storage))
+        self.assertFalse(has_renditions('products/roto.jpg', default_storage))
@@ -1,37 +1,108 @@
 # products/views.py
+import hashlib
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from .catalog import fill_catalog_last_modified, get_catalog_state
+from .facets import get_facets
+from .filters import ProductSearchFilter, SpecificationFilter
 from .models import Category, Brand, Product
-from .serializers import CategorySerializer, BrandSerializer, ProductSerializer
+from .pagination import KeysetPagination
+from .serializers import (CategorySerializer, BrandSerializer, ProductSerializer, ProductListSerializer,
+                          query_param_list)
+
+
+class CatalogConditionalGetMixin:
+    """
+    GET condicional (ETag / Last-Modified) para los endpoints del catálogo.
+
+    Los validadores se derivan de la versión del catálogo y de la fecha de su
+    último cambio, sin ejecutar la consulta ni serializar la respuesta. Si el
+    cliente ya tiene la versión vigente recibe un 304. Ambos se leen de la fila
+    compartida en cada petición y no de la última lectura del proceso: un
+    worker que aún no vio un cambio respondería 304 con datos viejos.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, view, request, *args, **kwargs):
+        # Una sola lectura para que ambos validadores correspondan al mismo catálogo
+        version, last_modified = get_catalog_state(max_age=0)
+        self.catalog_version = version
+        response = condition(
+            etag_func=lambda request, *args, **kwargs: self.catalog_etag(request, version),
+            last_modified_func=lambda request, *args, **kwargs: fill_catalog_last_modified(version, last_modified),
+        )(view)(request, *args, **kwargs)
+        # Sin max-age, para que los clientes revaliden en cada petición en lugar de usar heurísticas
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
 
+    @staticmethod
+    def catalog_etag(request, version):
+        """ETag débil: la misma versión y la misma petición producen el mismo contenido"""
+        key = '\n'.join([
+            str(version),
+            request.path,
+            request.META.get('QUERY_STRING', ''),
+            request.META.get('HTTP_ACCEPT', ''),
+        ])
+        return 'W/"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+
+class CategoryViewSet(CatalogConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    pagination_class = KeysetPagination
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name']
 
 
-class BrandViewSet(viewsets.ReadOnlyModelViewSet):
+class BrandViewSet(CatalogConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
+    pagination_class = KeysetPagination
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name']
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.all().prefetch_related('specifications')
+class ProductViewSet(CatalogConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Product.objects.all().select_related('category', 'brand')
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    list_serializer_class = ProductListSerializer
+    pagination_class = KeysetPagination
+    # La búsqueda usa el índice de texto completo y ordena por relevancia;
+    # search_fields sólo se usa en motores sin índice
+    filter_backends = [DjangoFilterBackend, SpecificationFilter, ProductSearchFilter, OrderingFilter]
     filterset_fields = ['category', 'brand', 'stock']
     search_fields = ['name', 'description', 'brand__name', 'category__name']
     ordering_fields = ['name', 'price', 'stock', 'created_at']
 
+    def get_serializer_class(self):
+        # Los listados usan la representación compacta; el detalle, la completa
+        if self.action == 'list':
+            return self.list_serializer_class
+        return self.serializer_class
+
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action == 'list':
+            # La descripción no forma parte del listado
+            queryset = queryset.defer('description')
+        if self.action == 'retrieve' or 'specifications' in query_param_list(self.request, 'expand'):
+            queryset = queryset.prefetch_related('specifications')
+
         category = self.request.query_params.get('category_name', None)
         brand = self.request.query_params.get('brand_name', None)
         min_price = self.request.query_params.get('min_price', None)
@@ -48,6 +119,18 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
 
         return queryset
 
+    @action(detail=False)
+    def facets(self, request):
+        """
+        Conteos por categoría, marca, rango de precio y estado de stock de los
+        productos que cumplen los filtros de la petición
+        """
+        return self.conditional_response(self.facets_response, request)
+
+    def facets_response(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(get_facets(queryset, request.query_params, self.catalog_version))
+
     def get_serializer_context(self):
         """
         Proporcionar el objeto request al serializer para poder